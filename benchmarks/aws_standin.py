@@ -0,0 +1,100 @@
+"""Stand-in S3/DynamoDB en processus (moto) partagé par les benchmarks.
+
+Les tables et buckets sont créés avec le même schéma que main_serverless.py, puis le
+webservice et la Lambda sont importés tels quels : leurs clients boto3 parlent au mock.
+"""
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BUCKET = "benchmark-bucket"
+TABLE = "MyDynamoDB"
+
+
+def start_aws_standin():
+    """Démarre le mock AWS et crée le bucket et la table des fichiers. Renvoie le mock (à arrêter avec .stop())."""
+    os.environ.update({
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_REGION": "us-east-1",
+        "BUCKET": BUCKET,
+        "DYNAMO_TABLE": TABLE,
+    })
+    from moto import mock_aws
+    import boto3
+
+    mock = mock_aws()
+    mock.start()
+    boto3.client("s3").create_bucket(Bucket=BUCKET)
+    boto3.client("dynamodb").create_table(
+        TableName=TABLE,
+        KeySchema=[{"AttributeName": "user", "KeyType": "HASH"}, {"AttributeName": "id", "KeyType": "RANGE"}],
+        AttributeDefinitions=[
+            {"AttributeName": "user", "AttributeType": "S"},
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "upload_timestamp", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "user-upload_timestamp-index",
+            "KeySchema": [{"AttributeName": "user", "KeyType": "HASH"}, {"AttributeName": "upload_timestamp", "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return mock
+
+
+def import_webservice():
+    """Importe webservice/app.py (après start_aws_standin)."""
+    sys.path.insert(0, str(REPO_ROOT / "webservice"))
+    import app
+    return app
+
+
+def import_lambda():
+    """Importe terraform/lambda/lambda_function.py (après start_aws_standin)."""
+    sys.path.insert(0, str(REPO_ROOT / "terraform" / "lambda"))
+    import lambda_function
+    return lambda_function
+
+
+def put_file(user, file_id, filename, content, file_type="text/csv", **attributes):
+    """Dépose un fichier sur S3 et son item DynamoDB, comme après confirm-upload. Renvoie la clé S3."""
+    import boto3
+
+    key = f"user_uploads/{user}/{file_id}/{filename}"
+    etag = boto3.client("s3").put_object(Bucket=BUCKET, Key=key, Body=content)["ETag"].strip('"')
+    item = {
+        "user": user,
+        "id": file_id,
+        "original_filename": filename,
+        "s3_object_key": key,
+        "file_type": file_type,
+        "upload_timestamp": "2025-01-01T00:00:00",
+        "file_size": len(content),
+        "status": "uploaded",
+        "processingStatus": "pending_lambda",
+        "s3ETag": etag,
+    }
+    item.update(attributes)
+    boto3.resource("dynamodb").Table(TABLE).put_item(Item=item)
+    return key
+
+
+def s3_event(key, etag=None):
+    """Événement S3 ObjectCreated tel que reçu par la Lambda."""
+    obj = {"key": key}
+    if etag:
+        obj["eTag"] = etag
+    return {"Records": [{"s3": {"bucket": {"name": BUCKET}, "object": obj}}]}
+
+
+def percentile(values, q):
+    """Percentile par rang le plus proche (q entre 0 et 100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
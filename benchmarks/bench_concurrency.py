@@ -0,0 +1,93 @@
+"""Vérifie qu'un téléchargement S3 lent ne bloque plus la boucle d'événements du webservice.
+
+Mesure la latence de GET /files pendant qu'une requête de statistiques attend un
+get_object artificiellement ralenti, et la compare à une mesure sans téléchargement en cours.
+
+    python benchmarks/bench_concurrency.py [--requests 50] [--slow-seconds 2.0]
+
+Le même contrôle tourne sous pytest (test_concurrency.py) avec le stand-in moto.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from aws_standin import import_webservice, percentile, put_file, start_aws_standin
+
+
+async def measure_listing(client, n_requests):
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        response = await client.get("/files", headers={"Authorization": "bench"})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+async def run(n_requests, slow_seconds):
+    import httpx
+
+    app = import_webservice()
+    slow_key = put_file("bench", "slow-file", "slow.csv", b"a,b\n1,2\n3,4\n")
+    for i in range(20):
+        put_file("bench", f"file-{i}", f"f{i}.csv", b"a,b\n1,2\n")
+
+    # Simule un gros téléchargement : get_object bloque le thread appelant
+    original_get_object = app.s3_client.get_object
+
+    def slow_get_object(**kwargs):
+        if kwargs.get("Key") == slow_key:
+            time.sleep(slow_seconds)
+        return original_get_object(**kwargs)
+
+    app.s3_client.get_object = slow_get_object
+    try:
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            baseline = await measure_listing(client, n_requests)
+
+            slow_request = asyncio.create_task(
+                client.get("/files/slow-file/statistics/a", headers={"Authorization": "bench"})
+            )
+            await asyncio.sleep(0.05)  # Laisser la requête lente atteindre get_object
+            contended = await measure_listing(client, n_requests)
+            slow_response = await slow_request
+            assert slow_response.status_code == 200, slow_response.text
+    finally:
+        app.s3_client.get_object = original_get_object
+
+    return baseline, contended
+
+
+def listing_blocked(contended, slow_seconds):
+    """Vrai si la latence de /files suit le téléchargement lent (boucle d'événements bloquée)."""
+    # Si la boucle était bloquée, au moins une requête attendrait toute la durée du téléchargement
+    return percentile(contended, 99) >= slow_seconds / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--slow-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    mock = start_aws_standin()
+    try:
+        baseline, contended = asyncio.run(run(args.requests, args.slow_seconds))
+    finally:
+        mock.stop()
+
+    print(f"/files p50 baseline:   {percentile(baseline, 50) * 1000:.1f} ms")
+    print(f"/files p99 baseline:   {percentile(baseline, 99) * 1000:.1f} ms")
+    print(f"/files p50 during slow download: {percentile(contended, 50) * 1000:.1f} ms")
+    print(f"/files p99 during slow download: {percentile(contended, 99) * 1000:.1f} ms")
+
+    if listing_blocked(contended, args.slow_seconds):
+        print("FAIL: listing latency tracks the slow download, the event loop is blocked.")
+        sys.exit(1)
+    print("OK: slow download does not block /files.")
+
+
+if __name__ == "__main__":
+    main()
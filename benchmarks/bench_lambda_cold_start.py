@@ -0,0 +1,157 @@
+"""Mesure le démarrage à froid de la Lambda d'ingestion pour un événement CSV et un événement XLSX.
+
+Chaque mesure tourne dans un interpréteur neuf (comme un nouveau conteneur Lambda) :
+durée d'import de boto3, durée d'import/initialisation de lambda_function, latence de la
+première invocation puis d'une invocation à chaud. Les modules lourds chargés après
+l'import et après l'invocation sont relevés ; --check échoue si openpyxl est chargé à
+l'import ou par un événement CSV.
+
+    python benchmarks/bench_lambda_cold_start.py [--runs 5] [--rows 20000] [--json results.json] [--check]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ("openpyxl", "pyarrow", "pandas", "numpy")
+SCENARIOS = ("csv", "xlsx")
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def run_child(scenario, data_path):
+    """Une mesure à froid, dans le processus courant (lancé par main)."""
+    start = time.perf_counter()
+    import boto3 # noqa: F401 (chargé par le runtime Lambda dans tous les cas)
+    boto3_import_s = time.perf_counter() - start
+
+    from aws_standin import import_lambda, put_file, s3_event, start_aws_standin
+
+    mock = start_aws_standin()
+    try:
+        with open(data_path, "rb") as f:
+            content = f.read()
+        if scenario == "csv":
+            key = put_file("bench", "cold-csv", "data.csv", content)
+        else:
+            key = put_file("bench", "cold-xlsx", "data.xlsx", content,
+                           file_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        modules_before = set(loaded_heavy_modules())
+
+        start = time.perf_counter()
+        lambda_function = import_lambda()
+        import_s = time.perf_counter() - start
+        modules_after_import = [m for m in loaded_heavy_modules() if m not in modules_before]
+
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(s3_event(key), None)
+        first_invoke_s = time.perf_counter() - start
+        modules_after_invoke = [m for m in loaded_heavy_modules() if m not in modules_before]
+
+        start = time.perf_counter()
+        lambda_function.lambda_handler(s3_event(key), None)
+        warm_invoke_s = time.perf_counter() - start
+    finally:
+        mock.stop()
+
+    print(json.dumps({
+        "scenario": scenario,
+        "boto3_import_s": boto3_import_s,
+        "import_s": import_s,
+        "first_invoke_s": first_invoke_s,
+        "warm_invoke_s": warm_invoke_s,
+        "modules_after_import": modules_after_import,
+        "modules_after_invoke": modules_after_invoke,
+        "failed_records": len(response.get("batchItemFailures", [])),
+    }))
+
+
+def write_datasets(directory, rows):
+    """CSV et XLSX de même contenu ; générés ici pour ne pas charger openpyxl dans les mesures."""
+    import random
+
+    import openpyxl
+
+    rng = random.Random(0)
+    values = [(i, round(rng.gauss(50, 15), 3), rng.choice(["paris", "lyon", "rennes"])) for i in range(rows)]
+    csv_path = os.path.join(directory, "data.csv")
+    with open(csv_path, "w") as f:
+        f.write("id,score,ville\n")
+        f.writelines(f"{i},{score},{ville}\n" for i, score, ville in values)
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["id", "score", "ville"])
+    for row in values:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    xlsx_path = os.path.join(directory, "data.xlsx")
+    with open(xlsx_path, "wb") as f:
+        f.write(buffer.getvalue())
+    return {"csv": csv_path, "xlsx": xlsx_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="interpréteurs neufs par scénario")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--json", help="fichier où écrire les mesures brutes et les médianes")
+    parser.add_argument("--check", action="store_true", help="échoue si openpyxl est chargé hors des événements XLSX")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.data)
+        return
+
+    results = {scenario: [] for scenario in SCENARIOS}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_datasets(directory, args.rows)
+        for _ in range(args.runs):
+            for scenario in SCENARIOS:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", scenario, "--data", paths[scenario]],
+                    check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                ).stdout
+                results[scenario].append(json.loads(output.strip().splitlines()[-1]))
+
+    summary = {}
+    print(f"{'scenario':<9}{'boto3 import':>14}{'module init':>13}{'1st invoke':>12}{'warm invoke':>13}  heavy modules (import / invoke)")
+    for scenario, runs in results.items():
+        medians = {field: statistics.median(run[field] for run in runs)
+                   for field in ("boto3_import_s", "import_s", "first_invoke_s", "warm_invoke_s")}
+        summary[scenario] = medians
+        print(f"{scenario:<9}{medians['boto3_import_s'] * 1000:>12.0f}ms{medians['import_s'] * 1000:>11.0f}ms"
+              f"{medians['first_invoke_s'] * 1000:>10.0f}ms{medians['warm_invoke_s'] * 1000:>11.0f}ms  "
+              f"{','.join(runs[-1]['modules_after_import']) or '-'} / {','.join(runs[-1]['modules_after_invoke']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "rows": args.rows, "median": summary, "raw": results}, f, indent=2)
+
+    failures = []
+    if any(run["failed_records"] for runs in results.values() for run in runs):
+        failures.append("some invocations reported failed records")
+    if args.check:
+        if any("openpyxl" in run["modules_after_import"] for runs in results.values() for run in runs):
+            failures.append("openpyxl is imported at module load")
+        if any("openpyxl" in run["modules_after_invoke"] for run in results["csv"]):
+            failures.append("openpyxl is imported by a CSV event")
+    for failure in failures:
+        print(f"FAIL: {failure}.")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
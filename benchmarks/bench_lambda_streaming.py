@@ -0,0 +1,95 @@
+"""Vérifie que extract_csv_metadata traite un gros CSV en mémoire constante.
+
+Un CSV synthétique (1 Go par défaut) est généré à la volée, sans disque ni buffer complet,
+puis passé à extract_csv_metadata sous tracemalloc. Le pic d'allocation doit rester sous
+--max-peak-mb, indépendamment de la taille du fichier. tracemalloc ralentit fortement
+l'exécution : prévoir plusieurs dizaines de minutes pour 1 Go, --size-mb pour un essai rapide.
+
+    python benchmarks/bench_lambda_streaming.py [--size-mb 1024] [--max-peak-mb 64]
+
+Le même contrôle tourne sous pytest (test_lambda_streaming.py) sur quelques dizaines de Mo ;
+l'essai complet sur 1 Go y est marqué slow.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from aws_standin import import_lambda
+
+
+class SyntheticCsvStream:
+    """Flux binaire (interface read(n) du StreamingBody) d'un CSV de taille donnée."""
+
+    def __init__(self, size_bytes, n_columns=8):
+        import random
+
+        rng = random.Random(0)
+        header = ";".join(f"col_{i}" for i in range(n_columns)) + "\n"
+        rows = []
+        for _ in range(2000):
+            values = [f"{rng.gauss(50, 15):.3f}" if i % 2 == 0 else rng.choice(["paris", "lyon", "rennes", "lille", ""])
+                      for i in range(n_columns)]
+            rows.append(";".join(values) + "\n")
+        self._header = header.encode("utf-8-sig")
+        self._block = "".join(rows).encode("utf-8")
+        self._rows_per_block = len(rows)
+        self.size_bytes = size_bytes
+        self.n_rows = 0
+        self._position = 0
+        self._emitted_header = False
+
+    def read(self, n=-1):
+        if not self._emitted_header:
+            self._emitted_header = True
+            return self._header
+        if self._position >= self.size_bytes:
+            return b""
+        # Des blocs entiers de lignes, pour que le nombre de lignes attendu soit connu
+        self._position += len(self._block)
+        self.n_rows += self._rows_per_block
+        return self._block
+
+
+def measure_streaming(size_mb):
+    """Passe un CSV synthétique de size_mb Mo à extract_csv_metadata sous tracemalloc.
+
+    Renvoie (flux, nombre de lignes lues, délimiteur détecté, durée en s, pic en Mo).
+    """
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    lambda_function = import_lambda()
+
+    stream = SyntheticCsvStream(size_mb * 1024 * 1024)
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        headers, num_rows, num_cols, dialect, profile = lambda_function.extract_csv_metadata(stream)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return stream, num_rows, dialect["delimiter"], elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--max-peak-mb", type=float, default=64.0)
+    args = parser.parse_args()
+
+    stream, num_rows, delimiter, elapsed, peak_mb = measure_streaming(args.size_mb)
+    print(f"processed {stream._position / (1024 * 1024):.0f} MB, {num_rows} rows (delimiter '{delimiter}') in {elapsed:.1f} s")
+    print(f"tracemalloc peak: {peak_mb:.1f} MB (cap {args.max_peak_mb:.0f} MB)")
+
+    if num_rows != stream.n_rows:
+        print(f"FAIL: expected {stream.n_rows} rows, got {num_rows}")
+        sys.exit(1)
+    if peak_mb > args.max_peak_mb:
+        print("FAIL: peak memory exceeds the cap, extraction is not streaming.")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare le téléchargement S3 en un seul flux et par plages parallèles.
+
+Le stand-in S3 étant local, le débit de chaque connexion est plafonné artificiellement
+(--stream-mbps) pour reproduire la limite par flux observée face à S3. Le contenu
+téléchargé est vérifié octet par octet dans les deux modes.
+
+    python benchmarks/bench_ranged_download.py [--size-mb 64] [--stream-mbps 50] [--min-speedup 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+from aws_standin import BUCKET, REPO_ROOT, start_aws_standin
+
+
+class ThrottledBody:
+    """Flux de réponse dont le débit est plafonné à bytes_per_second."""
+
+    def __init__(self, body, bytes_per_second):
+        self._body = body
+        self._bytes_per_second = bytes_per_second
+
+    def read(self, amt=None):
+        data = self._body.read(amt)
+        time.sleep(len(data) / self._bytes_per_second)
+        return data
+
+    def close(self):
+        self._body.close()
+
+
+def throttle(s3_client, bytes_per_second):
+    original_get_object = s3_client.get_object
+
+    def throttled_get_object(**kwargs):
+        response = original_get_object(**kwargs)
+        response["Body"] = ThrottledBody(response["Body"], bytes_per_second)
+        return response
+
+    s3_client.get_object = throttled_get_object
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--stream-mbps", type=float, default=50.0, help="débit plafond d'une connexion, en Mo/s")
+    parser.add_argument("--min-speedup", type=float, default=2.0)
+    args = parser.parse_args()
+
+    mock = start_aws_standin()
+    try:
+        import boto3
+        from botocore.config import Config
+
+        sys.path.insert(0, str(REPO_ROOT / "terraform" / "lambda"))
+        import ranged_download
+
+        s3_client = boto3.client("s3", config=Config(max_pool_connections=ranged_download.RANGED_DOWNLOAD_WORKERS + 1))
+        payload = os.urandom(args.size_mb * 1024 * 1024)
+        s3_client.put_object(Bucket=BUCKET, Key="large.bin", Body=payload)
+        throttle(s3_client, args.stream_mbps * 1024 * 1024)
+
+        single, single_seconds = timed(lambda: s3_client.get_object(Bucket=BUCKET, Key="large.bin")["Body"].read())
+        ranged, ranged_seconds = timed(lambda: ranged_download.download_to_buffer(s3_client, BUCKET, "large.bin"))
+    finally:
+        mock.stop()
+
+    assert single == payload, "single-stream download is corrupted"
+    assert ranged == payload, "ranged download is corrupted"
+
+    speedup = single_seconds / ranged_seconds
+    print(f"object size: {args.size_mb} MB, per-stream cap: {args.stream_mbps:.0f} MB/s")
+    print(f"single stream: {single_seconds:.2f} s ({args.size_mb / single_seconds:.0f} MB/s)")
+    print(f"ranged ({ranged_download.RANGED_DOWNLOAD_WORKERS} workers, {ranged_download.RANGED_DOWNLOAD_PART_SIZE // (1024 * 1024)} MB parts): "
+          f"{ranged_seconds:.2f} s ({args.size_mb / ranged_seconds:.0f} MB/s)")
+    print(f"speedup: x{speedup:.1f}")
+    if speedup < args.min_speedup:
+        print(f"FAIL: ranged download is less than x{args.min_speedup} faster than a single stream.")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Suite de benchmarks du webservice et de la Lambda sur des jeux de données synthétiques.
+
+Des CSV et XLSX reproductibles (graine fixe) sont générés en faisant varier le nombre de
+lignes et de colonnes, le séparateur, l'encodage et la cardinalité des colonnes texte. Pour
+chacun, sur le stand-in S3/DynamoDB en processus, on mesure :
+
+    load_raw         get_dataframe_from_s3 à froid, fichier brut (avant la Lambda)
+    lambda_handler   ingestion (dialecte, métadonnées, profil, copie colonnaire)
+    load_columnar    get_dataframe_from_s3 à froid, depuis la copie colonnaire
+    statistics       GET /files/{id}/statistics/{col}?mode=exact (données en cache)
+    statistics_auto  GET /files/{id}/statistics/{col} (réponse depuis le profil)
+    boxplot          GET /files/{id}/graph-data/boxplot/{col}?mode=exact
+    list_files       GET /files (scénario dédié, --list-files items)
+
+Pour chaque mesure : percentiles de latence, débit, pic de RSS (VmHWM, remis à zéro avant
+chaque mesure), pic d'allocation tracemalloc et blocs alloués restants. Les résultats sont
+écrits en JSON, puis comparés à la référence --baseline (par défaut benchmarks/baseline.json,
+versionnée) : la commande échoue si une latence (la meilleure des itérations) ou un pic
+mémoire dépasse la référence de plus de --threshold.
+
+Les latences ne sont pas comparées en absolu : chaque exécution chronomètre aussi une charge
+de référence fixe (reference_workload, parsing et statistiques pandas), et une latence de la
+référence est d'abord mise à l'échelle du rapport entre les deux chronométrages. La
+comparaison est refusée (code de sortie 2) si l'empreinte de la machine (architecture,
+nombre de CPU, versions de Python, pandas, numpy et pyarrow) diffère de celle de la
+référence ; --any-machine force une comparaison indicative, sur les latences normalisées.
+
+    python benchmarks/bench_suite.py [--rows 1000,10000,100000] [--iterations 5] [--json results.json]
+                                     [--baseline benchmarks/baseline.json] [--threshold 0.25] [--update-baseline]
+
+La référence dépend de la machine (voir sa section "meta"). Pour la régénérer, après un
+changement de performance voulu ou de machine de mesure, lancer la suite complète avec les
+options par défaut et committer le fichier :
+
+    python benchmarks/bench_suite.py --update-baseline
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from aws_standin import import_lambda, import_webservice, percentile, put_file, s3_event, start_aws_standin
+
+USER = "bench"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+XLSX_MAX_ROWS = 20000 # openpyxl écrit ~10k lignes/s : au-delà la génération domine
+DELIMITER_NAMES = {",": "comma", ";": "semicolon", "\t": "tab"}
+LOW_CARDINALITY = ["Paris", "Lyon", "Rennes-Métropole", "Orléans", "Saint-Étienne"]
+# Métriques comparées à la référence, et écart absolu ignoré pour chacune (bruit de mesure).
+# La latence minimale est la moins sensible à la charge de la machine.
+REGRESSION_METRICS = {"latency_min_ms": 5.0, "rss_growth_mb": 8.0, "alloc_peak_mb": 2.0}
+# Métriques exprimées en temps, normalisées par la charge de référence avant comparaison
+TIME_METRICS = {"latency_min_ms"}
+REFERENCE_ROWS = 100000
+REFERENCE_REPEATS = 5
+
+
+def scenario_name(scenario):
+    parts = [scenario["format"], f"{scenario['rows']}r", f"{scenario['columns']}c"]
+    if scenario["format"] == "csv":
+        parts += [DELIMITER_NAMES[scenario["delimiter"]], scenario["encoding"]]
+    return "-".join(parts + [scenario["cardinality"]])
+
+
+def default_scenarios(rows_list):
+    """Croissance du nombre de lignes, puis une variante par dimension autour de la taille médiane."""
+    base = {"format": "csv", "columns": 8, "delimiter": ",", "encoding": "utf-8", "cardinality": "low"}
+    scenarios = [dict(base, rows=rows) for rows in rows_list]
+    mid = sorted(rows_list)[len(rows_list) // 2]
+    scenarios += [
+        dict(base, rows=mid, delimiter=";", encoding="latin-1"),
+        dict(base, rows=mid, delimiter="\t"),
+        dict(base, rows=mid, cardinality="high"),
+        dict(base, rows=mid, columns=40),
+        dict(base, rows=min(mid, XLSX_MAX_ROWS), format="xlsx"),
+    ]
+    return scenarios
+
+
+def generate_columns(scenario, seed=0):
+    """Colonnes synthétiques : flottants, entiers, texte (faible ou forte cardinalité), ~2 % de manquants."""
+    rng = np.random.default_rng(seed)
+    rows = scenario["rows"]
+    columns = {}
+    for i in range(scenario["columns"]):
+        kind = i % 3
+        if kind == 0:
+            values = np.round(rng.normal(50, 15, rows), 3).astype(object)
+        elif kind == 1:
+            values = rng.integers(0, 1000, rows).astype(object)
+        elif scenario["cardinality"] == "low":
+            values = np.array(LOW_CARDINALITY, dtype=object)[rng.integers(0, len(LOW_CARDINALITY), rows)]
+        else:
+            values = np.array([f"client-{v}" for v in rng.integers(0, rows * 10, rows)], dtype=object)
+        values[rng.random(rows) < 0.02] = None
+        columns[f"{('mesure', 'compte', 'libelle')[kind]}_{i}"] = values
+    return columns
+
+
+def render_dataset(scenario, columns):
+    """Contenu du fichier et son type MIME."""
+    names = list(columns)
+    rows = zip(*columns.values())
+    if scenario["format"] == "xlsx":
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(names)
+        for row in rows:
+            sheet.append(list(row))
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    delimiter = scenario["delimiter"]
+    lines = [delimiter.join(names)]
+    lines += [delimiter.join("" if v is None else str(v) for v in row) for row in rows]
+    return ("\n".join(lines) + "\n").encode(scenario["encoding"]), "text/csv"
+
+
+def read_proc_status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def reset_peak_rss():
+    """Remet VmHWM au niveau de la RSS courante (Linux) ; sans effet ailleurs."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def rss_mb():
+    try:
+        return read_proc_status_kb("VmRSS") / 1024
+    except (OSError, TypeError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        return read_proc_status_kb("VmHWM") / 1024
+    except (OSError, TypeError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def measure(operation, iterations, rows=None, size_bytes=None, before_each=None):
+    """Une exécution de chauffe, iterations mesurées, puis une exécution sous tracemalloc."""
+    if before_each:
+        before_each()
+    await operation()
+
+    latencies = []
+    reset_peak_rss()
+    rss_before = rss_mb()
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        await operation()
+        latencies.append(time.perf_counter() - start)
+    peak = peak_rss_mb()
+
+    if before_each:
+        before_each()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        await operation()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    blocks_after = sys.getallocatedblocks()
+
+    p50 = percentile(latencies, 50)
+    result = {
+        "iterations": iterations,
+        "latency_min_ms": min(latencies) * 1000,
+        "latency_p50_ms": p50 * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "latency_mean_ms": statistics.mean(latencies) * 1000,
+        "requests_per_s": len(latencies) / sum(latencies),
+        "peak_rss_mb": peak,
+        "rss_growth_mb": peak - rss_before if rss_before is not None else None,
+        "alloc_peak_mb": alloc_peak / (1024 * 1024),
+        "allocated_blocks": blocks_after - blocks_before,
+    }
+    if rows:
+        result["rows_per_s"] = rows / p50
+    if size_bytes:
+        result["mb_per_s"] = size_bytes / (1024 * 1024) / p50
+    return result
+
+
+def check_status(response):
+    assert response.status_code == 200, f"{response.request.url}: {response.status_code} {response.text[:200]}"
+
+
+async def run_scenario(app, lambda_function, client, scenario, iterations):
+    name = scenario_name(scenario)
+    columns = generate_columns(scenario)
+    content, file_type = render_dataset(scenario, columns)
+    filename = "data.xlsx" if scenario["format"] == "xlsx" else "data.csv"
+    key = put_file(USER, name, filename, content, file_type=file_type)
+    numeric_column = next(iter(columns))
+    headers = {"Authorization": USER}
+    common = {"rows": scenario["rows"], "size_bytes": len(content)}
+
+    def drop_cached_dataset():
+        app.dataframe_cache.invalidate(USER, name)
+        app.metadata_cache.invalidate(USER, name)
+
+    async def load():
+        await app.get_dataframe_from_s3(USER, name)
+
+    async def ingest():
+        response = await asyncio.to_thread(lambda_function.lambda_handler, s3_event(key), None)
+        assert not response.get("batchItemFailures"), response
+
+    def get(path, **params):
+        async def call():
+            check_status(await client.get(path, params=params, headers=headers))
+        return call
+
+    results = {"load_raw": await measure(load, iterations, before_each=drop_cached_dataset, **common)}
+    results["lambda_handler"] = await measure(ingest, iterations, **common)
+    results["load_columnar"] = await measure(load, iterations, before_each=drop_cached_dataset, **common)
+    results["statistics"] = await measure(get(f"/files/{name}/statistics/{numeric_column}", mode="exact"), iterations, **common)
+    results["statistics_auto"] = await measure(get(f"/files/{name}/statistics/{numeric_column}"), iterations, **common)
+    results["boxplot"] = await measure(get(f"/files/{name}/graph-data/boxplot/{numeric_column}", mode="exact"), iterations, **common)
+    drop_cached_dataset()
+    return name, {"scenario": scenario, "size_bytes": len(content), "endpoints": results}
+
+
+async def run_listing(client, n_files, iterations):
+    for i in range(n_files):
+        put_file(USER, f"listed-{i:05d}", f"f{i}.csv", b"a,b\n1,2\n", upload_timestamp=f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}")
+
+    async def list_files():
+        check_status(await client.get("/files", params={"limit": 50}, headers={"Authorization": USER}))
+
+    return {"scenario": {"files": n_files}, "endpoints": {"list_files": await measure(list_files, iterations)}}
+
+
+async def run_suite(scenarios, iterations, list_files):
+    import httpx
+
+    app = import_webservice()
+    lambda_function = import_lambda()
+    results = {}
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in scenarios:
+            name, result = await run_scenario(app, lambda_function, client, scenario, iterations)
+            results[name] = result
+            endpoints = result["endpoints"]
+            print(f"{name:<44}" + "  ".join(f"{endpoint} {metrics['latency_p50_ms']:.1f}ms" for endpoint, metrics in endpoints.items()), flush=True)
+        if list_files:
+            results["listing"] = await run_listing(client, list_files, iterations)
+            print(f"{'listing':<44}list_files {results['listing']['endpoints']['list_files']['latency_p50_ms']:.1f}ms", flush=True)
+    return results
+
+
+def reference_workload():
+    """Charge fixe chronométrée à chaque exécution : écriture et parsing d'un CSV, quantiles et comptages pandas."""
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "value": rng.normal(50, 15, REFERENCE_ROWS),
+        "count": rng.integers(0, 1000, REFERENCE_ROWS),
+        "city": rng.choice(LOW_CARDINALITY, REFERENCE_ROWS),
+    })
+    content = frame.to_csv(index=False).encode("utf-8")
+    parsed = pd.read_csv(io.BytesIO(content))
+    parsed[["value", "count"]].quantile([0.25, 0.5, 0.75])
+    parsed["city"].value_counts()
+
+
+def time_reference_workload():
+    """Meilleure durée (ms) de la charge de référence."""
+    durations = []
+    for _ in range(REFERENCE_REPEATS):
+        start = time.perf_counter()
+        reference_workload()
+        durations.append(time.perf_counter() - start)
+    return min(durations) * 1000
+
+
+def machine_fingerprint():
+    """Ce qui doit être identique pour que des latences absolues soient comparables."""
+    import pandas as pd
+    import pyarrow as pa
+
+    return {
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def compare_with_baseline(results, baseline, threshold, reference_ms):
+    """Régressions (scénario, endpoint, métrique, référence, mesure) au-delà du seuil relatif et de l'écart absolu toléré.
+
+    Les métriques de temps de la référence sont mises à l'échelle de la machine courante
+    (rapport des durées de la charge de référence) avant d'être comparées.
+    """
+    scale = reference_ms / baseline["meta"]["reference_ms"]
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            continue
+        for endpoint, metrics in result["endpoints"].items():
+            reference_metrics = reference["endpoints"].get(endpoint)
+            if reference_metrics is None:
+                continue
+            for metric, slack in REGRESSION_METRICS.items():
+                before, after = reference_metrics.get(metric), metrics.get(metric)
+                if before is None or after is None:
+                    continue
+                if metric in TIME_METRICS:
+                    before *= scale
+                if after > before * (1 + threshold) and after - before > slack:
+                    regressions.append((name, endpoint, metric, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="1000,10000,100000", help="tailles (lignes) de la série principale, séparées par des virgules")
+    parser.add_argument("--iterations", type=int, default=5, help="mesures par endpoint (après une exécution de chauffe)")
+    parser.add_argument("--list-files", type=int, default=200, help="items du scénario de listing (0 pour l'ignorer)")
+    parser.add_argument("--only", help="ne lance que les scénarios dont le nom contient cette chaîne")
+    parser.add_argument("--json", help="fichier où écrire les résultats")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="résultats de référence (JSON) auxquels comparer, '' pour ne pas comparer")
+    parser.add_argument("--threshold", type=float, default=0.25, help="dégradation relative tolérée par rapport à la référence")
+    parser.add_argument("--update-baseline", action="store_true", help="écrit les résultats dans --baseline au lieu de comparer")
+    parser.add_argument("--any-machine", action="store_true", help="compare même si l'empreinte de la machine diffère de la référence")
+    args = parser.parse_args()
+
+    scenarios = default_scenarios([int(r) for r in args.rows.split(",")])
+    if args.only:
+        scenarios = [s for s in scenarios if args.only in scenario_name(s)]
+    # Mesures reproductibles : ni cache disque persistant ni répertoire partagé entre exécutions
+    os.environ["DATASET_DISK_CACHE_MAX_BYTES"] = "0"
+    os.environ.pop("SHARED_STORE_DIR", None)
+    os.environ.setdefault("DATASET_DISK_CACHE_DIR", tempfile.mkdtemp(prefix="statisticaws-bench-"))
+
+    # Charge de référence chronométrée avant et après la suite : la meilleure des deux
+    # absorbe une variation de charge de la machine pendant l'exécution
+    reference_ms = time_reference_workload()
+    mock = start_aws_standin()
+    try:
+        results = asyncio.run(run_suite(scenarios, args.iterations, args.list_files if not args.only else 0))
+    finally:
+        mock.stop()
+    reference_ms = min(reference_ms, time_reference_workload())
+    print(f"{'reference_workload':<44}{reference_ms:.1f}ms")
+
+    output = {
+        "meta": {
+            "fingerprint": machine_fingerprint(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "reference_ms": reference_ms,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Baseline written to {args.baseline}.")
+        return
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, nothing to compare (create it with --update-baseline).")
+        return
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        recorded = baseline["meta"].get("fingerprint")
+        if recorded != output["meta"]["fingerprint"]:
+            print(f"Baseline fingerprint {recorded} does not match this machine {output['meta']['fingerprint']}.")
+            if not args.any_machine or "reference_ms" not in baseline["meta"]:
+                print("Refusing to compare: regenerate the baseline on this machine with --update-baseline.")
+                sys.exit(2)
+            print("Comparing anyway (--any-machine): latencies are normalized by the reference workload, results are indicative.")
+        regressions = compare_with_baseline(results, baseline, args.threshold, reference_ms)
+        for name, endpoint, metric, before, after in regressions:
+            print(f"REGRESSION {name} {endpoint} {metric}: {before:.2f} -> {after:.2f} (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            print(f"FAIL: {len(regressions)} metric(s) regressed beyond {args.threshold:.0%}.")
+            sys.exit(1)
+        print(f"OK: no regression beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Configuration pytest des benchmarks.
+
+Les essais longs sont marqués slow et ne tournent qu'avec --run-slow :
+
+    python -m pytest benchmarks            # contrôles rapides (CI)
+    python -m pytest benchmarks --run-slow # y compris les essais complets
+"""
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", default=False, help="run tests marked slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: long benchmark run, skipped unless --run-slow is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow benchmark, use --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
@@ -0,0 +1,15 @@
+"""Un téléchargement S3 lent ne doit pas bloquer GET /files."""
+import asyncio
+
+from bench_concurrency import listing_blocked, run
+from aws_standin import percentile
+
+SLOW_SECONDS = 1.0
+
+
+def test_listing_stays_fast_during_slow_download(aws_standin):
+    baseline, contended = asyncio.run(run(30, SLOW_SECONDS))
+    assert not listing_blocked(contended, SLOW_SECONDS), (
+        f"/files p99 {percentile(contended, 99) * 1000:.0f} ms during a {SLOW_SECONDS:.0f} s download "
+        f"(baseline p99 {percentile(baseline, 99) * 1000:.0f} ms)"
+    )
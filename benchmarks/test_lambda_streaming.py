@@ -0,0 +1,22 @@
+"""extract_csv_metadata doit lire un CSV en mémoire constante, quelle que soit sa taille."""
+import pytest
+
+from bench_lambda_streaming import measure_streaming
+
+MAX_PEAK_MB = 64.0
+
+
+def check_streaming(size_mb):
+    stream, num_rows, delimiter, _, peak_mb = measure_streaming(size_mb)
+    assert delimiter == ";"
+    assert num_rows == stream.n_rows
+    assert peak_mb < MAX_PEAK_MB, f"tracemalloc peak {peak_mb:.1f} MB for {size_mb} MB of CSV"
+
+
+def test_csv_metadata_streams_in_constant_memory():
+    check_streaming(32)
+
+
+@pytest.mark.slow
+def test_csv_metadata_streams_one_gigabyte():
+    check_streaming(1024)
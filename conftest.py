@@ -0,0 +1,45 @@
+"""Fixtures pytest communes à tests/ et benchmarks/.
+
+Les tests qui parlent à S3/DynamoDB utilisent la fixture aws_standin (moto, voir
+benchmarks/aws_standin.py) ; le webservice et la Lambda sont importés tels quels.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+
+from aws_standin import start_aws_standin  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def aws_standin():
+    """Mock S3/DynamoDB partagé par toute la session ; chaque test utilise ses propres utilisateurs."""
+    mock = start_aws_standin()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture(scope="session")
+def webservice(aws_standin):
+    """Module webservice/app.py importé sur le mock."""
+    from aws_standin import import_webservice
+    return import_webservice()
+
+
+@pytest.fixture(scope="session")
+def ingest(aws_standin):
+    """Passe un fichier déposé par put_file dans la Lambda d'ingestion (profil, copie colonnaire)."""
+    from aws_standin import import_lambda, s3_event
+    lambda_function = import_lambda()
+
+    def run(key):
+        lambda_function.lambda_handler(s3_event(key), None)
+    return run
+
+
+@pytest.fixture
+def client(webservice):
+    from fastapi.testclient import TestClient
+    return TestClient(webservice.app)
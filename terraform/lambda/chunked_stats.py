@@ -0,0 +1,209 @@
+"""Statistiques d'une colonne calculées par morceaux, en mémoire bornée, sur toutes ses valeurs.
+
+Chaque morceau lu par pd.read_csv(chunksize=...) (ou par lots depuis la copie Parquet) est
+réduit par des opérations vectorisées puis fusionné dans les accumulateurs du profil de la
+Lambda (column_profile.py) : effectifs, valeurs manquantes, moments (moyenne et somme des
+carrés des écarts, fusion de Chan), min/max, sketch de quantiles KLL, HyperLogLog et
+Misra-Gries. La mémoire occupée ne dépend pas de la taille du fichier, seulement de celle
+d'un morceau. Effectifs, moyenne, écart-type, min et max sont exacts ; quartiles, nombre de
+valeurs distinctes et fréquences le sont tant que les sketchs n'ont pas compacté.
+
+Utilisé par la Lambda pour le profil écrit à l'ingestion (ChunkedTableProfile) et par le
+webservice pour les fichiers trop gros pour la mémoire : le résumé a la même forme que le
+profil, converti par stats_from_profile et boxplot_from_profile.
+"""
+import heapq
+import math
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from column_profile import EXTREMES_K, NA_VALUES, ColumnProfile, HeavyHitters, HyperLogLog, RunningMoments, TableProfile
+
+
+# Premiers caractères possibles d'un nombre fini écrit en texte ("12", "-3.5", ".5", "+1e3")
+NUMBER_FIRST_CHARS = list("0123456789+-.")
+
+
+class VectorHyperLogLog(HyperLogLog):
+    """HyperLogLog alimenté par tableaux : hachage pandas (hash_array) et registres numpy.
+
+    Les valeurs numériques et textuelles sont hachées séparément, comme dans ColumnProfile
+    où un nombre et un texte ne se confondent jamais.
+    """
+
+    def __init__(self, p=12, exact_limit=1024):
+        super().__init__(p, exact_limit)
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_array(self, values: np.ndarray) -> None:
+        if self._exact is not None:
+            values = pd.unique(values)
+            if len(values) <= self.exact_limit:
+                self._exact.update(values.tolist())
+                if len(self._exact) <= self.exact_limit:
+                    return
+            # Trop de valeurs distinctes : les registres sont alimentés avec celles déjà vues et le tableau entier
+            exact_values = list(self._exact)
+            self._exact = None
+            numbers = np.array([v for v in exact_values if isinstance(v, float)], dtype=np.float64)
+            texts = np.array([v for v in exact_values if not isinstance(v, float)], dtype=object)
+            for array in (numbers, texts):
+                if len(array):
+                    self._add_hashes(pd.util.hash_array(array))
+        self._add_hashes(pd.util.hash_array(values))
+
+    def _add_hashes(self, hashes: np.ndarray) -> None:
+        shift = np.uint64(64 - self.p)
+        index = (hashes >> shift).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # rest < 2**52 : la conversion en float64 est exacte et frexp donne sa longueur en bits
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = ((64 - self.p) - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        if self._exact is not None:
+            return len(self._exact)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            return int(round(self.m * math.log(self.m / zeros)))
+        return int(round(raw))
+
+
+def format_number(value: float) -> str:
+    """Représentation textuelle d'un nombre pour les fréquences d'une colonne mixte."""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class ChunkedColumnProfile(ColumnProfile):
+    """Profil de colonne alimenté par morceaux (pd.Series) plutôt que cellule par cellule."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.distinct = VectorHyperLogLog()
+
+    def add_chunk(self, chunk: pd.Series) -> None:
+        values = chunk.dropna()
+        self.missing += len(chunk) - len(values)
+        if values.empty:
+            return
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.infer_dtype(values, skipna=True) == "boolean":
+            # Booléens (y compris cellules Excel en object) profilés en 0/1, comme dans
+            # compute_descriptive_stats du webservice : même type avec ou sans profil
+            values = pd.Series(values.to_numpy(dtype=np.float64))
+        if not pd.api.types.is_numeric_dtype(values):
+            # Colonne lue en texte : le typage se fait une fois par valeur distincte du morceau
+            codes, uniques = pd.factorize(values, sort=False)
+            labels = pd.Index(uniques)
+            # Dates (cellules Excel) écrites comme str(datetime), à l'identique de ColumnProfile.add
+            labels = labels.map(str) if isinstance(labels, pd.DatetimeIndex) else labels.astype(str)
+            counts = pd.Series(np.bincount(codes, minlength=len(uniques)), index=labels.str.strip())
+            counts = counts.groupby(level=0, sort=False).sum()
+            is_na = counts.index.isin(NA_VALUES)
+            self.missing += int(counts[is_na].sum())
+            counts = counts[~is_na]
+            # Seuls les textes commençant comme un nombre fini sont convertis (les autres sont du texte)
+            numbers = np.full(len(counts), np.nan)
+            candidates = counts.index.str[:1].isin(NUMBER_FIRST_CHARS)
+            if candidates.any():
+                numbers[candidates] = pd.to_numeric(counts.index[candidates].to_series(), errors='coerce').to_numpy(dtype=np.float64)
+            parsed = ~np.isnan(numbers)
+            # Comme ColumnProfile.add : les infinis comptent comme du texte
+            parsed &= np.isfinite(numbers)
+            if not parsed.all():
+                self._add_texts(counts[~parsed])
+            if parsed.any():
+                self._add_numbers(np.repeat(numbers[parsed], counts.to_numpy()[parsed]))
+            return
+        numbers = values.to_numpy(dtype=np.float64)
+        infinite = ~np.isfinite(numbers)
+        if infinite.any():
+            self._add_texts(pd.Series([format_number(v) for v in numbers[infinite]]).value_counts())
+            numbers = numbers[~infinite]
+        if len(numbers):
+            self._add_numbers(numbers)
+
+    def _add_texts(self, counts: pd.Series) -> None:
+        """Ajoute des valeurs textuelles, données par leurs effectifs (index : valeur)."""
+        self.text_count += int(counts.sum())
+        self.distinct.add_array(counts.index.to_numpy(dtype=object))
+        self._add_counts(counts.sort_values(ascending=False))
+
+    def _add_numbers(self, numbers: np.ndarray) -> None:
+        self.distinct.add_array(numbers)
+        self._add_counts(pd.Series(numbers).value_counts())
+
+        chunk_moments = RunningMoments()
+        chunk_moments.count = len(numbers)
+        chunk_moments.mean = float(numbers.mean())
+        chunk_moments.m2 = float(((numbers - chunk_moments.mean) ** 2).sum())
+        chunk_moments.min = float(numbers.min())
+        chunk_moments.max = float(numbers.max())
+        self.moments.merge(chunk_moments)
+
+        # Valeurs triées : les tris du sketch (timsort) fusionnent alors des séquences déjà ordonnées
+        self.quantiles.add_many(np.sort(numbers).tolist())
+
+        if len(numbers) > EXTREMES_K:
+            lowest = np.partition(numbers, EXTREMES_K - 1)[:EXTREMES_K]
+            highest = np.partition(numbers, len(numbers) - EXTREMES_K)[-EXTREMES_K:]
+        else:
+            lowest = highest = numbers
+        self._lowest = heapq.nlargest(EXTREMES_K, self._lowest + (-lowest).tolist())
+        heapq.heapify(self._lowest)
+        self._highest = heapq.nlargest(EXTREMES_K, self._highest + highest.tolist())
+        heapq.heapify(self._highest)
+
+    def _add_counts(self, counts: pd.Series) -> None:
+        """Fusionne les effectifs exacts d'un morceau dans le résumé Misra-Gries."""
+        chunk_top = HeavyHitters(self.top_values.capacity)
+        if len(counts) > chunk_top.capacity:
+            # Réduction Misra-Gries du morceau (value_counts est trié par effectif décroissant)
+            cut = int(counts.iloc[chunk_top.capacity])
+            counts = counts.iloc[:chunk_top.capacity] - cut
+            counts = counts[counts > 0]
+            chunk_top.error = cut
+        chunk_top.counters = {value: int(count) for value, count in counts.items()}
+        self.top_values.merge(chunk_top)
+
+    def summary(self):
+        summary = super().summary()
+        if summary["data_type"] == "categorical":
+            # Les nombres d'une colonne mixte sont comptés sous leur forme numérique
+            summary["top_frequencies"] = [
+                dict(entry, value=format_number(entry["value"])) if isinstance(entry["value"], float) else entry
+                for entry in summary["top_frequencies"]
+            ]
+        return summary
+
+
+class ChunkedTableProfile(TableProfile):
+    """Profil de toutes les colonnes d'un fichier, alimenté par morceaux (DataFrames lus en flux)."""
+
+    def __init__(self, headers):
+        super().__init__(headers)
+        self.columns = [ChunkedColumnProfile(name) for name in self.headers]
+
+    def add_frame(self, frame: pd.DataFrame) -> None:
+        """Ajoute un morceau dont les colonnes sont, dans l'ordre, celles des en-têtes."""
+        self.row_count += len(frame)
+        for i, column in enumerate(self.columns):
+            column.add_chunk(frame.iloc[:, i])
+
+
+def summarize_column_chunks(frames: Iterable[pd.DataFrame], columns: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Alimente un profil par colonne, morceau par morceau, et renvoie leurs résumés.
+
+    Sans liste de colonnes, toutes celles du premier morceau sont profilées.
+    """
+    profiles = {name: ChunkedColumnProfile(name) for name in columns} if columns is not None else None
+    for frame in frames:
+        if profiles is None:
+            profiles = {name: ChunkedColumnProfile(name) for name in frame.columns}
+        for name, profile in profiles.items():
+            profile.add_chunk(frame[name])
+    return {name: profile.summary() for name, profile in (profiles or {}).items()}
@@ -0,0 +1,446 @@
+"""Profil de colonnes calculé en une seule passe sur les lignes d'un fichier.
+
+Chaque accumulateur est fusionnable (merge), ce qui permet de profiler un fichier par
+morceaux puis de combiner les résultats. Les empreintes (HyperLogLog) reposent sur hash()
+et ne sont valables qu'au sein d'un même processus : seul le résumé (summary) est persisté.
+"""
+import heapq
+import math
+import random
+
+
+# Valeurs considérées comme manquantes, alignées sur les na_values par défaut de pandas
+NA_VALUES = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+TOP_K = 10
+EXTREMES_K = 50
+
+
+class RunningMoments:
+    """Moyenne et variance en ligne (Welford), fusionnables (Chan et al.)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std_dev(self):
+        """Écart-type échantillon (ddof=1), comme pandas."""
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class KllSketch:
+    """Sketch de quantiles KLL (Karnin, Lang, Liberty), variante à compaction paresseuse.
+
+    Tant qu'aucune compaction n'a eu lieu, les quantiles sont exacts (interpolation linéaire
+    comme pandas). Ensuite l'erreur de rang est d'environ rank_error (borne empirique ~99 %).
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    @property
+    def rank_error(self):
+        return 0.0 if len(self.compactors) == 1 else 3.3 / self.k
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def add(self, x):
+        self.compactors[0].append(x)
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def add_many(self, values):
+        """Ajoute une suite de valeurs d'un coup : le niveau 0 sert de tampon avant compaction."""
+        values = list(values)
+        self.compactors[0].extend(values)
+        self.n += len(values)
+        self._size += len(values)
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self._size = sum(len(c) for c in self.compactors)
+        self._compress()
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        # On ne compacte que lorsque le sketch entier déborde : le niveau 0 sert de tampon
+        while self._size >= self._max_size:
+            for level in range(len(self.compactors)):
+                items = self.compactors[level]
+                if len(items) >= self._capacity(level):
+                    if level + 1 >= len(self.compactors):
+                        self._grow()
+                    items.sort()
+                    # On garde un élément sur deux, à partir d'un décalage aléatoire
+                    leftover = [items.pop()] if len(items) % 2 else []
+                    offset = self._rng.random() < 0.5
+                    kept = items[offset::2]
+                    self.compactors[level + 1].extend(kept)
+                    self.compactors[level] = leftover
+                    self._size -= len(items) - len(kept)
+                    break
+            else:
+                return
+
+    def quantile(self, q):
+        if self.n == 0:
+            return None
+        if len(self.compactors) == 1:
+            values = sorted(self.compactors[0])
+            position = q * (len(values) - 1)
+            lower = int(math.floor(position))
+            upper = min(lower + 1, len(values) - 1)
+            return values[lower] + (values[upper] - values[lower]) * (position - lower)
+        weighted = sorted((x, 2 ** level) for level, items in enumerate(self.compactors) for x in items)
+        total = sum(w for _, w in weighted)
+        target = q * total
+        cumulative = 0
+        for x, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return x
+        return weighted[-1][0]
+
+
+    def count_outside(self, low, high):
+        """Nombre (pondéré) de valeurs strictement sous low et strictement au-dessus de high."""
+        below = above = 0
+        for level, items in enumerate(self.compactors):
+            weight = 2 ** level
+            below += weight * sum(1 for x in items if x < low)
+            above += weight * sum(1 for x in items if x > high)
+        return below, above
+
+    def inner_range(self, low, high):
+        """Plus petite et plus grande valeur conservée dans [low, high] (None si aucune)."""
+        inside = [x for items in self.compactors for x in items if low <= x <= high]
+        return (min(inside), max(inside)) if inside else (None, None)
+
+
+def _mix64(h):
+    """Finaliseur splitmix64 : disperse les bits de hash() (identité pour les petits entiers)."""
+    h = (h + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return h ^ (h >> 31)
+
+
+class HyperLogLog:
+    """Estimation du nombre de valeurs distinctes, exacte tant qu'il y en a peu."""
+
+    def __init__(self, p=12, exact_limit=1024):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self.exact_limit = exact_limit
+        self._exact = set()
+
+    def add(self, value):
+        if self._exact is not None:
+            # Registres alimentés seulement en quittant le mode exact
+            self._exact.add(value)
+            if len(self._exact) > self.exact_limit:
+                for exact_value in self._exact:
+                    self._add_hash(exact_value)
+                self._exact = None
+            return
+        self._add_hash(value)
+
+    def _add_hash(self, value):
+        h = _mix64(hash(value))
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if self._exact is not None and other._exact is not None:
+            for value in other._exact:
+                self.add(value)
+            return
+        for source in (self, other):
+            if source._exact is not None:
+                for value in source._exact:
+                    source._add_hash(value)
+                source._exact = None
+        for i, r in enumerate(other.registers):
+            if r > self.registers[i]:
+                self.registers[i] = r
+
+    @property
+    def is_exact(self):
+        return self._exact is not None
+
+    @property
+    def relative_error(self):
+        """Écart-type relatif de l'estimation (1.04 / sqrt(m)), nul en mode exact."""
+        return 0.0 if self.is_exact else 1.04 / math.sqrt(self.m)
+
+    def estimate(self):
+        if self._exact is not None:
+            return len(self._exact)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros:
+            return int(round(self.m * math.log(self.m / zeros)))
+        return int(round(raw))
+
+
+class HeavyHitters:
+    """Valeurs les plus fréquentes (Misra-Gries) : comptes sous-estimés d'au plus error."""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.counters = {}
+        self.error = 0
+
+    def add(self, value):
+        counters = self.counters
+        if value in counters:
+            counters[value] += 1
+        elif len(counters) < self.capacity:
+            counters[value] = 1
+        else:
+            self.error += 1
+            for key in list(counters):
+                counters[key] -= 1
+                if counters[key] == 0:
+                    del counters[key]
+
+    def merge(self, other):
+        for value, count in other.counters.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        self.error += other.error
+        if len(self.counters) > self.capacity:
+            cut = sorted(self.counters.values(), reverse=True)[self.capacity]
+            self.counters = {v: c - cut for v, c in self.counters.items() if c > cut}
+            self.error += cut
+
+    def top(self, k=TOP_K):
+        return sorted(self.counters.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class ColumnProfile:
+    """Accumulateurs d'une colonne : valeurs manquantes, moments, quantiles, distincts, top-k."""
+
+    def __init__(self, name):
+        self.name = name
+        self.missing = 0
+        self.text_count = 0
+        self.moments = RunningMoments()
+        self.quantiles = KllSketch()
+        self.distinct = HyperLogLog()
+        self.top_values = HeavyHitters()
+        self._lowest = []   # tas max (valeurs négées) des plus petites valeurs
+        self._highest = []  # tas min des plus grandes valeurs
+
+    def add(self, value):
+        """Ajoute une cellule : chaîne brute (CSV) ou valeur typée (Excel)."""
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            self.missing += 1
+            return
+        if isinstance(value, str):
+            value = value.strip()
+            if value in NA_VALUES:
+                self.missing += 1
+                return
+            token = value
+            try:
+                number = float(value)
+            except ValueError:
+                number = None
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            token = str(value)
+            number = float(value)
+        else:
+            token = str(value)
+            number = None
+
+        self.top_values.add(token)
+        if number is None or math.isnan(number) or math.isinf(number):
+            self.text_count += 1
+            self.distinct.add(token)
+            return
+        self.distinct.add(number)
+        self.moments.add(number)
+        self.quantiles.add(number)
+        if len(self._lowest) < EXTREMES_K:
+            heapq.heappush(self._lowest, -number)
+        elif -number > self._lowest[0]:
+            heapq.heapreplace(self._lowest, -number)
+        if len(self._highest) < EXTREMES_K:
+            heapq.heappush(self._highest, number)
+        elif number > self._highest[0]:
+            heapq.heapreplace(self._highest, number)
+
+    def merge(self, other):
+        self.missing += other.missing
+        self.text_count += other.text_count
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+        self.top_values.merge(other.top_values)
+        # Valeurs négées : les plus petites valeurs sont les plus grandes du tas
+        self._lowest = heapq.nlargest(EXTREMES_K, self._lowest + other._lowest)
+        heapq.heapify(self._lowest)
+        self._highest = heapq.nlargest(EXTREMES_K, self._highest + other._highest)
+        heapq.heapify(self._highest)
+
+    @property
+    def count(self):
+        return self.moments.count + self.text_count
+
+    @property
+    def data_type(self):
+        # Comme pandas : une seule valeur non numérique rend la colonne textuelle
+        if self.count == 0:
+            return "empty"
+        return "categorical" if self.text_count else "numeric"
+
+    def _quantile_bounds(self):
+        """Valeurs encadrant chaque quartile, aux rangs q - rank_error et q + rank_error."""
+        eps = self.quantiles.rank_error
+        if not eps:
+            return None
+        return {
+            name: [self.quantiles.quantile(max(0.0, q - eps)), self.quantiles.quantile(min(1.0, q + eps))]
+            for name, q in (("q1", 0.25), ("median", 0.5), ("q3", 0.75))
+        }
+
+    def _boxplot_summary(self, q1, q3):
+        """Moustaches (valeurs extrêmes dans 1.5·IQR) et nombre d'outliers de chaque côté.
+
+        Exacts tant que le sketch n'a pas compacté, estimés depuis ses valeurs pondérées ensuite.
+        """
+        iqr = q3 - q1
+        low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        lower_whisker, upper_whisker = self.quantiles.inner_range(low, high)
+        low_outliers, high_outliers = self.quantiles.count_outside(low, high)
+        exact_low = exact_high = not self.quantiles.rank_error
+        # Les valeurs extrêmes conservées exactement donnent la réponse exacte quand la moustache en fait partie
+        lowest = sorted(-v for v in self._lowest)
+        inside = [v for v in lowest if v >= low]
+        if inside:
+            lower_whisker, low_outliers, exact_low = inside[0], len(lowest) - len(inside), True
+        highest = sorted(self._highest)
+        inside = [v for v in highest if v <= high]
+        if inside:
+            upper_whisker, high_outliers, exact_high = inside[-1], len(highest) - len(inside), True
+        return {
+            "whiskers": [lower_whisker if lower_whisker is not None else q1, upper_whisker if upper_whisker is not None else q3],
+            "outlier_counts": [low_outliers, high_outliers],
+            "outlier_counts_exact": exact_low and exact_high,
+        }
+
+    def summary(self):
+        """Résumé sérialisable en JSON du profil de la colonne."""
+        summary = {
+            "name": self.name,
+            "count": self.count,
+            "missing": self.missing,
+            "data_type": self.data_type,
+            "unique_values_count": self.distinct.estimate(),
+            "unique_values_exact": self.distinct.is_exact,
+            "unique_values_error": self.distinct.relative_error,
+        }
+        if summary["data_type"] == "numeric":
+            summary.update({
+                "mean": self.moments.mean,
+                "std_dev": self.moments.std_dev,
+                "min": self.moments.min,
+                "max": self.moments.max,
+                "q1": self.quantiles.quantile(0.25),
+                "median": self.quantiles.quantile(0.5),
+                "q3": self.quantiles.quantile(0.75),
+                "rank_error": self.quantiles.rank_error,
+                "quantile_bounds": self._quantile_bounds(),
+                "lowest_values": sorted(-v for v in self._lowest),
+                "highest_values": sorted(self._highest),
+            })
+            summary.update(self._boxplot_summary(summary["q1"], summary["q3"]))
+        elif summary["data_type"] == "categorical":
+            summary.update({
+                "top_frequencies": [{"value": v, "count": c} for v, c in self.top_values.top()],
+                "top_frequencies_error": self.top_values.error,
+            })
+        return summary
+
+
+class TableProfile:
+    """Profil de toutes les colonnes d'un fichier, alimenté ligne par ligne."""
+
+    def __init__(self, headers):
+        self.headers = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(headers)]
+        self.columns = [ColumnProfile(name) for name in self.headers]
+        self.row_count = 0
+
+    def add_row(self, row):
+        self.row_count += 1
+        n = len(row)
+        for i, column in enumerate(self.columns):
+            column.add(row[i] if i < n else None)
+
+    def merge(self, other):
+        for column, other_column in zip(self.columns, other.columns):
+            column.merge(other_column)
+        self.row_count += other.row_count
+
+    def summary(self):
+        return {
+            "version": 1,
+            "row_count": self.row_count,
+            "columns": {column.name: column.summary() for column in self.columns},
+        }
@@ -0,0 +1,131 @@
+"""Détection du dialecte d'un CSV à partir d'un préfixe borné de ses octets.
+
+Partagé par la Lambda (détection unique à l'ingestion, résultat stocké sur l'item
+DynamoDB) et par le webservice (repli pour les fichiers pas encore traités).
+"""
+import codecs
+import csv
+import re
+
+
+# Taille maximale du préfixe examiné, quelle que soit la taille du fichier
+DIALECT_PREFIX_BYTES = 64 * 1024
+# Nombre maximal d'enregistrements utilisés pour la détection
+DIALECT_SAMPLE_ROWS = 50
+
+CANDIDATE_DELIMITERS = ",;\t|"
+
+_DECIMAL_COMMA = re.compile(r"^[-+]?\d+,\d+$")
+_DECIMAL_POINT = re.compile(r"^[-+]?\d+\.\d+$")
+
+
+def detect_encoding(prefix):
+    """Encodage du préfixe : UTF-8 (avec ou sans BOM), sinon latin-1 qui accepte tous les octets."""
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # Décodeur incrémental : un caractère multi-octets coupé en fin de préfixe n'est pas une erreur
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _sample_lines(text, truncated):
+    """Lignes complètes du préfixe décodé (la dernière est ignorée si le préfixe est tronqué)."""
+    lines = text.splitlines(keepends=True)
+    if truncated and len(lines) > 1:
+        lines.pop()
+    return lines
+
+
+def _guess_delimiter(lines):
+    """Délimiteur présent le plus régulièrement sur les lignes non vides, ',' par défaut."""
+    non_empty = [line for line in lines if line.strip()][:DIALECT_SAMPLE_ROWS]
+    best, best_score = ',', 0
+    for candidate in CANDIDATE_DELIMITERS:
+        counts = [line.count(candidate) for line in non_empty]
+        if not counts or not max(counts):
+            continue
+        mode = max(set(counts), key=counts.count)
+        score = counts.count(mode) * mode
+        if mode and score > best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def _header_row(records):
+    """Index (en lignes physiques) de l'en-tête : premier enregistrement ayant le nombre de champs dominant.
+
+    Les lignes de préambule (titre, commentaires d'export...) qui précèdent sont ainsi sautées.
+    """
+    widths = [len(fields) for _, fields in records if any(f.strip() for f in fields)]
+    if not widths:
+        return 0
+    dominant = max(set(widths), key=widths.count)
+    for start_line, fields in records:
+        if len(fields) == dominant and any(f.strip() for f in fields):
+            return start_line
+    return 0
+
+
+def _decimal_separator(records, delimiter, header_line):
+    """',' si les valeurs numériques de l'échantillon utilisent la virgule décimale, '.' sinon."""
+    if delimiter == ',':
+        return '.' # Une virgule décimale serait ambiguë avec le délimiteur
+    comma = point = 0
+    for start_line, fields in records:
+        if start_line <= header_line:
+            continue
+        for field in fields:
+            field = field.strip()
+            if _DECIMAL_COMMA.match(field):
+                comma += 1
+            elif _DECIMAL_POINT.match(field):
+                point += 1
+    return ',' if comma > point else '.'
+
+
+def detect_csv_dialect(prefix, truncated=None):
+    """Détermine encodage, délimiteur, quotechar, ligne d'en-tête et séparateur décimal.
+
+    prefix contient au plus DIALECT_PREFIX_BYTES octets du début du fichier ; truncated
+    indique si le fichier continue après (déduit de la taille du préfixe par défaut).
+    Le résultat est un dict directement stockable dans DynamoDB.
+    """
+    prefix = prefix[:DIALECT_PREFIX_BYTES]
+    if truncated is None:
+        truncated = len(prefix) >= DIALECT_PREFIX_BYTES
+    encoding = detect_encoding(prefix)
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(prefix, final=not truncated)
+    lines = _sample_lines(text, truncated)
+    sample = ''.join(lines[:DIALECT_SAMPLE_ROWS])
+
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=CANDIDATE_DELIMITERS)
+        delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        delimiter, quotechar = _guess_delimiter(lines), '"'
+
+    # Enregistrements de l'échantillon avec leur ligne physique de départ (0-indexée)
+    records = []
+    reader = csv.reader(lines, delimiter=delimiter, quotechar=quotechar)
+    try:
+        previous_line = 0
+        for fields in reader:
+            records.append((previous_line, fields))
+            previous_line = reader.line_num
+            if len(records) >= DIALECT_SAMPLE_ROWS:
+                break
+    except csv.Error:
+        pass # Guillemet non fermé en fin de préfixe : on garde les enregistrements déjà lus
+
+    header_row = _header_row(records)
+    return {
+        'encoding': encoding,
+        'delimiter': delimiter,
+        'quotechar': quotechar,
+        'headerRow': header_row,
+        'decimal': _decimal_separator(records, delimiter, header_row),
+    }
+
@@ -1,221 +1,771 @@
 import json
 from urllib.parse import unquote_plus
 import boto3
-from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
 import os
+import sys
 import logging
-import csv
 import io
+import itertools
+import functools
 import datetime
-import openpyxl
+import tempfile
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from csv_dialect import DIALECT_PREFIX_BYTES, detect_csv_dialect
+from ranged_download import download_to_file
 
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+FILES_DYNAMO_TABLE_NAME = os.getenv("DYNAMO_TABLE") 
+
+# Clients créés une fois par conteneur, pendant l'init. Les clients bas niveau sont thread-safe
+# et bien plus légers à créer qu'une ressource DynamoDB (pas de modèle de ressources à charger).
 s3_client = boto3.client('s3')
-dynamodb_resource = None
-files_table = None
+dynamodb_client = boto3.client('dynamodb')
+_serializer = TypeSerializer()
+
+# Objets dérivés écrits à côté de l'objet original (user_uploads/user/file_id/xxx.columnar.parquet)
+COLUMNAR_SUFFIX = ".columnar.parquet"
+PROFILE_SUFFIX = ".profile.json"
+DERIVED_SUFFIXES = (COLUMNAR_SUFFIX, PROFILE_SUFFIX)
+
+# Taille des morceaux lus depuis S3 lors du parcours en flux des CSV
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", str(1024 * 1024)))
+# Nombre de valeurs (lignes x colonnes) d'un morceau de CSV parsé et profilé à la fois
+CSV_CHUNK_VALUES = int(os.getenv("CSV_CHUNK_VALUES", "500000"))
+# Nombre minimal de lignes d'un morceau, pour les fichiers très larges
+CSV_MIN_CHUNK_ROWS = 1000
+# Nombre de lignes Excel profilées et converties à la fois
+EXCEL_BATCH_ROWS = 10000
+# Au-delà de cette taille, le profil des colonnes n'est pas calculé à l'ingestion : seul le parsing
+# reste, pour tenir dans le timeout de la Lambda. Le webservice calcule alors les statistiques à la demande.
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Nombre de records d'un lot traités en parallèle (borné par la mémoire de la Lambda)
+RECORD_WORKERS = int(os.getenv("RECORD_WORKERS", "4"))
+# Durées des étapes et volumes de chaque fichier, publiés dans CloudWatch (Embedded Metric Format)
+EMIT_METRICS = os.getenv("EMIT_METRICS", "1") == "1"
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "StatisticAWS/Ingestion")
+
+if not FILES_DYNAMO_TABLE_NAME:
+    logger.error("Environment variable DYNAMO_TABLE is not set!")
+
+
+# Les bibliothèques de parsing lourdes ne sont importées qu'au premier fichier qui en a besoin :
+# la plupart des uploads sont des CSV, qui n'utilisent jamais openpyxl.
+@functools.lru_cache(maxsize=None)
+def load_openpyxl():
+    """Module openpyxl, ou None s'il n'est pas installé."""
+    try:
+        import openpyxl
+    except ImportError:
+        return None
+    return openpyxl
+
+
+@functools.lru_cache(maxsize=None)
+def load_pandas():
+    """Module pandas (layer AWS SDK for pandas), utilisé pour parser et profiler par morceaux."""
+    import pandas as pd
+    return pd
+
+
+@functools.lru_cache(maxsize=None)
+def load_chunked_stats():
+    """Module chunked_stats (profil par morceaux vectorisés), qui importe pandas et numpy."""
+    import chunked_stats
+    return chunked_stats
 
-FILES_DYNAMO_TABLE_NAME = os.getenv("DYNAMO_TABLE") 
 
-if FILES_DYNAMO_TABLE_NAME:
+@functools.lru_cache(maxsize=None)
+def load_pyarrow():
+    """Modules (pyarrow, pyarrow.csv, pyarrow.parquet), ou None s'ils ne sont pas installés."""
     try:
-        dynamodb_resource = boto3.resource('dynamodb')
-        files_table = dynamodb_resource.Table(FILES_DYNAMO_TABLE_NAME)
-        logger.info(f"Successfully initialized DynamoDB table object for table: {FILES_DYNAMO_TABLE_NAME}")
-    except Exception as e:
-        logger.error(f"Failed to initialize DynamoDB table resource for table name '{FILES_DYNAMO_TABLE_NAME}': {e}", exc_info=True)
-else:
-    logger.error("Environment variable FILES_DYNAMO_TABLE is not set!")
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError: # Fourni par la layer AWS SDK for pandas, absent en local
+        return None
+    return pa, pa_csv, pq
+
+
+class PrefixedStream(io.RawIOBase):
+    """Flux binaire qui relit d'abord les octets déjà consommés (prefix), puis la suite du flux d'origine."""
+
+    def __init__(self, prefix, stream):
+        self._pending = memoryview(prefix)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not len(self._pending):
+            self._pending = memoryview(self._stream.read(len(buffer)) or b'')
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def iter_csv_frames(file_content_stream, dialect, prefix=b''):
+    """Lit un CSV en flux par morceaux de DataFrame, avec le dialecte détecté.
+
+    Chaque morceau contient au plus CSV_CHUNK_VALUES valeurs (le nombre de colonnes est lu
+    sur l'en-tête du préfixe) ; le premier est vide, avec les en-têtes, si le fichier n'a
+    pas de données. Seul un morceau est en mémoire à la fois, quelle que soit la taille du fichier.
+    """
+    pd = load_pandas()
+    options = dict(
+        sep=dialect['delimiter'],
+        quotechar=dialect['quotechar'],
+        encoding=dialect['encoding'],
+        # L'encodage est deviné sur le préfixe : un octet invalide plus loin devient U+FFFD
+        # au lieu de faire échouer tout le fichier (le préfixe peut aussi couper un caractère)
+        encoding_errors='replace',
+        decimal=dialect['decimal'],
+        skiprows=int(dialect['headerRow']),
+        header=0,
+        skipinitialspace=True, # Mêmes options que le parsing du webservice
+        engine='c',
+    )
+    # Seul l'en-tête est lu ici
+    n_columns = len(pd.read_csv(io.BytesIO(prefix), nrows=0, **options).columns)
+    chunk_rows = max(CSV_MIN_CHUNK_ROWS, CSV_CHUNK_VALUES // max(1, n_columns))
+    reader = pd.read_csv(io.BufferedReader(PrefixedStream(prefix, file_content_stream), CSV_CHUNK_SIZE), iterator=True, **options)
+    with reader:
+        yield reader.get_chunk(chunk_rows)
+        while True:
+            try:
+                yield reader.get_chunk(chunk_rows)
+            except StopIteration:
+                return
 
 
-def extract_csv_metadata(file_content_stream):
+def extract_csv_metadata(file_content_stream, with_profile=True, columnar_copy=None):
+    """Extrait en flux les métadonnées et le profil des colonnes d'un CSV, en mémoire constante.
+
+    Le dialecte est détecté une seule fois sur un préfixe borné puis renvoyé pour être
+    stocké sur l'item : le webservice le réutilise sans re-sniffer le fichier. Le profil
+    est alimenté par morceaux vectorisés ; il vaut None si with_profile est faux. Les mêmes
+    morceaux sont écrits dans columnar_copy (ColumnarCopyWriter) s'il est fourni.
+    """
     try:
-        content = file_content_stream.read().decode('utf-8-sig')
+        prefix = file_content_stream.read(DIALECT_PREFIX_BYTES) or b''
+        dialect = detect_csv_dialect(prefix)
+        logger.info(f"CSV dialect detected: {dialect}")
+
+        pd = load_pandas()
+        headers = None
+        num_rows = 0
+        profile = None
         try:
-            dialect = csv.Sniffer().sniff(content.splitlines()[0])
-            logger.info(f"CSV dialect sniffed: delimiter='{dialect.delimiter}', quotechar='{dialect.quotechar}'")
-            reader = csv.reader(io.StringIO(content), dialect=dialect)
-        except csv.Error:
-            logger.warning("CSV Sniffer failed, falling back to ';' delimiter.")
-            reader = csv.reader(io.StringIO(content), delimiter=';') 
-
-        rows = list(reader)
-        if not rows:
+            for frame in iter_csv_frames(file_content_stream, dialect, prefix=prefix):
+                if headers is None:
+                    headers = [str(name).strip() for name in frame.columns]
+                    if with_profile:
+                        profile = load_chunked_stats().ChunkedTableProfile(headers)
+                num_rows += len(frame)
+                if profile is not None:
+                    profile.add_frame(frame)
+                if columnar_copy is not None and len(frame):
+                    columnar_copy.write_frame(frame, headers)
+        except pd.errors.EmptyDataError:
             logger.warning("CSV file appears to be empty or unparseable with current delimiter.")
-            return None, 0, 0
-        
-        headers = rows[0]
-        num_rows = len(rows) - 1
+            return None, 0, 0, dialect, None
+
         num_cols = len(headers)
-        
         logger.info(f"Extracted headers: {headers}, Num_cols: {num_cols}, Num_rows: {num_rows}")
-        if num_cols <= 1 and ';' in content.splitlines()[0]: # Si on a une seule colonne mais qu'il y a des ';' dans l'en-tête
-            logger.warning("Possible delimiter issue: Only one column detected but ';' present in header. Check delimiter.")
-
-        return headers, num_rows, num_cols
+        return headers, num_rows, num_cols, dialect, profile
     except Exception as e:
         logger.error(f"Error processing CSV content: {e}", exc_info=True)
         raise
 
 
-def extract_excel_metadata(file_content_stream):
-    """Extrait les métadonnées d'un fichier Excel (.xlsx)."""
-    if not openpyxl:
-        logger.error("openpyxl library is not available. Cannot process Excel files.")
-        raise ImportError("openpyxl library not found")
+def spool_to_tempfile(bucket_name, key):
+    """Télécharge un objet S3 dans un fichier temporaire (/tmp), par plages parallèles s'il est gros."""
+    spooled = tempfile.TemporaryFile()
     try:
-        workbook = openpyxl.load_workbook(filename=file_content_stream)
-        sheet = workbook.active 
-        
-        if sheet.max_row == 0: 
-             return None, 0, 0
+        return download_to_file(s3_client, bucket_name, key, spooled)
+    except Exception:
+        spooled.close()
+        raise
 
-        headers = [cell.value for cell in sheet[1]]
-        num_rows = sheet.max_row - 1 
-        num_cols = sheet.max_column
 
-        actual_headers = [h for h in headers if h is not None]
-        if len(actual_headers) < num_cols and headers:
-             if all(h is None for h in headers[len(actual_headers):]):
-                 num_cols = len(actual_headers)
-                 headers = actual_headers
-        elif not headers and num_cols > 0: 
-            headers = [f"Column_{i+1}" for i in range(num_cols)]
+def iter_excel_rows(worksheet, num_cols):
+    """Parcourt les lignes de données d'une feuille en lecture seule, sans les lignes vides finales.
+
+    En mode read_only, la dimension déclarée par le fichier (et donc max_row) peut être fausse
+    ou absente : on la réinitialise et on parcourt réellement les lignes.
+    """
+    worksheet.reset_dimensions()
+    rows = worksheet.iter_rows(min_row=2, max_col=num_cols, values_only=True)
+    pending_empty = 0
+    for row in rows:
+        if all(value is None for value in row):
+            pending_empty += 1 # Ne compte que si une ligne non vide suit
+            continue
+        for _ in range(pending_empty):
+            yield (None,) * num_cols
+        pending_empty = 0
+        yield row
 
 
-        return headers, num_rows, num_cols
+def extract_excel_metadata(file_content_stream, with_profile=True, columnar_copy=None):
+    """Extrait les métadonnées d'un fichier Excel (.xlsx) en parcourant ses lignes en lecture seule.
+
+    Le profil est alimenté par lots de EXCEL_BATCH_ROWS lignes ; il vaut None si with_profile
+    est faux. Les mêmes lots sont ajoutés à columnar_copy (ColumnarCopyWriter) s'il est fourni :
+    le classeur n'est parcouru qu'une fois.
+    """
+    openpyxl = load_openpyxl()
+    if not openpyxl:
+        logger.error("openpyxl library is not available. Cannot process Excel files.")
+        raise ImportError("openpyxl library not found")
+    try:
+        workbook = openpyxl.load_workbook(filename=file_content_stream, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active 
+            sheet.reset_dimensions()
+            header_row = next(sheet.iter_rows(max_row=1, values_only=True), None)
+            if not header_row:
+                return None, 0, 0, None
+
+            headers = list(header_row)
+            num_cols = len(headers)
+
+            actual_headers = [h for h in headers if h is not None]
+            if len(actual_headers) < num_cols and headers:
+                 if all(h is None for h in headers[len(actual_headers):]):
+                     num_cols = len(actual_headers)
+                     headers = actual_headers
+            # Cellules d'en-tête numériques, dates ou vides converties en texte, avec les noms
+            # donnés par le webservice (TypeSerializer refuse les float et les datetime)
+            headers = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(headers)]
+
+            num_rows = 0
+            profile = load_chunked_stats().ChunkedTableProfile(headers) if with_profile else None
+            for batch in _batched(iter_excel_rows(sheet, num_cols), EXCEL_BATCH_ROWS):
+                num_rows += len(batch)
+                if profile is not None:
+                    profile.add_frame(load_pandas().DataFrame.from_records(batch, columns=range(num_cols)))
+                if columnar_copy is not None:
+                    columnar_copy.add_rows(batch, headers)
+        finally:
+            workbook.close() # Libère le fichier ouvert par le mode read_only
+
+        return headers, num_rows, num_cols, profile
     except Exception as e:
         logger.error(f"Error processing Excel content: {e}", exc_info=True)
         raise
 
 
-def lambda_handler(event, context):
-    if not files_table:
-        logger.error("DynamoDB 'files_table' resource is not initialized. Aborting.")
-        return {'statusCode': 500, 'body': json.dumps('Internal server error: Files table not configured or initialization failed')}
+def derived_key_for(key, suffix):
+    """Clé S3 d'un objet dérivé (copie colonnaire, profil) associé à un objet uploadé."""
+    stem, _, _ = key.rpartition('.')
+    return f"{stem or key}{suffix}"
 
-    for record in event.get("Records", []):
-        processing_status = "processed_with_metadata" # Statut par défaut
-        extracted_metadata = {}
 
-        try:
-            s3_data = record.get("s3", {})
-            bucket_name = s3_data.get("bucket", {}).get("name")
-            object_key = s3_data.get("object", {}).get("key")
+def write_profile(bucket_name, key, profile):
+    """Écrit le profil des colonnes en JSON à côté de la clé originale et renvoie sa clé S3."""
+    profile_key = derived_key_for(key, PROFILE_SUFFIX)
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=profile_key,
+        Body=json.dumps(profile.summary(), default=str).encode('utf-8'),
+        ContentType='application/json',
+    )
+    logger.info(f"Column profile written to s3://{bucket_name}/{profile_key}")
+    return profile_key
 
-            if not bucket_name or not object_key:
-                logger.warning(f"Skipping record due to missing bucket name or object key: {record}")
-                continue
 
-            key = unquote_plus(object_key)
-            logger.info(f"Processing object s3://{bucket_name}/{key}")
-            parts = key.split('/')
-            if len(parts) < 4 or parts[0] != "user_uploads":
-                logger.error(f"Invalid key format: '{key}'. Expected 'user_uploads/user/file_id/filename'. Skipping.")
-                continue
+def _batched(iterable, size):
+    """Regroupe un itérable en listes de taille size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-            user = parts[1]
-            file_id = parts[2]
-            # s3_filename = parts[3] # Peut être utile pour le logging
 
-            logger.info(f"Extracted from key: user='{user}', file_id='{file_id}'")
+def _excel_column_array(values):
+    """Convertit une colonne Excel en tableau Arrow, en texte si les types sont mélangés."""
+    pa = load_pyarrow()[0]
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
 
-            # Télécharger le fichier depuis S3
-            try:
-                s3_object = s3_client.get_object(Bucket=bucket_name, Key=key)
-                file_content_stream = s3_object['Body'] # Ceci est un flux
-            except ClientError as e:
-                logger.error(f"S3 GetObject error for key '{key}': {e}", exc_info=True)
-                processing_status = "error_s3_read"
-                continue # Passer à l'enregistrement suivant
-
-            # Déterminer le type de fichier et extraire les métadonnées
-            headers = None
-            num_rows = 0
-            num_cols = 0
 
+def _arrow_column(series, field):
+    """Convertit une colonne d'un morceau de CSV au type fixé par le premier morceau.
+
+    Une colonne texte dont un morceau ne contient que des nombres reste du texte.
+    """
+    pa = load_pyarrow()[0]
+    try:
+        return pa.array(series, type=field.type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            raise
+        isna = load_pandas().isna
+        return pa.array([None if isna(value) else str(value) for value in series], type=field.type)
+
+
+class ColumnarCopyWriter:
+    """Copie Parquet de l'objet, écrite pendant le parsing dans un fichier temporaire de /tmp.
+
+    Les morceaux d'un CSV sont écrits au fil de l'eau avec le schéma du premier. Les lots
+    d'un fichier Excel sont écrits un par un en Arrow IPC dans /tmp, sans rester en mémoire,
+    pendant que leurs schémas sont unifiés (null -> int64, int64 -> double...) ; à la
+    fermeture ils sont relus un à un, convertis au schéma commun et écrits en Parquet. Une
+    conversion impossible abandonne la copie sans interrompre le parsing : le webservice lit
+    alors le fichier brut.
+    """
+
+    def __init__(self):
+        self.pa, _, self.pq = load_pyarrow()
+        self._file = tempfile.NamedTemporaryFile(suffix=COLUMNAR_SUFFIX)
+        self._writer = None
+        self._spool = None # Répertoire des lots Excel en attente
+        self._batch_paths = []
+        self._schema = None # Schéma unifié des lots Excel
+        self.failed = False
+
+    def write_frame(self, frame, names):
+        """Ajoute un morceau de CSV (DataFrame) dont les colonnes portent les noms names."""
+        if self.failed:
+            return
+        pa = self.pa
+        try:
+            if self._writer is None:
+                table = pa.Table.from_arrays([pa.array(frame.iloc[:, i], from_pandas=True) for i in range(len(names))], names=names)
+                self._writer = self.pq.ParquetWriter(self._file.name, table.schema)
+            else:
+                schema = self._writer.schema
+                table = pa.Table.from_arrays([_arrow_column(frame.iloc[:, i], field) for i, field in enumerate(schema)], schema=schema)
+            self._writer.write_table(table)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            # Typiquement une colonne numérique dans le premier morceau et textuelle ensuite
+            self._abandon(e)
+
+    def add_rows(self, rows, names):
+        """Ajoute un lot de lignes Excel (tuples de valeurs typées), écrit aussitôt dans /tmp."""
+        if self.failed:
+            return
+        pa = self.pa
+        columns = [[row[i] if i < len(row) else None for row in rows] for i in range(len(names))]
+        table = pa.Table.from_arrays([_excel_column_array(values) for values in columns], names=names)
+        try:
+            self._schema = table.schema if self._schema is None else pa.unify_schemas([self._schema, table.schema], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            self._abandon(e) # Par exemple du texte dans un lot et des nombres dans un autre
+            return
+        if self._spool is None:
+            self._spool = tempfile.TemporaryDirectory(prefix="columnar-batches-")
+        path = os.path.join(self._spool.name, f"{len(self._batch_paths)}.arrow")
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        self._batch_paths.append(path)
+
+    def _write_batches(self):
+        """Écrit les lots Excel dans le fichier Parquet, un seul lot en mémoire à la fois."""
+        pa = self.pa
+        with self.pq.ParquetWriter(self._file.name, self._schema) as writer:
+            for path in self._batch_paths:
+                with pa.memory_map(path, "r") as source:
+                    table = pa.ipc.open_file(source).read_all()
+                writer.write_table(table.cast(self._schema))
+                del table
+                os.remove(path)
+
+    def _abandon(self, error):
+        logger.warning(f"Columnar conversion failed: {error}. Raw file will be used instead.")
+        self.failed = True
+        self._remove_spool()
+
+    def _remove_spool(self):
+        if self._spool is not None:
+            self._spool.cleanup()
+            self._spool = None
+        self._batch_paths = []
+
+    def finish(self):
+        """Termine l'écriture ; renvoie le chemin du fichier Parquet, ou None si la copie est abandonnée ou vide."""
+        pa = self.pa
+        if self._writer is not None:
+            self._writer.close()
+        elif self._batch_paths and not self.failed:
             try:
-                if key.lower().endswith('.csv'):
-                    logger.info(f"Processing as CSV: {key}")
-                    headers, num_rows, num_cols = extract_csv_metadata(file_content_stream)
-                elif key.lower().endswith('.xlsx'):
-                    if not openpyxl:
-                         logger.error("openpyxl not available, cannot process .xlsx file.")
-                         processing_status = "error_missing_dependency_xlsx"
-                         raise RuntimeError("openpyxl not available")
-                    logger.info(f"Processing as Excel (xlsx): {key}")
-                    # openpyxl attend un objet de type fichier binaire pour les flux
-                    headers, num_rows, num_cols = extract_excel_metadata(io.BytesIO(file_content_stream.read()))
-                else:
-                    logger.warning(f"Unsupported file type for key: {key}. Skipping metadata extraction.")
-                    processing_status = "unsupported_file_type"
-                    # Pas besoin de 'continue' ici si on veut quand même mettre à jour DynamoDB avec ce statut
-                
-                if headers is not None: # Si le parsing a réussi
-                    extracted_metadata = {
-                        'columnHeaders': headers,
-                        'rowCount': num_rows,
-                        'columnCount': num_cols
-                    }
-                    logger.info(f"Extracted metadata for {key}: Rows={num_rows}, Cols={num_cols}, Headers={headers[:5]}...") # Log seulement les premiers headers
-
-            except Exception as e: # Erreur pendant le parsing du fichier
-                logger.error(f"Failed to parse file content for {key}: {e}", exc_info=True)
-                processing_status = "error_parsing_file"
-                # On continue pour mettre à jour DynamoDB avec ce statut d'erreur
-
-            # Mettre à jour l'item dans DynamoDB
-            update_expression_parts = ["SET processingStatus = :ps"]
-            expression_attribute_values = {':ps': processing_status}
-            
-            if extracted_metadata: # N'ajouter que si on a des métadonnées
-                update_expression_parts.append("columnHeaders = :ch")
-                expression_attribute_values[':ch'] = extracted_metadata.get('columnHeaders', [])
-                update_expression_parts.append("rowCount = :rc")
-                expression_attribute_values[':rc'] = extracted_metadata.get('rowCount', 0)
-                update_expression_parts.append("columnCount = :cc")
-                expression_attribute_values[':cc'] = extracted_metadata.get('columnCount', 0)
-                update_expression_parts.append("processedTimestamp = :pt") # Ajouter un timestamp de traitement
-                expression_attribute_values[':pt'] = datetime.datetime.utcnow().isoformat()
-
-
-            update_expression = ", ".join(update_expression_parts)
-
-            logger.info(f"Attempting to update DynamoDB item with Key: user='{user}', file_id='{file_id}'")
-            logger.debug(f"UpdateExpression: {update_expression}")
-            logger.debug(f"ExpressionAttributeValues: {expression_attribute_values}")
+                self._write_batches()
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                self._abandon(e)
+            self._remove_spool()
+        else:
+            return None
+        return None if self.failed else self._file.name
+
+    def close(self):
+        if self._writer is not None and self._writer.is_open:
+            self._writer.close()
+        self._remove_spool()
+        self._file.close() # Supprime le fichier temporaire
+
+
+def new_columnar_copy():
+    """ColumnarCopyWriter, ou None si pyarrow n'est pas disponible."""
+    if load_pyarrow() is None:
+        logger.warning("pyarrow not available, skipping columnar copy.")
+        return None
+    return ColumnarCopyWriter()
+
+
+def upload_columnar_copy(bucket_name, key, columnar_copy):
+    """Téléverse la copie Parquet écrite pendant le parsing à côté de la clé originale et renvoie sa clé S3.
+
+    Renvoie None si la copie a été abandonnée : le webservice retombe alors sur le fichier brut.
+    """
+    path = columnar_copy.finish()
+    if path is None:
+        return None
+    columnar_key = derived_key_for(key, COLUMNAR_SUFFIX)
+    s3_client.upload_file(path, bucket_name, columnar_key)
+    logger.info(f"Columnar copy written to s3://{bucket_name}/{columnar_key}")
+    return columnar_key
+
+
+class RecordMetrics:
+    """Durées des étapes du traitement d'un fichier, octets lus et lignes parsées."""
+
+    def __init__(self):
+        self.file_format = "unknown"
+        self.durations_ms = {}
+        self.bytes_processed = 0
+        self.rows_parsed = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations_ms[name] = self.durations_ms.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def emit(self):
+        """Écrit une ligne EMF sur la sortie standard : CloudWatch en tire une distribution (percentiles) par métrique.
+
+        La ligne doit être du JSON brut, sans le préfixe ajouté par le logger du runtime.
+        """
+        if not EMIT_METRICS or not self.durations_ms:
+            return
+        values = {f"{name}_ms": round(duration, 3) for name, duration in self.durations_ms.items()}
+        units = {name: "Milliseconds" for name in values}
+        values.update(BytesProcessed=self.bytes_processed, RowsParsed=self.rows_parsed)
+        units.update(BytesProcessed="Bytes", RowsParsed="Count")
+        line = json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["FileFormat"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in units.items()],
+                }],
+            },
+            "FileFormat": self.file_format,
+            **values,
+        })
+        # EMF doit aller tel quel sur stdout : passé par logging, la ligne serait préfixée (horodatage,
+        # niveau, request id) et CloudWatch ne l'extrairait plus. Un seul write par ligne, newline
+        # compris : print() écrit la fin de ligne à part et les records traités en parallèle
+        # (RECORD_WORKERS) pourraient entrelacer leurs lignes.
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+class RecordProcessingError(Exception):
+    """Échec transitoire d'un record, à retenter (throttling, erreur 5xx ou réseau d'AWS)."""
+
+
+# Codes d'erreur AWS qui peuvent disparaître en retentant ; les autres (NoSuchKey, ValidationException...) sont définitifs
+TRANSIENT_ERROR_CODES = frozenset([
+    "ProvisionedThroughputExceededException", "ThrottlingException", "Throttling", "RequestLimitExceeded",
+    "SlowDown", "InternalError", "InternalServerError", "ServiceUnavailable", "RequestTimeout", "RequestTimeoutException",
+])
+
+
+def is_transient_error(error):
+    """Vrai si l'erreur vient d'AWS et peut disparaître en retentant le record."""
+    if isinstance(error, (HTTPClientError, BotoConnectionError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status_code = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return code in TRANSIENT_ERROR_CODES or status_code >= 500
+    return False
+
+
+def update_file_item(user, file_id, update_expression_parts, expression_attribute_values):
+    """Met à jour l'item DynamoDB du fichier (TypeError si une valeur n'est pas sérialisable)."""
+    update_expression = ", ".join(update_expression_parts)
+    logger.debug(f"UpdateExpression: {update_expression}")
+    logger.debug(f"ExpressionAttributeValues: {expression_attribute_values}")
+    return dynamodb_client.update_item(
+        TableName=FILES_DYNAMO_TABLE_NAME,
+        Key={
+            'user': {'S': user},
+            'id': {'S': file_id} # Notre clé de tri pour la table des fichiers
+        },
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues={name: _serializer.serialize(value) for name, value in expression_attribute_values.items()},
+        ReturnValues="UPDATED_NEW"
+    )
+
+
+def process_s3_record(s3_record, metrics=None):
+    """Traite une notification S3 : extraction des métadonnées, objets dérivés, mise à jour de l'item.
+
+    Lève RecordProcessingError si le record doit être retenté, c'est-à-dire seulement pour une
+    erreur transitoire d'AWS. Un fichier absent ou illisible, ou des métadonnées refusées par
+    DynamoDB, ne sont pas retentés : un statut d'erreur est enregistré sur l'item. Les durées
+    des étapes sont relevées dans metrics (le téléchargement d'un CSV se fait en flux pendant son parsing).
+    """
+    metrics = metrics or RecordMetrics()
+    processing_status = "processed_with_metadata" # Statut par défaut
+    extracted_metadata = {}
+
+    s3_data = s3_record.get("s3", {})
+    bucket_name = s3_data.get("bucket", {}).get("name")
+    object_key = s3_data.get("object", {}).get("key")
+
+    if not bucket_name or not object_key:
+        logger.warning(f"Skipping record due to missing bucket name or object key: {s3_record}")
+        return
+
+    key = unquote_plus(object_key)
+    if key.endswith(DERIVED_SUFFIXES):
+        # Nos propres objets dérivés redéclenchent la notification S3
+        logger.info(f"Skipping derived object s3://{bucket_name}/{key}")
+        return
+    logger.info(f"Processing object s3://{bucket_name}/{key}")
+    parts = key.split('/')
+    if len(parts) < 4 or parts[0] != "user_uploads":
+        logger.error(f"Invalid key format: '{key}'. Expected 'user_uploads/user/file_id/filename'. Skipping.")
+        return
+
+    user = parts[1]
+    file_id = parts[2]
+    # s3_filename = parts[3] # Peut être utile pour le logging
+
+    logger.info(f"Extracted from key: user='{user}', file_id='{file_id}'")
+
+    # Télécharger le fichier depuis S3
+    try:
+        with metrics.stage("s3_get_object"):
+            s3_object = s3_client.get_object(Bucket=bucket_name, Key=key)
+        file_content_stream = s3_object['Body'] # Ceci est un flux
+        metrics.bytes_processed = s3_object.get('ContentLength', 0)
+    except (ClientError, HTTPClientError, BotoConnectionError) as e:
+        logger.error(f"S3 GetObject error for key '{key}': {e}", exc_info=True)
+        if is_transient_error(e):
+            raise RecordProcessingError(f"error_s3_read for s3://{bucket_name}/{key}") from e
+        # Objet supprimé entre-temps ou inaccessible : retenter ne changerait rien
+        record_error_status(user, file_id, "error_s3_read")
+        return
+
+    # Déterminer le type de fichier et extraire les métadonnées
+    headers = None
+    num_rows = 0
+    num_cols = 0
+    dialect = None
+    spooled_file = None
+    profile = None
+    columnar_copy = None
+    with_profile = metrics.bytes_processed <= PROFILE_MAX_BYTES
+    if not with_profile:
+        logger.info(f"Object s3://{bucket_name}/{key} is larger than {PROFILE_MAX_BYTES} bytes, skipping column profile.")
 
+    try:
+        if key.lower().endswith('.csv'):
+            logger.info(f"Processing as CSV: {key}")
+            metrics.file_format = 'csv'
+            columnar_copy = new_columnar_copy()
+            with metrics.stage("parse"):
+                headers, num_rows, num_cols, dialect, profile = extract_csv_metadata(file_content_stream, with_profile, columnar_copy)
+        elif key.lower().endswith('.xlsx'):
+            if not load_openpyxl():
+                 logger.error("openpyxl not available, cannot process .xlsx file.")
+                 processing_status = "error_missing_dependency_xlsx"
+                 raise RuntimeError("openpyxl not available")
+            logger.info(f"Processing as Excel (xlsx): {key}")
+            metrics.file_format = 'xlsx'
+            # openpyxl a besoin d'un fichier seekable : on télécharge sur disque plutôt qu'en mémoire
+            file_content_stream.close()
+            with metrics.stage("s3_download"):
+                spooled_file = spool_to_tempfile(bucket_name, key)
+            columnar_copy = new_columnar_copy()
+            with metrics.stage("parse"):
+                headers, num_rows, num_cols, profile = extract_excel_metadata(spooled_file, with_profile, columnar_copy)
+        else:
+            logger.warning(f"Unsupported file type for key: {key}. Skipping metadata extraction.")
+            processing_status = "unsupported_file_type"
+            # Pas besoin de 'return' ici si on veut quand même mettre à jour DynamoDB avec ce statut
+        
+        if headers is not None: # Si le parsing a réussi
+            metrics.rows_parsed = num_rows
+            extracted_metadata = {
+                'columnHeaders': headers,
+                'rowCount': num_rows,
+                'columnCount': num_cols
+            }
+            if dialect:
+                extracted_metadata['csvDialect'] = dialect
+            logger.info(f"Extracted metadata for {key}: Rows={num_rows}, Cols={num_cols}, Headers={headers[:5]}...") # Log seulement les premiers headers
+
+            # La copie colonnaire, écrite pendant le parsing, est une optimisation : son échec ne doit pas faire échouer le record
+            try:
+                columnar_key = None
+                if columnar_copy is not None:
+                    with metrics.stage("columnar_copy"):
+                        columnar_key = upload_columnar_copy(bucket_name, key, columnar_copy)
+                if columnar_key:
+                    extracted_metadata['columnarObjectKey'] = columnar_key
+            except Exception as e:
+                logger.error(f"Failed to write columnar copy for {key}: {e}", exc_info=True)
             try:
-                update_response = files_table.update_item(
-                    Key={
-                        'user': user,
-                        'id': file_id # Notre clé de tri pour la table des fichiers
-                    },
-                    UpdateExpression=update_expression,
-                    ExpressionAttributeValues=expression_attribute_values,
-                    ReturnValues="UPDATED_NEW"
-                )
-                logger.info(f"DynamoDB update successful for file (identified by id='{file_id}'). Updated attributes: {update_response.get('Attributes')}")
-
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'ConditionalCheckFailedException': # Ne devrait pas arriver sans ConditionExpression
-                    logger.error(f"DynamoDB update failed for file '{file_id}': Item does not exist.", exc_info=True)
-                else:
-                    logger.error(f"DynamoDB ClientError updating file '{file_id}': {e}", exc_info=True)
-                # Si la mise à jour DynamoDB échoue, l'erreur est loggée, on passe au record suivant.
-                continue 
+                if profile is not None:
+                    with metrics.stage("write_profile"):
+                        extracted_metadata['profileObjectKey'] = write_profile(bucket_name, key, profile)
             except Exception as e:
-                logger.error(f"Unexpected error updating DynamoDB for file '{file_id}': {e}", exc_info=True)
-                continue
+                logger.error(f"Failed to write column profile for {key}: {e}", exc_info=True)
+
+    except Exception as e: # Erreur pendant le parsing du fichier
+        if is_transient_error(e):
+            # Lecture du flux ou téléchargement S3 interrompu : le fichier n'est pas en cause
+            logger.warning(f"Transient error while reading {key}, the record will be retried: {e}")
+            raise RecordProcessingError(f"Transient error reading s3://{bucket_name}/{key}") from e
+        logger.error(f"Failed to parse file content for {key}: {e}", exc_info=True)
+        if processing_status == "processed_with_metadata":
+            processing_status = "error_parsing_file"
+        # On continue pour mettre à jour DynamoDB avec ce statut d'erreur
+    finally:
+        if spooled_file is not None:
+            spooled_file.close() # Supprime le fichier temporaire de /tmp
+        if columnar_copy is not None:
+            columnar_copy.close()
+
+    # Mettre à jour l'item dans DynamoDB
+    update_expression_parts = ["SET processingStatus = :ps"]
+    expression_attribute_values = {':ps': processing_status}
+
+    s3_etag = s3_data.get("object", {}).get("eTag")
+    if s3_etag: # Version de l'objet source, utilisée par le webservice pour invalider ses caches
+        update_expression_parts.append("s3ETag = :et")
+        expression_attribute_values[':et'] = s3_etag.strip('"')
+    
+    if extracted_metadata: # N'ajouter que si on a des métadonnées
+        update_expression_parts.append("columnHeaders = :ch")
+        expression_attribute_values[':ch'] = extracted_metadata.get('columnHeaders', [])
+        update_expression_parts.append("rowCount = :rc")
+        expression_attribute_values[':rc'] = extracted_metadata.get('rowCount', 0)
+        update_expression_parts.append("columnCount = :cc")
+        expression_attribute_values[':cc'] = extracted_metadata.get('columnCount', 0)
+        update_expression_parts.append("processedTimestamp = :pt") # Ajouter un timestamp de traitement
+        expression_attribute_values[':pt'] = datetime.datetime.utcnow().isoformat()
+        if extracted_metadata.get('columnarObjectKey'):
+            update_expression_parts.append("columnarObjectKey = :ck")
+            expression_attribute_values[':ck'] = extracted_metadata['columnarObjectKey']
+        if extracted_metadata.get('profileObjectKey'):
+            update_expression_parts.append("profileObjectKey = :pk")
+            expression_attribute_values[':pk'] = extracted_metadata['profileObjectKey']
+        if extracted_metadata.get('csvDialect'):
+            # Réutilisé par le webservice pour un parsing unique, sans re-détection
+            update_expression_parts.append("csvDialect = :cd")
+            expression_attribute_values[':cd'] = extracted_metadata['csvDialect']
+
+
+    logger.info(f"Attempting to update DynamoDB item with Key: user='{user}', file_id='{file_id}'")
+    try:
+        with metrics.stage("dynamodb_update"):
+            update_response = update_file_item(user, file_id, update_expression_parts, expression_attribute_values)
+        logger.info(f"DynamoDB update successful for file (identified by id='{file_id}'). Updated attributes: {update_response.get('Attributes')}")
+    except (ClientError, HTTPClientError, BotoConnectionError, TypeError) as e:
+        logger.error(f"DynamoDB error updating file '{file_id}': {e}", exc_info=True)
+        if is_transient_error(e):
+            raise RecordProcessingError(f"DynamoDB update failed for file '{file_id}'") from e
+        # Valeur non sérialisable (TypeError), item trop gros... : un nouvel essai échouerait de même
+        record_error_status(user, file_id, "error_saving_metadata")
+
+
+def record_error_status(user, file_id, processing_status):
+    """Enregistre seulement le statut d'erreur d'un fichier qu'il est inutile de retraiter."""
+    try:
+        update_file_item(user, file_id, ["SET processingStatus = :ps"], {':ps': processing_status})
+    except (ClientError, HTTPClientError, BotoConnectionError) as e:
+        if is_transient_error(e):
+            raise RecordProcessingError(f"Could not record status '{processing_status}' for file '{file_id}'") from e
+        logger.error(f"Could not record status '{processing_status}' for file '{file_id}': {e}", exc_info=True)
 
-        except Exception as e: # Erreur générale de traitement d'un record
-            logger.error(f"Error processing record: {record}. Error: {e}", exc_info=True)
-            # Pourrait envoyer à une Dead Letter Queue (DLQ) si configuré
-            continue
 
+def iter_s3_records(record):
+    """Notifications S3 contenues dans un record : directement, ou dans le corps d'un message SQS."""
+    if record.get("eventSource") == "aws:sqs":
+        body = json.loads(record.get("body") or "{}")
+        return body.get("Records", []) # Un événement de test S3 (s3:TestEvent) n'a pas de Records
+    return [record]
+
+
+def record_identifier(record):
+    """Identifiant d'un record dans batchItemFailures : messageId SQS, sinon la clé de l'objet S3."""
+    if record.get("eventSource") == "aws:sqs":
+        return record.get("messageId")
+    return record.get("s3", {}).get("object", {}).get("key")
+
+
+def process_record(record):
+    """Traite un record en journalisant sa durée ; toute exception signale un échec à retenter."""
+    start = time.perf_counter()
+    try:
+        for s3_record in iter_s3_records(record):
+            metrics = RecordMetrics()
+            try:
+                process_s3_record(s3_record, metrics)
+            finally:
+                metrics.emit()
+    finally:
+        logger.info(f"Record {record_identifier(record)} processed in {time.perf_counter() - start:.3f} s")
+
+
+def lambda_handler(event, context):
+    if not FILES_DYNAMO_TABLE_NAME:
+        logger.error("DynamoDB files table is not configured. Aborting.")
+        return {'statusCode': 500, 'body': json.dumps('Internal server error: Files table not configured or initialization failed')}
+
+    records = event.get("Records", [])
+    failures = []
+    start = time.perf_counter()
+    # Les records sont traités en parallèle : la durée d'un lot est celle de son record le plus lent
+    with ThreadPoolExecutor(max_workers=max(1, min(RECORD_WORKERS, len(records))), thread_name_prefix="record") as executor:
+        futures = {executor.submit(process_record, record): record for record in records}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e: # Erreur de traitement d'un record
+                record = futures[future]
+                logger.error(f"Error processing record {record_identifier(record)}: {e}", exc_info=True)
+                failures.append({'itemIdentifier': record_identifier(record)})
+    logger.info(f"Processed {len(records)} records in {time.perf_counter() - start:.3f} s, {len(failures)} failed.")
+
+    if records and all(record.get("eventSource") == "aws:sqs" for record in records):
+        # Réponse partielle de lot : seuls les messages en échec sont rendus à la file
+        return {'batchItemFailures': failures}
     return {
         'statusCode': 200,
-        'body': json.dumps('Finished processing S3 event for file metadata.')
+        'body': json.dumps('Finished processing S3 event for file metadata.'),
+        'batchItemFailures': failures,
     }
@@ -0,0 +1,200 @@
+"""Téléchargement S3 par plages d'octets parallèles pour les gros objets.
+
+Partagé par la Lambda et le webservice. La première requête demande les
+RANGED_DOWNLOAD_THRESHOLD premiers octets : un objet plus petit est ainsi lu en un
+seul flux, sans requête supplémentaire. Au-delà, la taille totale (Content-Range)
+permet de préallouer la destination, et les plages restantes sont récupérées en
+parallèle sur un pool borné puis écrites directement à leur position, sans
+concaténation de morceaux.
+"""
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+
+RANGED_DOWNLOAD_THRESHOLD = int(os.getenv("RANGED_DOWNLOAD_THRESHOLD", str(16 * 1024 * 1024)))
+RANGED_DOWNLOAD_PART_SIZE = int(os.getenv("RANGED_DOWNLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+RANGED_DOWNLOAD_WORKERS = int(os.getenv("RANGED_DOWNLOAD_WORKERS", "8"))
+# Taille des lectures sur chaque flux HTTP
+READ_CHUNK_SIZE = 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Pool partagé par tous les téléchargements du processus : le parallélisme total reste borné."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RANGED_DOWNLOAD_WORKERS, thread_name_prefix="s3-range")
+        return _executor
+
+
+def _total_size(response):
+    """Taille totale de l'objet d'après la réponse à la première requête."""
+    match = _CONTENT_RANGE.match(response.get('ContentRange') or '')
+    if match:
+        return int(match.group(1))
+    return response['ContentLength'] # Plage ignorée (réponse 200) : l'objet entier est renvoyé
+
+
+def _copy_body(body, write, offset):
+    """Recopie un flux HTTP à partir de offset et renvoie la position atteinte."""
+    while True:
+        chunk = body.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return offset
+        write(offset, chunk)
+        offset += len(chunk)
+
+
+def _fetch_range(s3_client, bucket, key, etag, start, end, write):
+    # IfMatch garantit que toutes les plages proviennent de la même version de l'objet
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+    reached = _copy_body(response['Body'], write, start)
+    if reached != end + 1:
+        raise IOError(f"Incomplete range {start}-{end} for s3://{bucket}/{key}: got {reached - start} bytes")
+
+
+def _download(s3_client, bucket, key, allocate, write, threshold, part_size):
+    """Télécharge l'objet dans la destination renvoyée par allocate(taille), via write(offset, données).
+
+    Renvoie None si l'objet tient dans la première requête : son corps est alors renvoyé tel quel.
+    """
+    try:
+        first = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{threshold - 1}")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidRange':
+            raise
+        # Objet vide : aucune plage n'est satisfaisable
+        return s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    total = _total_size(first)
+    if total <= threshold or first.get('ContentRange') is None:
+        return first['Body']
+
+    allocate(total)
+    executor = _get_executor()
+    futures = [
+        executor.submit(_fetch_range, s3_client, bucket, key, first['ETag'], start, min(start + part_size, total) - 1, write)
+        for start in range(threshold, total, part_size)
+    ]
+    try:
+        # Le début de l'objet est lu par le thread appelant pendant que le pool récupère la suite
+        reached = _copy_body(first['Body'], write, 0)
+        if reached != threshold:
+            raise IOError(f"Incomplete first range for s3://{bucket}/{key}: got {reached} bytes")
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    for future in futures:
+        future.result() # Propage la première erreur
+    return None
+
+
+def download_to_buffer(s3_client, bucket, key, threshold=None, part_size=None):
+    """Télécharge un objet en mémoire et renvoie ses octets (bytes, ou bytearray préalloué s'il est gros)."""
+    threshold = threshold or RANGED_DOWNLOAD_THRESHOLD
+    part_size = part_size or RANGED_DOWNLOAD_PART_SIZE
+    target = {}
+
+    def allocate(size):
+        target['buffer'] = bytearray(size)
+        target['view'] = memoryview(target['buffer'])
+
+    def write(offset, data):
+        target['view'][offset:offset + len(data)] = data
+
+    body = _download(s3_client, bucket, key, allocate, write, threshold, part_size)
+    if body is not None:
+        return body.read()
+    target['view'].release()
+    return target['buffer']
+
+
+def download_to_file(s3_client, bucket, key, fileobj, threshold=None, part_size=None):
+    """Télécharge un objet dans un fichier ouvert en écriture binaire et le rembobine.
+
+    Le fichier est préalloué à la taille de l'objet et chaque plage y est écrite à sa
+    position (os.pwrite), ce qui permet l'écriture concurrente sans verrou.
+    """
+    threshold = threshold or RANGED_DOWNLOAD_THRESHOLD
+    part_size = part_size or RANGED_DOWNLOAD_PART_SIZE
+    fileobj.flush()
+    fd = fileobj.fileno()
+
+    def write(offset, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+
+    def allocate(size):
+        os.ftruncate(fd, size)
+
+    body = _download(s3_client, bucket, key, allocate, write, threshold, part_size)
+    if body is not None:
+        _copy_body(body, write, 0)
+    fileobj.seek(0)
+    return fileobj
+
+
+class S3RangeReader(io.RawIOBase):
+    """Fichier en lecture seule et seekable sur un objet S3, chaque read() étant une requête par plage.
+
+    Permet à pyarrow de ne lire que le pied de page et les colonnes utiles d'un Parquet,
+    sans télécharger l'objet entier.
+    """
+
+    def __init__(self, s3_client, bucket, key):
+        super().__init__()
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._key = key
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        self._size = head['ContentLength']
+        self._etag = head['ETag']
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def size(self):
+        return self._size
+
+    def read(self, size=-1):
+        end = self._size if size is None or size < 0 else min(self._size, self._position + size)
+        if end <= self._position:
+            return b''
+        response = self._s3_client.get_object(
+            Bucket=self._bucket, Key=self._key, Range=f"bytes={self._position}-{end - 1}", IfMatch=self._etag,
+        )
+        data = response['Body'].read()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
@@ -35,6 +35,7 @@ source venv/bin/activate
 rm .env
 echo 'BUCKET={bucket}' >> .env
 echo 'DYNAMO_TABLE={dynamo_table}' >> .env
+echo "WEB_WORKERS=$(nproc)" >> .env
 pip3 install -r requirements.txt
 venv/bin/python app.py
 echo "userdata-end""".encode("ascii")).decode("ascii")
@@ -1,16 +1,25 @@
 #!/usr/bin/env python
 from constructs import Construct
-from cdktf import App, TerraformStack, TerraformOutput, TerraformAsset, AssetType
+from cdktf import App, TerraformStack, TerraformOutput, TerraformAsset, AssetType, Fn
 from cdktf_cdktf_provider_aws.provider import AwsProvider
 from cdktf_cdktf_provider_aws.default_vpc import DefaultVpc
 from cdktf_cdktf_provider_aws.default_subnet import DefaultSubnet
 from cdktf_cdktf_provider_aws.lambda_function import LambdaFunction
-from cdktf_cdktf_provider_aws.lambda_permission import LambdaPermission
+from cdktf_cdktf_provider_aws.lambda_event_source_mapping import LambdaEventSourceMapping
+from cdktf_cdktf_provider_aws.sqs_queue import SqsQueue
+from cdktf_cdktf_provider_aws.sqs_queue_policy import SqsQueuePolicy
 from cdktf_cdktf_provider_aws.data_aws_caller_identity import DataAwsCallerIdentity
 from cdktf_cdktf_provider_aws.s3_bucket import S3Bucket
 from cdktf_cdktf_provider_aws.s3_bucket_cors_configuration import S3BucketCorsConfiguration, S3BucketCorsConfigurationCorsRule
-from cdktf_cdktf_provider_aws.s3_bucket_notification import S3BucketNotification, S3BucketNotificationLambdaFunction
-from cdktf_cdktf_provider_aws.dynamodb_table import DynamodbTable, DynamodbTableAttribute
+from cdktf_cdktf_provider_aws.s3_bucket_notification import S3BucketNotification, S3BucketNotificationQueue
+from cdktf_cdktf_provider_aws.dynamodb_table import DynamodbTable, DynamodbTableAttribute, DynamodbTableGlobalSecondaryIndex
+
+# Layer gérée par AWS (AWS SDK for pandas) qui fournit pyarrow à la Lambda pour écrire
+# la copie colonnaire des uploads. Adapter la version à celle publiée dans la région.
+pandas_layer_arn = "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python310:19"
+# Parsing et profil par morceaux d'un CSV de plusieurs centaines de Mo : 60 s ne suffisent pas.
+# Les fichiers au-delà de PROFILE_MAX_BYTES (lambda_function.py) ne sont que parsés.
+lambda_timeout_seconds = 300
 
 class ServerlessStack(TerraformStack):
     def __init__(self, scope: Construct, id: str):
@@ -42,7 +51,24 @@ class ServerlessStack(TerraformStack):
             attribute=[
                 DynamodbTableAttribute(name="user",type="S" ),
                 DynamodbTableAttribute(name="id",type="S" ),
+                DynamodbTableAttribute(name="upload_timestamp",type="S" ),
             ],
+            # Liste des fichiers d'un utilisateur triée par date d'upload (timestamp ISO 8601, donc
+            # triable comme chaîne) : le webservice lit une page à la fois du plus récent au plus ancien.
+            # La projection se limite aux attributs des lignes de la liste (FILE_LIST_ATTRIBUTES
+            # dans webservice/app.py), sans les en-têtes de colonnes.
+            global_secondary_index=[DynamodbTableGlobalSecondaryIndex(
+                name="user-upload_timestamp-index",
+                hash_key="user",
+                range_key="upload_timestamp",
+                projection_type="INCLUDE",
+                non_key_attributes=[
+                    "original_filename", "s3_object_key", "file_type", "file_size", "status",
+                    "rowCount", "columnCount", "processingStatus", "processedTimestamp",
+                ],
+                read_capacity=5,
+                write_capacity=5,
+            )],
             billing_mode="PROVISIONED",
             read_capacity=5,
             write_capacity=5
@@ -70,8 +96,9 @@ class ServerlessStack(TerraformStack):
             self, "lambda",
             function_name="file-processor-lambda",
             runtime="python3.10",
-            memory_size=128,
-            timeout=60,
+            memory_size=512, # pyarrow ne tient pas dans 128 Mo
+            timeout=lambda_timeout_seconds,
+            layers=[pandas_layer_arn],
             role=f"arn:aws:iam::{account_id}:role/LabRole",
             source_code_hash=code.asset_hash,
             filename=code.path,
@@ -82,31 +109,69 @@ class ServerlessStack(TerraformStack):
             }}
         )
 
-        # NE PAS TOUCHER !!!!
-        permission = LambdaPermission(
-            self, "lambda_permission",
-            action="lambda:InvokeFunction",
-            statement_id="AllowExecutionFromS3Bucket",
+        # File d'ingestion : le bucket y publie ses notifications ObjectCreated (format des événements S3).
+        # La Lambda traite les messages d'un lot en parallèle et ne rend à la file que ceux en échec
+        # (ReportBatchItemFailures) ; après 3 échecs un message part dans la file de lettres mortes.
+        ingest_dead_letter_queue = SqsQueue(
+            self, "ingest_dead_letter_queue",
+            name="file-processor-dlq",
+            message_retention_seconds=14 * 24 * 3600
+        )
+        ingest_queue = SqsQueue(
+            self, "ingest_queue",
+            name="file-processor-queue",
+            visibility_timeout_seconds=6 * lambda_timeout_seconds, # 6 fois le timeout de la Lambda, recommandation AWS
+            redrive_policy=Fn.jsonencode({
+                "deadLetterTargetArn": ingest_dead_letter_queue.arn,
+                "maxReceiveCount": 3,
+            })
+        )
+        LambdaEventSourceMapping(
+            self, "ingest_queue_mapping",
+            event_source_arn=ingest_queue.arn,
             function_name=lambda_function.arn,
-            principal="s3.amazonaws.com",
-            source_arn=bucket.arn,
-            source_account=account_id,
-            depends_on=[lambda_function, bucket]
+            batch_size=10,
+            maximum_batching_window_in_seconds=5,
+            function_response_types=["ReportBatchItemFailures"]
+        )
+        TerraformOutput(
+            self, "ingest_queue_url_output",
+            value=ingest_queue.url,
+            description="URL of the SQS ingest queue"
         )
 
-        #NE PAS TOUCHER !!!!
+        # Seul le bucket peut publier dans la file
+        queue_policy = SqsQueuePolicy(
+            self, "ingest_queue_policy",
+            queue_url=ingest_queue.url,
+            policy=Fn.jsonencode({
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "AllowS3BucketNotifications",
+                    "Effect": "Allow",
+                    "Principal": {"Service": "s3.amazonaws.com"},
+                    "Action": "sqs:SendMessage",
+                    "Resource": ingest_queue.arn,
+                    "Condition": {
+                        "ArnEquals": {"aws:SourceArn": bucket.arn},
+                        "StringEquals": {"aws:SourceAccount": account_id},
+                    },
+                }],
+            })
+        )
+
+        # Chaque upload passe par la file : les échecs transitoires sont retentés, puis isolés dans la DLQ
         notification = S3BucketNotification(
             self, "notification",
-            lambda_function=[S3BucketNotificationLambdaFunction(
-                lambda_function_arn=lambda_function.arn,
+            queue=[S3BucketNotificationQueue(
+                queue_arn=ingest_queue.arn,
                 events=["s3:ObjectCreated:*"]
             )],
             bucket=bucket.id,
-            depends_on=[permission]
+            depends_on=[queue_policy]
         )
 
 
-
 app = App()
 ServerlessStack(app, "cdktf_serverless")
 app.synth()
@@ -0,0 +1,35 @@
+"""Encodage deviné sur le préfixe : un octet invalide plus loin ne doit pas faire échouer le fichier."""
+import boto3
+
+from aws_standin import TABLE, put_file
+
+USER = "tests-encoding"
+HEADERS = {"Authorization": USER}
+
+
+def late_latin1_csv(prefix_bytes):
+    """CSV ASCII dont le seul octet non UTF-8 (é en latin-1) se trouve après le préfixe de détection."""
+    rows = [b"city,value\n"]
+    size = len(rows[0])
+    while size <= prefix_bytes:
+        rows.append(b"paris,1\n")
+        size += len(rows[-1])
+    rows.append(b"s\xe9te,2\nlyon,3\n")
+    return b"".join(rows), len(rows)
+
+
+def test_invalid_byte_after_prefix(client, webservice, ingest):
+    content, n_rows = late_latin1_csv(webservice.DIALECT_PREFIX_BYTES)
+    key = put_file(USER, "late-latin1", "late.csv", content)
+    ingest(key)
+
+    item = boto3.resource("dynamodb").Table(TABLE).get_item(Key={"user": USER, "id": "late-latin1"})["Item"]
+    assert item["processingStatus"] == "processed_with_metadata", item["processingStatus"]
+    assert int(item["rowCount"]) == n_rows
+
+    exact = client.get("/files/late-latin1/statistics/value", params={"mode": "exact"}, headers=HEADERS)
+    assert exact.status_code == 200, exact.text
+    assert exact.json()["count"] == n_rows
+    auto = client.get("/files/late-latin1/statistics/city", headers=HEADERS)
+    assert auto.status_code == 200, auto.text
+    assert auto.json()["count"] == n_rows
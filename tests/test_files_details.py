@@ -0,0 +1,51 @@
+"""POST /files/details : lecture groupée des items DynamoDB."""
+import pytest
+
+from aws_standin import put_file
+
+USER = "tests-details"
+HEADERS = {"Authorization": USER}
+
+
+@pytest.fixture
+def throttled_batch_get(webservice, monkeypatch):
+    """batch_get_item qui laisse toutes les clés non traitées pendant les `throttled` premiers appels."""
+    original = webservice.dynamodb_resource.batch_get_item
+    calls = {"count": 0, "throttled": 0}
+
+    def batch_get_item(RequestItems):
+        calls["count"] += 1
+        if calls["count"] <= calls["throttled"]:
+            return {"Responses": {}, "UnprocessedKeys": RequestItems}
+        return original(RequestItems=RequestItems)
+
+    def no_blocking_sleep(seconds):
+        raise AssertionError("backoff must not block a thread")
+
+    monkeypatch.setattr(webservice.dynamodb_resource, "batch_get_item", batch_get_item)
+    monkeypatch.setattr(webservice.time, "sleep", no_blocking_sleep)
+    return calls
+
+
+def test_unprocessed_keys_are_retried(client, throttled_batch_get):
+    for file_id in ("retry-a", "retry-b"):
+        put_file(USER, file_id, f"{file_id}.csv", b"a\n1\n")
+    throttled_batch_get["throttled"] = 2
+
+    response = client.post("/files/details", json={"file_ids": ["retry-b", "retry-a"]}, headers=HEADERS)
+
+    assert response.status_code == 200, response.text
+    assert [f["file_id"] for f in response.json()] == ["retry-b", "retry-a"]
+    assert throttled_batch_get["count"] == 3
+
+
+def test_keys_left_unprocessed_return_503(client, webservice, throttled_batch_get):
+    put_file(USER, "throttled", "throttled.csv", b"a\n1\n")
+    throttled_batch_get["throttled"] = webservice.BATCH_GET_MAX_ATTEMPTS
+
+    response = client.post("/files/details", json={"file_ids": ["throttled"]}, headers=HEADERS)
+
+    assert response.status_code == 503
+    assert "throttled" in response.json()["detail"]
+    assert response.headers["retry-after"] == "1"
+    assert throttled_batch_get["count"] == webservice.BATCH_GET_MAX_ATTEMPTS
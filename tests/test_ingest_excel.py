@@ -0,0 +1,44 @@
+"""Ingestion d'un classeur Excel : copie colonnaire écrite lot par lot."""
+import io
+
+import boto3
+import openpyxl
+import pyarrow.parquet as pq
+
+from aws_standin import BUCKET, TABLE, import_lambda, put_file
+
+USER = "tests-excel"
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def workbook_bytes(rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_columnar_copy_promotes_types_across_batches(ingest, monkeypatch, tmp_path):
+    lambda_function = import_lambda()
+    monkeypatch.setattr(lambda_function, "EXCEL_BATCH_ROWS", 10)
+    monkeypatch.setattr(lambda_function.tempfile, "tempdir", str(tmp_path))
+    # late : vide dans le premier lot ; amount : entiers puis décimaux ; label : texte
+    rows = [("late", "amount", "label")]
+    rows += [(None, i, f"row {i}") for i in range(10)]
+    rows += [(i, i + 0.5, f"row {i}") for i in range(10, 25)]
+    key = put_file(USER, "batches", "batches.xlsx", workbook_bytes(rows), file_type=XLSX_TYPE)
+
+    ingest(key)
+
+    item = boto3.resource("dynamodb").Table(TABLE).get_item(Key={"user": USER, "id": "batches"})["Item"]
+    assert item["processingStatus"] == "processed_with_metadata"
+    copy = boto3.client("s3").get_object(Bucket=BUCKET, Key=item["columnarObjectKey"])["Body"].read()
+    table = pq.read_table(io.BytesIO(copy))
+    assert [str(field.type) for field in table.schema] == ["int64", "double", "string"]
+    assert table.num_rows == 25
+    assert table.column("amount").to_pylist()[9:11] == [9.0, 10.5]
+    # Les lots intermédiaires ne restent pas dans /tmp
+    assert not any(path.name.startswith("columnar-batches-") for path in tmp_path.iterdir())
@@ -0,0 +1,14 @@
+"""Cache des items DynamoDB : seuls les statuts finaux écrits par la Lambda sont mis en cache."""
+import re
+
+from aws_standin import REPO_ROOT
+
+
+def test_every_status_written_by_the_lambda_is_final(webservice):
+    source = (REPO_ROOT / "terraform" / "lambda" / "lambda_function.py").read_text(encoding="utf-8")
+    written = set(re.findall(r'processing_status = "(\w+)"', source))
+    written |= set(re.findall(r'record_error_status\(user, file_id, "(\w+)"\)', source))
+    assert "error_saving_metadata" in written
+    for status in written:
+        assert webservice.metadata_cache.is_cacheable({"processingStatus": status}), status
+    assert not webservice.metadata_cache.is_cacheable({"processingStatus": "pending_lambda"})
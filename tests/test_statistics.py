@@ -0,0 +1,96 @@
+"""Statistiques descriptives : endpoint par colonne et endpoint par lot."""
+from aws_standin import put_file
+
+USER = "tests-statistics"
+HEADERS = {"Authorization": USER}
+BOOL_CSV = b"flag,value\nTrue,1\nFalse,2\nTrue,3\nTrue,4\nFalse,5\n"
+
+
+def test_bool_column_is_numeric_in_both_endpoints(client):
+    put_file(USER, "bool-file", "bool.csv", BOOL_CSV)
+
+    single = client.get("/files/bool-file/statistics/flag", params={"mode": "exact"}, headers=HEADERS)
+    batch = client.post("/files/bool-file/statistics", json={"columns": "all"}, headers=HEADERS)
+
+    assert single.status_code == 200, single.text
+    assert batch.status_code == 200, batch.text
+    flag = single.json()
+    assert flag["data_type_detected"] == "numeric"
+    assert flag["count"] == 5
+    assert flag["mean"] == 0.6
+    assert flag["median"] == 1.0
+    assert (flag["min_val"], flag["max_val"]) == (0.0, 1.0)
+    assert (flag["q1"], flag["q3"]) == (0.0, 1.0)
+    assert flag["unique_values_count"] == 2
+    assert batch.json()[0] == flag
+
+
+NUMERIC_CSV = b"age,score,city\n31,12.5,paris\n45,14.0,lyon\n27,9.5,paris\n52,16.0,rennes\n38,11.0,lyon\n"
+
+
+def test_batch_statistics_etag(client):
+    put_file(USER, "etag-file", "etag.csv", NUMERIC_CSV)
+
+    first = client.post("/files/etag-file/statistics", json={"columns": ["score", "age"]}, headers=HEADERS)
+    assert first.status_code == 200, first.text
+    etag = first.headers["etag"]
+
+    # Même ensemble de colonnes dans un autre ordre : même ETag, 304 sans corps
+    again = client.post("/files/etag-file/statistics", json={"columns": ["age", "score"]},
+                        headers={**HEADERS, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    other = client.post("/files/etag-file/statistics", json={"columns": ["age"]}, headers={**HEADERS, "If-None-Match": etag})
+    assert other.status_code == 200
+    assert other.headers["etag"] != etag
+
+
+def test_batch_statistics_from_profile(client, ingest, webservice, monkeypatch):
+    key = put_file(USER, "profiled-file", "profiled.csv", NUMERIC_CSV)
+    ingest(key)
+
+    async def no_data_load(*args, **kwargs):
+        raise AssertionError("statistics should come from the ingest profile")
+
+    monkeypatch.setattr(webservice, "get_dataframe_from_s3", no_data_load)
+    batch = client.post("/files/profiled-file/statistics", json={"columns": "all"}, headers=HEADERS)
+    assert batch.status_code == 200, batch.text
+    assert [s["variable_name"] for s in batch.json()] == ["age", "score", "city"]
+    for stats in batch.json():
+        single = client.get(f"/files/profiled-file/statistics/{stats['variable_name']}", headers=HEADERS)
+        assert single.json() == stats
+
+    monkeypatch.undo()
+    exact = client.post("/files/profiled-file/statistics", params={"exact": "true"}, json={"columns": ["age"]}, headers=HEADERS)
+    assert exact.status_code == 200, exact.text
+    assert exact.json()[0]["mean"] == 38.6
+
+
+def test_bool_column_profile_matches_exact(client, ingest):
+    key = put_file(USER, "bool-profiled", "bool.csv", BOOL_CSV)
+    ingest(key)
+
+    auto = client.get("/files/bool-profiled/statistics/flag", headers=HEADERS).json()
+    exact = client.get("/files/bool-profiled/statistics/flag", params={"mode": "exact"}, headers=HEADERS).json()
+
+    fields = ["data_type_detected", "count", "missing_values", "mean", "median", "min_val", "max_val", "q1", "q3", "unique_values_count"]
+    assert auto["data_type_detected"] == "numeric"
+    assert {f: auto[f] for f in fields} == {f: exact[f] for f in fields}
+
+
+def test_unknown_column_is_rejected_before_any_s3_read(client, ingest, webservice, monkeypatch):
+    key = put_file(USER, "typo-file", "typo.csv", NUMERIC_CSV)
+    ingest(key)
+
+    def no_s3_read(*args, **kwargs):
+        raise AssertionError("an unknown column must be rejected from the stored headers")
+
+    monkeypatch.setattr(webservice, "download_s3_object", no_s3_read)
+    monkeypatch.setattr(webservice, "load_profile", no_s3_read)
+    for path in ("/files/typo-file/statistics/agee", "/files/typo-file/graph-data/boxplot/agee"):
+        response = client.get(path, headers=HEADERS)
+        assert response.status_code == 404, response.text
+        assert response.json()["detail"] == "Variable 'agee' not found in the file."
+    batch = client.post("/files/typo-file/statistics", json={"columns": ["age", "agee"]}, headers=HEADERS)
+    assert batch.status_code == 404, batch.text
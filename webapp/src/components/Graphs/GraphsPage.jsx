@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import './GraphsPage.css';
-import { getUserFiles, fetchBoxplotData } from '../../services/apiService';
+import { getUserFiles, getFileDetails, fetchBoxplotData } from '../../services/apiService';
 import { Chart, registerables } from 'chart.js';
 import { BoxPlotController, BoxAndWiskers } from '@sgratzl/chartjs-chart-boxplot';
 
@@ -8,6 +8,11 @@ Chart.register(...registerables, BoxPlotController, BoxAndWiskers);
 
 // Le principe est que pour une variables selectionnée (colonnes du tableau deposé par l'utilisateur) on affiche le graphe de boxplot pour cette variable.
 
+const toFileOption = (f) => ({
+  id: f.file_id,
+  name: f.original_filename,
+});
+
 function GraphsPage() {
   const [userFiles, setUserFiles] = useState([]);
   const [selectedFileIdG, setSelectedFileIdG] = useState('');
@@ -19,6 +24,8 @@ function GraphsPage() {
   const chartInstanceRef = useRef(null); 
 
   const [isLoadingFiles, setIsLoadingFiles] = useState(false);
+  const [filesNextToken, setFilesNextToken] = useState(null); // Page suivante de la liste, null si tout est chargé
+  const [isLoadingMoreFiles, setIsLoadingMoreFiles] = useState(false);
   const [isLoadingGraphData, setIsLoadingGraphData] = useState(false);
   const [error, setError] = useState('');
   const [chartDataForEffect, setChartDataForEffect] = useState(null);
@@ -29,12 +36,9 @@ function GraphsPage() {
       setIsLoadingFiles(true);
       setError('');
       try {
-        const files = await getUserFiles();
-        setUserFiles(files.map(f => ({
-          id: f.file_id,
-          name: f.original_filename,
-          columnHeaders: f.columnHeaders || [],
-        })));
+        const { files, nextToken } = await getUserFiles();
+        setUserFiles(files.map(toFileOption));
+        setFilesNextToken(nextToken);
       } catch (err) {
         setError(err.message || 'Erreur lors de la récupération des fichiers.');
         console.error("Erreur chargement fichiers:", err);
@@ -45,8 +49,24 @@ function GraphsPage() {
     loadFiles();
   }, []); 
 
+  // Page suivante de la liste, à la demande : pas de parcours de toutes les pages au montage
+  const loadMoreFiles = async () => {
+    setIsLoadingMoreFiles(true);
+    setError('');
+    try {
+      const { files, nextToken } = await getUserFiles({ nextToken: filesNextToken });
+      setUserFiles(previous => [...previous, ...files.map(toFileOption)]);
+      setFilesNextToken(nextToken);
+    } catch (err) {
+      setError(err.message || 'Erreur lors de la récupération des fichiers.');
+      console.error("Erreur chargement fichiers:", err);
+    } finally {
+      setIsLoadingMoreFiles(false);
+    }
+  };
+
   // Gérer la sélection d'un fichier
-  const handleFileSelectionG = (event) => {
+  const handleFileSelectionG = async (event) => {
     const fileId = event.target.value;
     setSelectedFileIdG(fileId);
     setSelectedVariableG('');
@@ -59,9 +79,17 @@ function GraphsPage() {
     }
 
     if (fileId) {
+      // La liste ne contient pas les en-têtes : on les demande au détail du fichier
       const selected = userFiles.find(f => f.id === fileId);
       setFileMetadataG(selected);
-      setHeadersG(selected?.columnHeaders || []);
+      setHeadersG([]);
+      try {
+        const details = await getFileDetails(fileId);
+        setFileMetadataG({ ...selected, columnHeaders: details.columnHeaders || [] });
+        setHeadersG(details.columnHeaders || []);
+      } catch (err) {
+        setError(err.message || 'Erreur lors de la récupération du fichier.');
+      }
     } else {
       setFileMetadataG(null);
       setHeadersG([]);
@@ -84,14 +112,15 @@ function GraphsPage() {
       const boxplotStats = await fetchBoxplotData(selectedFileIdG, varName);
       console.log("Données du boxplot reçues du backend:", boxplotStats);
 
-      // Préparer les données pour le graphique
-      const dataForChart = [ 
-          boxplotStats.min_val,
-          boxplotStats.q1,
-          boxplotStats.median,
-          boxplotStats.q3,
-          boxplotStats.max_val
-      ];
+      // Statistiques déjà calculées par le backend : moustaches et échantillon plafonné d'outliers
+      const dataForChart = {
+          min: boxplotStats.lower_whisker,
+          q1: boxplotStats.q1,
+          median: boxplotStats.median,
+          q3: boxplotStats.q3,
+          max: boxplotStats.upper_whisker,
+          outliers: boxplotStats.outliers,
+      };
 
       // Mettre à jour l'état qui déclenchera useEffect pour créer le graphique
       setChartDataForEffect({
@@ -193,6 +222,11 @@ function GraphsPage() {
             <option key={file.id} value={file.id}>{file.name}</option>
           ))}
         </select>
+        {filesNextToken && (
+          <button type="button" className="load-more-files" onClick={loadMoreFiles} disabled={isLoadingMoreFiles}>
+            {isLoadingMoreFiles ? 'Chargement...' : 'Charger plus de fichiers'}
+          </button>
+        )}
       </div>
 
       {selectedFileIdG && headersG.length > 0 && (
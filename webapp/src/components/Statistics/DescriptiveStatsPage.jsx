@@ -1,6 +1,11 @@
 import React, { useState, useEffect } from 'react';
 import './DescriptiveStatsPage.css';
-import { getUserFiles, fetchFileStatistics } from '../../services/apiService';
+import { getUserFiles, getFileDetails, fetchFileStatistics } from '../../services/apiService';
+
+const toFileOption = (f) => ({
+  id: f.file_id,
+  name: f.original_filename,
+});
 
 function DescriptiveStatsPage() {
   const [userFiles, setUserFiles] = useState([]);
@@ -10,6 +15,8 @@ function DescriptiveStatsPage() {
   const [selectedVariableForStats, setSelectedVariableForStats] = useState('');
   const [descriptiveStats, setDescriptiveStats] = useState(null);
   const [isLoadingFiles, setIsLoadingFiles] = useState(false);
+  const [filesNextToken, setFilesNextToken] = useState(null); // Page suivante de la liste, null si tout est chargé
+  const [isLoadingMoreFiles, setIsLoadingMoreFiles] = useState(false);
   const [isLoadingStats, setIsLoadingStats] = useState(false);
   const [error, setError] = useState('');
 
@@ -18,12 +25,9 @@ function DescriptiveStatsPage() {
       setIsLoadingFiles(true);
       setError('');
       try {
-        const files = await getUserFiles();
-        setUserFiles(files.map(f => ({
-          id: f.file_id,
-          name: f.original_filename,
-          columnHeaders: f.columnHeaders || [], //stocke les entêtes de la table deposée.
-        })));
+        const { files, nextToken } = await getUserFiles();
+        setUserFiles(files.map(toFileOption));
+        setFilesNextToken(nextToken);
       } catch (err) {
         setError(err.message || 'Erreur lors de la récupération des fichiers.');
         console.error(err);
@@ -34,16 +38,40 @@ function DescriptiveStatsPage() {
     loadFiles();
   }, []);
 
-  const handleFileSelection = (event) => {
+  // Page suivante de la liste, à la demande : pas de parcours de toutes les pages au montage
+  const loadMoreFiles = async () => {
+    setIsLoadingMoreFiles(true);
+    setError('');
+    try {
+      const { files, nextToken } = await getUserFiles({ nextToken: filesNextToken });
+      setUserFiles(previous => [...previous, ...files.map(toFileOption)]);
+      setFilesNextToken(nextToken);
+    } catch (err) {
+      setError(err.message || 'Erreur lors de la récupération des fichiers.');
+      console.error(err);
+    } finally {
+      setIsLoadingMoreFiles(false);
+    }
+  };
+
+  const handleFileSelection = async (event) => {
     const fileId = event.target.value;
     setSelectedFileId(fileId);
     setDescriptiveStats(null);
     setSelectedVariableForStats('');
     setError('');
     if (fileId) {
+      // La liste ne contient pas les en-têtes : on les demande au détail du fichier
       const selected = userFiles.find(f => f.id === fileId);
       setFileMetadata(selected);
-      setHeaders(selected?.columnHeaders || []);
+      setHeaders([]);
+      try {
+        const details = await getFileDetails(fileId);
+        setFileMetadata({ ...selected, columnHeaders: details.columnHeaders || [] });
+        setHeaders(details.columnHeaders || []);
+      } catch (err) {
+        setError(err.message || 'Erreur lors de la récupération du fichier.');
+      }
     } else {
       setFileMetadata(null);
       setHeaders([]);
@@ -87,6 +115,11 @@ function DescriptiveStatsPage() {
             <option key={file.id} value={file.id}>{file.name}</option>
           ))}
         </select>
+        {filesNextToken && (
+          <button type="button" className="load-more-files" onClick={loadMoreFiles} disabled={isLoadingMoreFiles}>
+            {isLoadingMoreFiles ? 'Chargement...' : 'Charger plus de fichiers'}
+          </button>
+        )}
       </div>
 
       {selectedFileId && headers.length > 0 && (
@@ -48,8 +48,17 @@ export const confirmUpload = async (fileId, s3ObjectKey, originalFilename, fileT
 };
 
 // --- Fonctions de gestion de fichiers ---
-export const getUserFiles = async () => {
-  const response = await fetch(`${API_BASE_URL}/files`, {
+// Taille des pages de GET /files (maximum accepté par l'API : 200).
+export const FILES_PAGE_SIZE = 50;
+
+// Une page des fichiers de l'utilisateur, du plus récent au plus ancien. nextToken (en-tête
+// X-Next-Token de l'API) vaut null sur la dernière page ; sinon on le repasse pour la suivante.
+export const getUserFiles = async ({ nextToken = null, limit = FILES_PAGE_SIZE } = {}) => {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (nextToken) {
+    params.set('next_token', nextToken);
+  }
+  const response = await fetch(`${API_BASE_URL}/files?${params}`, {
     headers: {
       ...getAuthHeader(),
     }
@@ -58,6 +67,23 @@ export const getUserFiles = async () => {
     const errorData = await response.json().catch(() => ({ message: response.statusText }));
     throw new Error(errorData.detail || errorData.message || 'Failed to fetch user files');
   }
+  return {
+    files: await response.json(),
+    nextToken: response.headers.get('X-Next-Token'),
+  };
+};
+
+// Métadonnées complètes d'un fichier, dont les en-têtes de colonnes (absents de la liste).
+export const getFileDetails = async (fileId) => {
+  const response = await fetch(`${API_BASE_URL}/files/${fileId}`, {
+    headers: {
+      ...getAuthHeader(),
+    }
+  });
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ message: response.statusText }));
+    throw new Error(errorData.detail || errorData.message || 'Failed to fetch file details');
+  }
   return response.json();
 };
 
@@ -147,4 +173,29 @@ export const fetchBoxplotData = async (fileId, variableName) => {
     throw new Error(errorData.detail || errorData.message || 'Failed to fetch boxplot data');
   }
   return response.json();
-};
\ No newline at end of file
+};
+
+/**
+ * Récupère l'histogramme d'une variable numérique, calculé par le backend (bornes et effectifs seulement).
+ * @param {string} fileId - L'ID du fichier.
+ * @param {string} variableName - Le nom de la variable (colonne).
+ * @param {object} [options] - { bins: 'sturges' | 'fd' | nombre, edges: number[], logScale: boolean, kde: boolean }
+ * @returns {Promise<object>} - Les bornes des classes, les effectifs et éventuellement la densité.
+ */
+export const fetchHistogramData = async (fileId, variableName, options = {}) => {
+  const encodedVariableName = encodeURIComponent(variableName);
+  const params = new URLSearchParams();
+  if (options.bins !== undefined) params.append('bins', options.bins);
+  (options.edges || []).forEach((edge) => params.append('edges', edge));
+  if (options.logScale) params.append('log_scale', 'true');
+  if (options.kde) params.append('kde', 'true');
+  const query = params.toString() ? `?${params.toString()}` : '';
+  const response = await fetch(`${API_BASE_URL}/files/${fileId}/graph-data/histogram/${encodedVariableName}${query}`, {
+    headers: { ...getAuthHeader() }
+  });
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ message: response.statusText }));
+    throw new Error(errorData.detail || errorData.message || 'Failed to fetch histogram data');
+  }
+  return response.json();
+};
@@ -3,22 +3,48 @@ from botocore.config import Config
 import os
 import uuid
 from dotenv import load_dotenv
-from typing import Union, List, Dict, Any, Optional
+from typing import Union, List, Dict, Any, Optional, Literal, IO, Iterator, Tuple
 import logging
-from fastapi import FastAPI, Request, status, Header, HTTPException
+from fastapi import FastAPI, Request, Response, status, Header, HTTPException, Query
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from pathlib import Path
 import datetime
-import io
-import csv
+import json
+import hashlib
+import time
+import base64
+import binascii
+import tempfile
+import asyncio
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import numpy as np
 import pandas as pd
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
 from scipy import stats as scipy_stats
+from dataframe_cache import DataFrameCache, TieredDatasetCache
+from metadata_cache import MetadataCache
+from shared_store import SharedArrowStore, default_store_directory
+from dtype_optimization import as_float64, optimize_frame_dtypes
+from approximate_stats import CONFIDENCE_LEVEL, Z_SCORE, StreamingColumnSample
+from stage_metrics import StageMetrics, begin_request, server_timing_header
+from single_flight import SingleFlight
+
+# Détection du dialecte CSV partagée avec la Lambda (le dépôt entier est cloné sur l'instance)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "terraform" / "lambda"))
+from csv_dialect import DIALECT_PREFIX_BYTES, detect_csv_dialect
+from ranged_download import RANGED_DOWNLOAD_WORKERS, S3RangeReader, download_to_buffer, download_to_file
+from chunked_stats import summarize_column_chunks
 
 
 load_dotenv()
@@ -32,16 +58,110 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Token", "Server-Timing"], # Jeton de pagination de GET /files, durées des étapes
 )
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 DYNAMO_TABLE_FILES = os.getenv("DYNAMO_TABLE")
 BUCKET_NAME = os.getenv("BUCKET")
-
-my_config = Config(region_name=AWS_REGION)
+# GSI (user, upload_timestamp) défini dans main_serverless.py : la liste sort déjà triée du plus récent au plus ancien
+FILES_BY_UPLOAD_INDEX = os.getenv("DYNAMO_FILES_BY_UPLOAD_INDEX", "user-upload_timestamp-index")
+FILES_PAGE_DEFAULT_LIMIT = 50
+FILES_PAGE_MAX_LIMIT = 200
+# Attributs des lignes de la liste (les en-têtes de colonnes sont servis par GET /files/{file_id}).
+# Doit rester inclus dans la projection du GSI.
+FILE_LIST_ATTRIBUTES = [
+    "user", "id", "original_filename", "s3_object_key", "file_type", "upload_timestamp", "file_size",
+    "status", "rowCount", "columnCount", "processingStatus", "processedTimestamp",
+]
+# Budget mémoire du cache de DataFrames (les t2.micro n'ont que 1 Go de RAM)
+DATAFRAME_CACHE_MAX_BYTES = int(os.getenv("DATAFRAME_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Types compacts pour les DataFrames chargés (entiers réduits, float32 exacts, 'category' pour le texte répétitif)
+OPTIMIZE_DTYPES = os.getenv("OPTIMIZE_DTYPES", "1") == "1"
+CATEGORY_MAX_UNIQUE_RATIO = float(os.getenv("CATEGORY_MAX_UNIQUE_RATIO", "0.5"))
+# Rapports mémoire avant/après conservés (derniers fichiers chargés par ce worker)
+MEMORY_REPORTS_MAX = 256
+# Nombre de processus uvicorn : au-delà d'un, les DataFrames parsés sont stockés une seule fois pour
+# toute l'instance (Arrow projeté en mémoire, budget DATAFRAME_CACHE_MAX_BYTES partagé par les workers)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+SHARED_STORE_DIR = os.getenv("SHARED_STORE_DIR") or (default_store_directory() if WEB_WORKERS > 1 else None)
+# Avec plusieurs workers, chacun y dépose l'instantané de ses métriques pour que /metrics les additionne
+METRICS_DIR = os.getenv("METRICS_DIR") or (os.path.join(default_store_directory(), "metrics") if WEB_WORKERS > 1 else None)
+# En-tête Server-Timing (durée de chaque étape de la requête) sur chaque réponse
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+# Niveau disque du cache de DataFrames (fichiers Arrow mmap, vérifiés par checksum) : une instance
+# redémarrée ne retélécharge ni ne reparse les fichiers déjà vus. 0 désactive ce niveau.
+DATASET_DISK_CACHE_DIR = os.getenv("DATASET_DISK_CACHE_DIR", "/var/tmp/statisticaws-datasets")
+DATASET_DISK_CACHE_MAX_BYTES = int(os.getenv("DATASET_DISK_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Items DynamoDB gardés localement : le préfixe de chaque requête n'est plus un get_item (table à 5 RCU)
+METADATA_CACHE_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_SECONDS", "30"))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "10000"))
+# Limites de batch_get_item : 100 clés par appel, clés non traitées (throttling) relancées avec backoff
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+# Appels boto3 (bloquants) et parsing pandas (CPU) sont exécutés hors de la boucle d'événements,
+# sur des pools bornés : un gros téléchargement ne bloque plus les autres requêtes.
+IO_MAX_WORKERS = int(os.getenv("IO_MAX_WORKERS", "16"))
+# Les cœurs sont répartis entre les workers uvicorn
+CPU_MAX_WORKERS = int(os.getenv("CPU_MAX_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_WORKERS))))
+# À incrémenter quand le format ou le calcul des réponses change : invalide les ETag déjà distribués
+RESPONSE_ETAG_VERSION = "1"
+# Les réponses dépendent de l'utilisateur (Authorization) : cache navigateur uniquement, revalidé à chaque visite
+RESULT_CACHE_CONTROL = "private, no-cache"
+# Nombre d'outliers renvoyés par défaut dans un boxplot (les comptes totaux restent exacts)
+BOXPLOT_MAX_OUTLIERS = int(os.getenv("BOXPLOT_MAX_OUTLIERS", "100"))
+BOXPLOT_OUTLIERS_LIMIT = 10000
+# Nombre maximal de classes d'un histogramme et de points de la densité estimée
+HISTOGRAM_MAX_BINS = int(os.getenv("HISTOGRAM_MAX_BINS", "1000"))
+KDE_MAX_POINTS = 2048
+# Nombre de lignes lues à la fois par le mode approché (mode=approx)
+APPROX_CHUNK_ROWS = int(os.getenv("APPROX_CHUNK_ROWS", "200000"))
+# En mode auto, un fichier dont le chargement dépasserait ce volume (octets téléchargés + valeurs
+# en mémoire, estimés depuis l'item DynamoDB) est traité par morceaux en mémoire bornée.
+# Par défaut le budget du cache : un DataFrame qui n'y tiendrait pas n'est pas chargé.
+OUT_OF_CORE_MIN_BYTES = int(os.getenv("OUT_OF_CORE_MIN_BYTES", str(DATAFRAME_CACHE_MAX_BYTES)))
+# Mémoire visée pour un morceau, et empreinte supposée d'une valeur lue (texte compris)
+OUT_OF_CORE_CHUNK_BYTES = int(os.getenv("OUT_OF_CORE_CHUNK_BYTES", str(64 * 1024 * 1024)))
+CHUNK_VALUE_BYTES = 64
+# Empreinte minimale d'une valeur chargée (float64), pour l'estimation de la taille d'un DataFrame
+DATAFRAME_VALUE_BYTES = 8
+# Les téléchargements par plages ouvrent leurs propres connexions en plus des threads d'E/S
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", str(IO_MAX_WORKERS + RANGED_DOWNLOAD_WORKERS)))
+
+my_config = Config(region_name=AWS_REGION, max_pool_connections=AWS_MAX_POOL_CONNECTIONS)
 dynamodb_resource = boto3.resource('dynamodb', config=my_config)
 files_table = dynamodb_resource.Table(DYNAMO_TABLE_FILES)
-s3_client = boto3.client('s3', config=Config(signature_version='s3v4', region_name=AWS_REGION))
+s3_client = boto3.client('s3', config=my_config.merge(Config(signature_version='s3v4')))
+io_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="aws-io")
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_MAX_WORKERS, thread_name_prefix="parse")
+if SHARED_STORE_DIR:
+    dataframe_cache = SharedArrowStore(directory=SHARED_STORE_DIR, max_bytes=DATAFRAME_CACHE_MAX_BYTES)
+else:
+    dataframe_cache = DataFrameCache(max_bytes=DATAFRAME_CACHE_MAX_BYTES)
+if DATASET_DISK_CACHE_MAX_BYTES > 0:
+    dataframe_cache = TieredDatasetCache(
+        memory=dataframe_cache,
+        disk=SharedArrowStore(directory=DATASET_DISK_CACHE_DIR, max_bytes=DATASET_DISK_CACHE_MAX_BYTES, checksums=True),
+        # Un seul thread : les écritures disque (sous verrou fcntl) se font hors du chemin des requêtes
+        writer=ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache"),
+    )
+stage_metrics = StageMetrics("statisticaws", directory=METRICS_DIR)
+# Chargements en cours par (user, file_id, version, colonnes) : les requêtes simultanées partagent le même
+dataframe_loads = SingleFlight()
+memory_reports: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+metadata_cache = MetadataCache(ttl_seconds=METADATA_CACHE_TTL_SECONDS, max_entries=METADATA_CACHE_MAX_ENTRIES)
+
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Collecte les étapes chronométrées pendant la requête et les renvoie dans l'en-tête Server-Timing."""
+    if not SERVER_TIMING_HEADER:
+        return await call_next(request)
+    stages = begin_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = server_timing_header(stages, time.perf_counter() - start)
+    return response
 
 
 class FileInitiateUploadRequest(BaseModel):
@@ -95,6 +215,11 @@ class DescriptiveStatsResponse(BaseModel):
     data_type_detected: str # 'numeric', 'categorical', 'mixed'
     unique_values_count: Optional[int] = None
     top_frequencies: Optional[List[Dict[str, Any]]] = None # Pour catégoriel [{value: count}, ...]
+    approximate: bool = False # True si calculé depuis les sketches du profil (quantiles, distincts, top-k)
+    sample_size: Optional[int] = None # Taille de l'échantillon utilisé (mode approché sans profil)
+    rank_error: Optional[float] = None # Erreur de rang maximale des quantiles (fraction de count)
+    confidence_level: Optional[float] = None
+    confidence_intervals: Optional[Dict[str, List[float]]] = None # {'median': [bas, haut], ...}
 
 
 class BoxplotDataResponse(BaseModel):
@@ -104,7 +229,68 @@ class BoxplotDataResponse(BaseModel):
     median: float
     q3: float
     max_val: float
-    outliers: List[float] = [] # Optionnel, si on les calcule
+    lower_whisker: float # Plus petite valeur dans [q1 - 1.5·IQR, q1]
+    upper_whisker: float # Plus grande valeur dans [q3, q3 + 1.5·IQR]
+    outlier_count_low: int = 0
+    outlier_count_high: int = 0
+    outliers: List[float] = [] # Échantillon déterministe et plafonné des outliers (extrêmes + tirages répartis)
+    outliers_truncated: bool = False # True si outliers ne contient pas tous les outliers
+    approximate: bool = False
+    sample_size: Optional[int] = None
+    rank_error: Optional[float] = None
+    confidence_level: Optional[float] = None
+    confidence_intervals: Optional[Dict[str, List[float]]] = None
+
+
+class HistogramDataResponse(BaseModel):
+    variable_name: str
+    bin_rule: str # 'sturges', 'fd', 'fixed' ou 'edges'
+    log_scale: bool = False
+    bin_edges: List[float] # len(counts) + 1 bornes, dans l'échelle des données
+    counts: List[int]
+    count: int # Valeurs comptées dans les classes
+    excluded_count: int = 0 # Valeurs hors des bornes explicites, ou <= 0 en échelle log
+    density_x: Optional[List[float]] = None # Estimation à noyau gaussien (kde=true)
+    density_y: Optional[List[float]] = None # Densité de la variable, ou de log10 de la variable en échelle log
+    bandwidth: Optional[float] = None
+
+
+# auto : profil si disponible, sinon calcul exact ; exact : toujours sur les données ;
+# approx : profil si disponible, sinon échantillon lu par morceaux en mémoire bornée
+StatisticsMode = Literal["auto", "exact", "approx"]
+
+
+class ColumnMemoryReport(BaseModel):
+    dtype_before: str
+    dtype_after: str
+    bytes_before: int
+    bytes_after: int
+
+
+class FileMemoryReportResponse(BaseModel):
+    file_id: str
+    version: str
+    bytes_before: int
+    bytes_after: int
+    columns: Dict[str, ColumnMemoryReport]
+
+
+class FileDetailsBatchRequest(BaseModel):
+    file_ids: List[str] = Field(..., min_length=1, max_length=500, examples=[["id1", "id2"]])
+
+
+class BatchStatisticsRequest(BaseModel):
+    columns: Union[List[str], Literal["all"]] = Field("all", examples=[["age", "ville"], "all"])
+
+
+async def run_io(func, *args, **kwargs):
+    """Exécute un appel AWS bloquant sur le pool d'I/O."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Exécute un traitement pandas sur le pool de calcul."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, functools.partial(func, *args, **kwargs))
 
 
 def generate_s3_presigned_url(bucket_name: str, object_key: str, client_method: str = 'put_object', expires_in: int = 3600, content_type: Union[str, None] = None):
@@ -121,108 +307,432 @@ def generate_s3_presigned_url(bucket_name: str, object_key: str, client_method:
         logger.error(f"Unexpected error generating presigned URL for {object_key}: {e}", exc_info=True)
         return None
 
-async def get_dataframe_from_s3(user: str, file_id: str) -> pd.DataFrame:
-    """Télécharge un fichier depuis S3 et le charge dans un DataFrame pandas."""
+def download_s3_object(object_key: str) -> Union[bytes, bytearray]:
+    """Télécharge un objet S3 en mémoire, par plages parallèles dans un tampon préalloué s'il est gros."""
+    return download_to_buffer(s3_client, BUCKET_NAME, object_key)
+
+
+def download_columnar_copy(columnar_object_key: str) -> Optional[Union[bytes, bytearray]]:
+    """Télécharge la copie Parquet écrite par la Lambda, ou None si elle est absente."""
     try:
-        db_response = files_table.get_item(Key={'user': user, 'id': file_id})
-        item = db_response.get('Item')
-        if not item:
-            logger.warning(f"File metadata not found in DynamoDB for user '{user}', file_id '{file_id}'.")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File metadata not found.")
-        
+        return download_s3_object(columnar_object_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            logger.warning(f"Columnar copy '{columnar_object_key}' listed in metadata but missing on S3.")
+            return None
+        raise
+
+
+def read_columnar_copy(parquet_bytes: Union[bytes, bytearray], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Charge les colonnes demandées depuis la copie Parquet."""
+    parquet_file = pq.ParquetFile(pa.BufferReader(parquet_bytes)) # Lecture sans copie du tampon
+    if columns is not None:
+        # Les colonnes inconnues sont ignorées : l'endpoint renvoie alors son propre 404
+        available = set(parquet_file.schema_arrow.names)
+        columns = [c for c in columns if c in available]
+    return parquet_file.read(columns=columns).to_pandas()
+
+
+def spool_s3_object(object_key: str) -> IO[bytes]:
+    """Télécharge un objet S3 dans un fichier temporaire plutôt qu'en mémoire, par plages parallèles s'il est gros."""
+    spooled = tempfile.TemporaryFile()
+    try:
+        return download_to_file(s3_client, BUCKET_NAME, object_key, spooled)
+    except Exception:
+        spooled.close()
+        raise
+
+
+def raw_file_kind(file_type_from_db: str, original_filename_from_db: str) -> Optional[str]:
+    """Détermine le format du fichier brut : 'csv', 'excel' ou None s'il n'est pas supporté."""
+    if 'csv' in file_type_from_db or original_filename_from_db.endswith('.csv'):
+        return 'csv'
+    if 'excel' in file_type_from_db or 'spreadsheetml' in file_type_from_db or \
+            original_filename_from_db.endswith('.xlsx') or original_filename_from_db.endswith('.xls'):
+        return 'excel'
+    return None
+
+
+def read_excel_rows(excel_file: IO[bytes], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Lit la feuille active en lecture seule, ligne par ligne, en ne gardant que les colonnes demandées.
+
+    Le modèle objet complet du classeur n'est jamais construit. En mode read_only la dimension
+    déclarée par le fichier (max_row) n'est pas fiable : elle est réinitialisée et les lignes
+    vides finales sont ignorées, comme le fait pd.read_excel.
+    """
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header_row = list(next(rows, None) or [])
+        while header_row and header_row[-1] is None:
+            header_row.pop()
+        names = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(header_row)]
+        indices = [i for i, name in enumerate(names) if columns is None or name in columns]
+
+        data = {i: [] for i in indices}
+        pending_empty = 0
+        for row in rows:
+            if all(value is None for value in row):
+                pending_empty += 1
+                continue
+            if pending_empty:
+                for i in indices:
+                    data[i].extend([None] * pending_empty)
+                pending_empty = 0
+            n = len(row)
+            for i in indices:
+                data[i].append(row[i] if i < n else None)
+    finally:
+        workbook.close()
+
+    df = pd.DataFrame({position: data[i] for position, i in enumerate(indices)})
+    df.columns = [names[i] for i in indices]
+    return df
+
+
+def check_parsed_frame(df: Optional[pd.DataFrame], s3_object_key: str) -> pd.DataFrame:
+    """Rejette les DataFrames vides et normalise les noms de colonnes."""
+    if df is None or df.empty:
+        logger.warning(f"Parsed DataFrame is empty for S3 object '{s3_object_key}'.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Parsed DataFrame is empty. File might be empty or delimiter/format issue.")
+
+    logger.info(f"DataFrame for S3 object '{s3_object_key}' loaded. Final columns: {df.columns.tolist()}")
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def parse_excel_file(excel_file: IO[bytes], s3_object_key: str, original_filename_from_db: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Parse un fichier Excel déjà recopié sur disque, en ne gardant que les colonnes demandées."""
+    logger.info(f"Processing as Excel: {s3_object_key}")
+    try:
+        if original_filename_from_db.endswith('.xls'):
+            # Ancien format binaire, non lisible par openpyxl
+            df = pd.read_excel(excel_file, usecols=(lambda name: str(name).strip() in columns) if columns is not None else None)
+        else:
+            df = read_excel_rows(excel_file, columns)
+    except Exception as e_excel:
+        logger.error(f"Error parsing Excel file {s3_object_key}: {e_excel}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse Excel file: {str(e_excel)}")
+    if columns is not None and df.shape[1] == 0:
+        return df # Aucune des colonnes demandées n'existe : l'endpoint renvoie son 404
+    return check_parsed_frame(df, s3_object_key)
+
+
+def parse_csv_file(file_content_bytes: Union[bytes, bytearray], s3_object_key: str, columns: Optional[List[str]] = None, dialect: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Parse le contenu brut d'un CSV en un seul passage, avec le dialecte détecté par la Lambda.
+
+    Seules les colonnes demandées sont tokenisées et matérialisées. Si l'item n'a pas encore
+    de dialecte (fichier en cours de traitement), il est détecté sur un préfixe borné.
+    """
+    logger.info(f"Processing as CSV: {s3_object_key}")
+    if not dialect:
+        dialect = detect_csv_dialect(file_content_bytes[:DIALECT_PREFIX_BYTES], truncated=len(file_content_bytes) > DIALECT_PREFIX_BYTES)
+        logger.info(f"No stored dialect for {s3_object_key}, detected from prefix: {dialect}")
+    # Les noms d'en-tête bruts peuvent contenir des espaces, d'où la comparaison après strip
+    usecols = (lambda name: name.strip() in columns) if columns is not None else None
+    try:
+        df = pd.read_csv(
+            pa.BufferReader(file_content_bytes), # Lecture sans copie du tampon préalloué
+            sep=dialect['delimiter'],
+            quotechar=dialect['quotechar'],
+            encoding=dialect['encoding'],
+            encoding_errors='replace', # Encodage deviné sur un préfixe : même décodage que la Lambda
+            decimal=dialect['decimal'],
+            skiprows=int(dialect['headerRow']),
+            header=0,
+            skipinitialspace=True,
+            usecols=usecols,
+            engine='c',
+        )
+    except Exception as e_csv:
+        logger.error(f"Error parsing CSV {s3_object_key} with dialect {dialect}: {e_csv}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse CSV file with delimiter '{dialect['delimiter']}'. Error: {str(e_csv)}")
+    logger.info(f"Successfully parsed CSV with delimiter '{dialect['delimiter']}'. Columns: {df.columns.tolist()}")
+
+    if columns is not None and df.shape[1] == 0:
+        return df # Aucune des colonnes demandées n'existe : l'endpoint renvoie son 404
+    return check_parsed_frame(df, s3_object_key)
+
+
+def result_etag(item: Dict[str, Any], endpoint: str, **params: Any) -> str:
+    """ETag fort d'un résultat calculé : il ne dépend que de la version de l'objet, de son traitement et des paramètres."""
+    state = [
+        RESPONSE_ETAG_VERSION,
+        endpoint,
+        item.get('user'),
+        item.get('id'),
+        item.get('s3ETag') or item.get('s3_object_key'),
+        item.get('upload_timestamp'),
+        item.get('processedTimestamp'),
+        params,
+    ]
+    digest = hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def conditional_response(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Pose ETag et Cache-Control ; renvoie un 304 si le client a déjà cette version (If-None-Match)."""
+    headers = {'ETag': etag, 'Cache-Control': RESULT_CACHE_CONTROL, 'Vary': 'Authorization'}
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if '*' in candidates or etag in candidates:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def check_columns_exist(item: Dict[str, Any], columns: Optional[List[str]]) -> None:
+    """Valide les colonnes demandées contre les en-têtes stockés par la Lambda, avant toute lecture S3."""
+    headers = item.get('columnHeaders')
+    if columns is None or not headers:
+        return # Fichier pas encore traité par la Lambda : la validation se fera après parsing
+    known = {str(h).strip() for h in headers}
+    unknown_columns = [c for c in columns if c not in known]
+    if unknown_columns:
+        raise unknown_columns_error(unknown_columns)
+
+
+def unknown_columns_error(unknown_columns: List[str]) -> HTTPException:
+    if len(unknown_columns) == 1:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{unknown_columns[0]}' not found in the file.")
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variables not found in the file: {unknown_columns}")
+
+
+async def get_file_item(user: str, file_id: str) -> Dict[str, Any]:
+    """Récupère l'item DynamoDB d'un fichier, depuis le cache de métadonnées si possible (404 s'il n'existe pas)."""
+    item = metadata_cache.get(user, file_id)
+    if item is not None:
+        return item
+    try:
+        with stage_metrics.stage("dynamodb_get_item"):
+            db_response = await run_io(files_table.get_item, Key={'user': user, 'id': file_id})
+    except ClientError as e_boto:
+        logger.error(f"DynamoDB ClientError fetching file_id '{file_id}' for user '{user}': {e_boto}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error accessing file data: {str(e_boto)}")
+    item = db_response.get('Item')
+    if not item:
+        logger.warning(f"File metadata not found in DynamoDB for user '{user}', file_id '{file_id}'.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File metadata not found.")
+    metadata_cache.put(user, file_id, item)
+    return item
+
+
+async def batch_get_file_items(user: str, file_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Lit plusieurs items en batch_get_item, par lots de 100 clés, en relançant les clés non traitées.
+
+    Chaque appel DynamoDB passe par run_io et l'attente entre deux tentatives est un
+    asyncio.sleep : ni la boucle d'événements ni un thread d'E/S ne sont bloqués pendant le
+    backoff. Renvoie (items, file_id encore non traités après BATCH_GET_MAX_ATTEMPTS tentatives).
+    """
+    items = []
+    unprocessed_ids = []
+    for start in range(0, len(file_ids), BATCH_GET_MAX_KEYS):
+        request_items = {DYNAMO_TABLE_FILES: {'Keys': [{'user': user, 'id': file_id} for file_id in file_ids[start:start + BATCH_GET_MAX_KEYS]]}}
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(0.05 * 2 ** (attempt - 1)) # Table provisionnée : on laisse la capacité se reconstituer
+            db_response = await run_io(dynamodb_resource.batch_get_item, RequestItems=request_items)
+            items.extend(db_response.get('Responses', {}).get(DYNAMO_TABLE_FILES, []))
+            request_items = db_response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            unprocessed_ids.extend(key['id'] for key in request_items[DYNAMO_TABLE_FILES]['Keys'])
+    return items, unprocessed_ids
+
+
+async def get_file_items(user: str, file_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Items de plusieurs fichiers, par file_id : cache de métadonnées puis un seul aller-retour batch_get_item.
+
+    Les fichiers introuvables sont absents du résultat.
+    """
+    found = {}
+    missing_ids = []
+    for file_id in dict.fromkeys(file_ids):
+        item = metadata_cache.get(user, file_id)
+        if item is not None:
+            found[file_id] = item
+        else:
+            missing_ids.append(file_id)
+    if missing_ids:
+        try:
+            with stage_metrics.stage("dynamodb_batch_get_item"):
+                fetched, unprocessed_ids = await batch_get_file_items(user, missing_ids)
+        except ClientError as e_boto:
+            logger.error(f"DynamoDB error batch-fetching {len(missing_ids)} files for user '{user}': {e_boto}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error accessing file data: {str(e_boto)}")
+        if unprocessed_ids:
+            # Capacité DynamoDB épuisée : erreur transitoire, le client peut réessayer
+            logger.warning(f"DynamoDB left {len(unprocessed_ids)} keys unprocessed after {BATCH_GET_MAX_ATTEMPTS} attempts for user '{user}'.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"File data temporarily unavailable for: {unprocessed_ids}",
+                headers={'Retry-After': '1'},
+            )
+        for item in fetched:
+            metadata_cache.put(user, item['id'], item)
+            found[item['id']] = item
+    return found
+
+
+@functools.lru_cache(maxsize=256)
+def load_profile(profile_object_key: str, version: str) -> Optional[Dict[str, Any]]:
+    """Télécharge le profil JSON des colonnes écrit par la Lambda (mis en cache par version du fichier)."""
+    try:
+        return json.loads(download_s3_object(profile_object_key))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            logger.warning(f"Column profile '{profile_object_key}' listed in metadata but missing on S3.")
+            return None
+        raise
+
+
+async def get_file_profile(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Renvoie le profil des colonnes du fichier, None s'il n'en a pas ou s'il est illisible."""
+    profile_object_key = item.get('profileObjectKey')
+    if not profile_object_key:
+        return None
+    try:
+        with stage_metrics.stage("s3_get_profile"):
+            return await run_io(load_profile, profile_object_key, item.get('s3ETag') or item.get('processedTimestamp', ''))
+    except ClientError as e_boto:
+        logger.warning(f"Could not read column profile '{profile_object_key}', falling back to data: {e_boto}")
+        return None
+
+
+async def get_column_profile(item: Dict[str, Any], variable_name: str) -> Optional[Dict[str, Any]]:
+    """Renvoie le profil d'une colonne, None si le fichier n'a pas de profil, 404 si la colonne n'y figure pas."""
+    profile = await get_file_profile(item)
+    if profile is None:
+        return None
+    column_profile = profile.get('columns', {}).get(variable_name)
+    if column_profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{variable_name}' not found in the file.")
+    return column_profile
+
+
+async def optimize_loaded_frame(user: str, file_id: str, version: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Passe un DataFrame fraîchement chargé en types compacts et enregistre son rapport mémoire."""
+    if not OPTIMIZE_DTYPES:
+        return df
+    with stage_metrics.stage("optimize_dtypes"):
+        df, report = await run_cpu(optimize_frame_dtypes, df, CATEGORY_MAX_UNIQUE_RATIO)
+    previous = memory_reports.pop((user, file_id), None)
+    if previous is not None and previous['version'] == version:
+        # Chargement partiel : les colonnes déjà rapportées sont conservées
+        report['columns'] = {**previous['columns'], **report['columns']}
+        report['bytes_before'] = sum(c['bytes_before'] for c in report['columns'].values())
+        report['bytes_after'] = sum(c['bytes_after'] for c in report['columns'].values())
+    memory_reports[(user, file_id)] = {'version': version, **report}
+    while len(memory_reports) > MEMORY_REPORTS_MAX:
+        memory_reports.popitem(last=False)
+    logger.info(f"Optimized dtypes for user '{user}', file_id '{file_id}': {report['bytes_before']} -> {report['bytes_after']} bytes.")
+    return df
+
+
+async def load_dataframe(user: str, file_id: str, item: Dict[str, Any], columns: Optional[List[str]], version: str) -> pd.DataFrame:
+    """Télécharge et parse le fichier (copie colonnaire sinon brut), puis met le DataFrame en cache.
+
+    Appelée une seule fois par chargement, même si plusieurs requêtes l'attendent (dataframe_loads).
+    """
+    s3_object_key = item['s3_object_key']
+    file_type_from_db = item.get('file_type', '').lower()
+    original_filename_from_db = item.get('original_filename', '').lower()
+    cache_key = (user, file_id, version)
+    columnar_object_key = item.get('columnarObjectKey')
+    if columnar_object_key:
+        try:
+            with stage_metrics.stage("s3_download_columnar"):
+                parquet_bytes = await run_io(download_columnar_copy, columnar_object_key)
+            if parquet_bytes is not None:
+                stage_metrics.add("bytes_processed", "s3_download_columnar", len(parquet_bytes))
+                with stage_metrics.stage("read_columnar"):
+                    df = await run_cpu(read_columnar_copy, parquet_bytes, columns)
+                stage_metrics.add("rows_parsed", "read_columnar", len(df))
+            else:
+                df = None
+        except Exception as e_columnar:
+            logger.warning(f"Could not read columnar copy '{columnar_object_key}', falling back to raw file: {e_columnar}")
+            df = None
+        if df is not None:
+            logger.info(f"Loaded columns {df.columns.tolist()} from columnar copy '{columnar_object_key}'.")
+            df.columns = df.columns.str.strip()
+            df = await optimize_loaded_frame(user, file_id, version, df)
+            with stage_metrics.stage("cache_put"):
+                await run_io(dataframe_cache.put, cache_key, df, complete=columns is None)
+            return df
+
+    logger.info(f"Fetching S3 object '{s3_object_key}' for user '{user}', file_id '{file_id}'. Type: '{file_type_from_db}', Filename: '{original_filename_from_db}'")
+    file_kind = raw_file_kind(file_type_from_db, original_filename_from_db)
+    if file_kind == 'csv':
+        with stage_metrics.stage("s3_download"):
+            file_content_bytes = await run_io(download_s3_object, s3_object_key)
+        stage_metrics.add("bytes_processed", "s3_download", len(file_content_bytes))
+        with stage_metrics.stage("parse_csv"):
+            df = await run_cpu(parse_csv_file, file_content_bytes, s3_object_key, columns, item.get('csvDialect'))
+        stage_metrics.add("rows_parsed", "parse_csv", len(df))
+    elif file_kind == 'excel':
+        with stage_metrics.stage("s3_download"):
+            excel_file = await run_io(spool_s3_object, s3_object_key)
+        try:
+            stage_metrics.add("bytes_processed", "s3_download", os.fstat(excel_file.fileno()).st_size)
+            with stage_metrics.stage("parse_excel"):
+                df = await run_cpu(parse_excel_file, excel_file, s3_object_key, original_filename_from_db, columns)
+            stage_metrics.add("rows_parsed", "parse_excel", len(df))
+        finally:
+            excel_file.close()
+    else:
+        logger.warning(f"Unsupported file type for S3 object '{s3_object_key}'. Type: '{file_type_from_db}', Filename: '{original_filename_from_db}'")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported file type: '{file_type_from_db or original_filename_from_db}'")
+    df = await optimize_loaded_frame(user, file_id, version, df)
+    with stage_metrics.stage("cache_put"):
+        await run_io(dataframe_cache.put, cache_key, df, complete=columns is None)
+    return df
+
+
+async def get_dataframe_from_s3(user: str, file_id: str, columns: Optional[List[str]] = None, item: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Télécharge un fichier depuis S3 et le charge dans un DataFrame pandas.
+
+    Si la Lambda a écrit une copie colonnaire, seules les colonnes demandées sont lues depuis
+    celle-ci ; sinon le fichier brut (CSV/Excel) est téléchargé et parsé.
+    """
+    try:
+        if item is None:
+            item = await get_file_item(user, file_id)
+
         s3_object_key = item.get('s3_object_key')
-        file_type_from_db = item.get('file_type', '').lower()
-        original_filename_from_db = item.get('original_filename', '').lower()
 
         if not s3_object_key:
             logger.error(f"S3 object key missing in metadata for user '{user}', file_id '{file_id}'. Item: {item}")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="S3 object key missing in metadata.")
 
-        logger.info(f"Fetching S3 object '{s3_object_key}' for user '{user}', file_id '{file_id}'. Type: '{file_type_from_db}', Filename: '{original_filename_from_db}'")
-
-        s3_response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_object_key)
-        file_content_bytes = s3_response['Body'].read() # Lire le contenu une seule fois en bytes
-
-        df = None
-        is_csv_type = 'csv' in file_type_from_db or original_filename_from_db.endswith('.csv')
-        is_excel_type = 'excel' in file_type_from_db or 'spreadsheetml' in file_type_from_db or \
-                        original_filename_from_db.endswith('.xlsx') or original_filename_from_db.endswith('.xls')
-
-        if is_csv_type:
-            logger.info(f"Processing as CSV: {s3_object_key}")
-            # Tenter de décoder en string pour le sniffer et pour une première inspection
-            try:
-                file_content_str = file_content_bytes.decode('utf-8-sig') # Gère le BOM
-            except UnicodeDecodeError:
-                logger.warning(f"UTF-8-SIG decode failed for {s3_object_key}, trying with 'latin-1'")
-                try:
-                    file_content_str = file_content_bytes.decode('latin-1')
-                except UnicodeDecodeError as ude:
-                    logger.error(f"Could not decode CSV content for {s3_object_key}: {ude}")
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot decode CSV file content.")
-
-            detected_delimiter = ',' # Défaut
-            try:
-                # Utiliser le sniffer sur un échantillon du fichier
-                sample_for_sniffing = "\n".join(file_content_str.splitlines()[:20]) # Sniff sur les 20 premières lignes
-                dialect = csv.Sniffer().sniff(sample_for_sniffing)
-                detected_delimiter = dialect.delimiter
-                logger.info(f"CSV Sniffer detected delimiter: '{detected_delimiter}' for {s3_object_key}")
-            except csv.Error as sniff_error:
-                logger.warning(f"CSV Sniffer failed for {s3_object_key} ('{sniff_error}'). Checking for common delimiters.")
-                # Si le sniffer échoue, on peut essayer une heuristique simple
-                if file_content_str.splitlines()[0].count(';') > file_content_str.splitlines()[0].count(','):
-                    detected_delimiter = ';'
-                    logger.info(f"Sniffer failed, heuristic suggests delimiter: ';' for {s3_object_key}")
-                else:
-                    logger.info(f"Sniffer failed, heuristic suggests delimiter: ',' for {s3_object_key}")
-            
-            try:
-                # Lire le CSV avec le délimiteur détecté (ou le délimiteur par défaut)
-                # On utilise file_content_bytes car pandas peut gérer les bytes directement
-                df = pd.read_csv(io.BytesIO(file_content_bytes), delimiter=detected_delimiter, header='infer', skipinitialspace=True)
-                logger.info(f"Successfully parsed CSV with delimiter '{detected_delimiter}'. Columns: {df.columns.tolist()}")
-
-                # Vérification supplémentaire: si on a une seule colonne et que le nom contient des délimiteurs non utilisés
-                if df.shape[1] == 1:
-                    col_name = df.columns[0]
-                    if detected_delimiter == ',' and ';' in col_name:
-                        logger.warning(f"CSV parsed with ',' but found ';' in single column name. Trying with ';'. Column: {col_name}")
-                        df = pd.read_csv(io.BytesIO(file_content_bytes), delimiter=';', header='infer', skipinitialspace=True)
-                    elif detected_delimiter == ';' and ',' in col_name:
-                         logger.warning(f"CSV parsed with ';' but found ',' in single column name. Trying with ','. Column: {col_name}")
-                         df = pd.read_csv(io.BytesIO(file_content_bytes), delimiter=',', header='infer', skipinitialspace=True)
-                
-            except Exception as e_csv:
-                logger.error(f"Error parsing CSV {s3_object_key} with delimiter '{detected_delimiter}': {e_csv}", exc_info=True)
-                # Tenter un dernier fallback avec un délimiteur commun si l'erreur persiste
-                fallback_delimiter = ';' if detected_delimiter == ',' else ','
-                try:
-                    logger.info(f"Attempting fallback parse with delimiter '{fallback_delimiter}' for {s3_object_key}")
-                    df = pd.read_csv(io.BytesIO(file_content_bytes), delimiter=fallback_delimiter, header='infer', skipinitialspace=True)
-                    logger.info(f"Successfully parsed CSV with fallback delimiter '{fallback_delimiter}'. Columns: {df.columns.tolist()}")
-                except Exception as e_fallback:
-                    logger.error(f"Fallback parse also failed for {s3_object_key} with delimiter '{fallback_delimiter}': {e_fallback}", exc_info=True)
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse CSV file. Tried delimiters: '{detected_delimiter}', '{fallback_delimiter}'. Error: {str(e_csv)}")
-
-        elif is_excel_type:
-            logger.info(f"Processing as Excel: {s3_object_key}")
-            try:
-                df = pd.read_excel(io.BytesIO(file_content_bytes)) # Pandas gère les bytes pour Excel
-            except Exception as e_excel:
-                logger.error(f"Error parsing Excel file {s3_object_key}: {e_excel}", exc_info=True)
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse Excel file: {str(e_excel)}")
-        else:
-            logger.warning(f"Unsupported file type for S3 object '{s3_object_key}'. Type: '{file_type_from_db}', Filename: '{original_filename_from_db}'")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported file type: '{file_type_from_db or original_filename_from_db}'")
-        
-        if df is None or df.empty:
-            logger.warning(f"Parsed DataFrame is empty for S3 object '{s3_object_key}'.")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Parsed DataFrame is empty. File might be empty or delimiter/format issue.")
-        
-        logger.info(f"DataFrame for S3 object '{s3_object_key}' loaded. Final columns: {df.columns.tolist()}")
-        df.columns = df.columns.str.strip()
-        return df
+        check_columns_exist(item, columns)
+
+        version = item.get('s3ETag')
+        if not version:
+            with stage_metrics.stage("s3_head_object"):
+                version = (await run_io(s3_client.head_object, Bucket=BUCKET_NAME, Key=s3_object_key))['ETag'].strip('"')
+        cache_key = (user, file_id, version)
+        with stage_metrics.stage("cache_get"):
+            df = await run_io(dataframe_cache.get, cache_key, columns)
+        if df is not None:
+            logger.info(f"DataFrame cache hit for user '{user}', file_id '{file_id}' (version {version}).")
+            return df
+
+        load_key = (user, file_id, version, tuple(columns) if columns is not None else None)
+        full_load_key = (user, file_id, version, None)
+        if columns is not None and dataframe_loads.in_flight(full_load_key):
+            # Le fichier entier est déjà en cours de chargement : il contient les colonnes demandées
+            with stage_metrics.stage("coalesced_wait"):
+                df = await dataframe_loads.run(full_load_key, functools.partial(load_dataframe, user, file_id, item, None, version))
+            return df[[c for c in columns if c in df.columns]]
+        if dataframe_loads.in_flight(load_key):
+            with stage_metrics.stage("coalesced_wait"):
+                return await dataframe_loads.run(load_key, functools.partial(load_dataframe, user, file_id, item, columns, version))
+        return await dataframe_loads.run(load_key, functools.partial(load_dataframe, user, file_id, item, columns, version))
 
     except ClientError as e_boto: 
         logger.error(f"AWS ClientError for file_id '{file_id}', user '{user}': {e_boto}", exc_info=True)
@@ -237,6 +747,504 @@ async def get_dataframe_from_s3(user: str, file_id: str) -> pd.DataFrame:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not process file: {str(e_general)}")
 
 
+def iter_columnar_frames(columnar_object_key: str, columns: Optional[List[str]], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Lit des colonnes de la copie Parquet par lots, en ne téléchargeant que leurs pages (requêtes par plage)."""
+    parquet_file = pq.ParquetFile(S3RangeReader(s3_client, BUCKET_NAME, columnar_object_key))
+    unknown_columns = [c for c in columns or [] if c not in parquet_file.schema_arrow.names]
+    if unknown_columns:
+        raise unknown_columns_error(unknown_columns)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def iter_csv_frames(s3_object_key: str, columns: Optional[List[str]], dialect: Optional[Dict[str, Any]], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Lit des colonnes d'un CSV par morceaux, directement depuis le flux S3 (le fichier n'est jamais entier en mémoire)."""
+    if not dialect:
+        prefix = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_object_key, Range=f"bytes=0-{DIALECT_PREFIX_BYTES - 1}")['Body'].read()
+        dialect = detect_csv_dialect(prefix)
+    body = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_object_key)['Body']
+    checked = False
+    with pd.read_csv(
+        body,
+        sep=dialect['delimiter'],
+        quotechar=dialect['quotechar'],
+        encoding=dialect['encoding'],
+        encoding_errors='replace',
+        decimal=dialect['decimal'],
+        skiprows=int(dialect['headerRow']),
+        header=0,
+        skipinitialspace=True,
+        usecols=(lambda name: name.strip() in columns) if columns is not None else None,
+        engine='c',
+        chunksize=chunk_rows,
+    ) as reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            if not checked and columns is not None:
+                unknown_columns = [c for c in columns if c not in chunk.columns]
+                if unknown_columns:
+                    raise unknown_columns_error(unknown_columns)
+            checked = True
+            yield chunk
+    if not checked and columns is not None:
+        raise unknown_columns_error(columns)
+
+
+def iter_columnar_chunks(columnar_object_key: str, variable_name: str) -> Iterator[pd.Series]:
+    """Lit une colonne de la copie Parquet par lots."""
+    for frame in iter_columnar_frames(columnar_object_key, [variable_name], APPROX_CHUNK_ROWS):
+        yield frame[variable_name]
+
+
+def iter_csv_chunks(s3_object_key: str, variable_name: str, dialect: Optional[Dict[str, Any]]) -> Iterator[pd.Series]:
+    """Lit une colonne d'un CSV par morceaux, directement depuis le flux S3."""
+    for frame in iter_csv_frames(s3_object_key, [variable_name], dialect, APPROX_CHUNK_ROWS):
+        yield frame[variable_name]
+
+
+def summarize_chunks(chunks: Iterator[pd.Series], variable_name: str) -> Dict[str, Any]:
+    """Alimente l'échantillon morceau par morceau et renvoie son résumé au format du profil."""
+    sample = StreamingColumnSample(variable_name)
+    for chunk in chunks:
+        sample.add_chunk(chunk)
+    return sample.summary()
+
+
+async def get_approximate_column_summary(user: str, file_id: str, item: Dict[str, Any], variable_name: str) -> Dict[str, Any]:
+    """Statistiques approchées d'une colonne sans la charger entièrement en mémoire.
+
+    Réutilise le DataFrame en cache s'il contient la colonne ; sinon lit la copie colonnaire
+    ou le CSV brut par morceaux. Les fichiers Excel n'ont pas de lecture par morceaux : seule
+    la colonne demandée est chargée.
+    """
+    check_columns_exist(item, [variable_name])
+    version = item.get('s3ETag')
+    cached = await run_io(dataframe_cache.get, (user, file_id, version), [variable_name]) if version else None
+    try:
+        if cached is not None and variable_name in cached.columns:
+            chunks = iter([cached[variable_name]])
+        elif item.get('columnarObjectKey'):
+            chunks = iter_columnar_chunks(item['columnarObjectKey'], variable_name)
+        elif raw_file_kind(item.get('file_type', '').lower(), item.get('original_filename', '').lower()) == 'csv':
+            chunks = iter_csv_chunks(item['s3_object_key'], variable_name, item.get('csvDialect'))
+        else:
+            df = await get_dataframe_from_s3(user, file_id, columns=[variable_name], item=item)
+            if variable_name not in df.columns:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{variable_name}' not found in the file.")
+            chunks = iter([df[variable_name]])
+        with stage_metrics.stage("approximate_scan"):
+            return await run_cpu(summarize_chunks, chunks, variable_name)
+    except ClientError as e_boto:
+        logger.error(f"AWS ClientError while sampling '{variable_name}' for file_id '{file_id}', user '{user}': {e_boto}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error accessing file data: {str(e_boto)}")
+
+
+def needs_out_of_core(item: Dict[str, Any], columns: Optional[List[str]]) -> bool:
+    """Vrai si charger ces colonnes dépasserait OUT_OF_CORE_MIN_BYTES (estimation depuis l'item DynamoDB).
+
+    Le CSV brut est téléchargé en entier (file_size), la copie colonnaire seulement pour les
+    colonnes demandées ; chaque valeur chargée occupe au moins DATAFRAME_VALUE_BYTES.
+    """
+    row_count = int(item.get('rowCount') or 0)
+    n_columns = len(columns) if columns is not None else int(item.get('columnCount') or 0)
+    estimated_bytes = row_count * n_columns * DATAFRAME_VALUE_BYTES
+    if not item.get('columnarObjectKey'):
+        estimated_bytes += int(item.get('file_size') or 0)
+    return estimated_bytes > OUT_OF_CORE_MIN_BYTES
+
+
+async def get_out_of_core_summaries(user: str, file_id: str, item: Dict[str, Any], columns: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    """Résumés (format du profil) des colonnes demandées, calculés par morceaux sur toutes les valeurs.
+
+    Un morceau contient au plus OUT_OF_CORE_CHUNK_BYTES de valeurs : la mémoire utilisée ne
+    dépend pas de la taille du fichier. Les fichiers Excel n'ont pas de lecture par morceaux :
+    seules les colonnes demandées sont chargées.
+    """
+    check_columns_exist(item, columns)
+    n_columns = len(columns) if columns is not None else int(item.get('columnCount') or 1)
+    chunk_rows = max(1000, OUT_OF_CORE_CHUNK_BYTES // (max(1, n_columns) * CHUNK_VALUE_BYTES))
+    logger.info(f"Computing out-of-core statistics for file_id '{file_id}', user '{user}' ({chunk_rows} rows per chunk).")
+    try:
+        if item.get('columnarObjectKey'):
+            frames = iter_columnar_frames(item['columnarObjectKey'], columns, chunk_rows)
+        elif raw_file_kind(item.get('file_type', '').lower(), item.get('original_filename', '').lower()) == 'csv':
+            frames = iter_csv_frames(item['s3_object_key'], columns, item.get('csvDialect'), chunk_rows)
+        else:
+            df = await get_dataframe_from_s3(user, file_id, columns=columns, item=item)
+            unknown_columns = [c for c in columns or [] if c not in df.columns]
+            if unknown_columns:
+                raise unknown_columns_error(unknown_columns)
+            frames = iter([df])
+        with stage_metrics.stage("out_of_core_scan"):
+            summaries = await run_cpu(summarize_column_chunks, frames, columns)
+        if summaries:
+            stage_metrics.add("rows_parsed", "out_of_core_scan", max(s['count'] + s['missing'] for s in summaries.values()))
+        return summaries
+    except ClientError as e_boto:
+        logger.error(f"AWS ClientError while streaming file_id '{file_id}', user '{user}': {e_boto}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error accessing file data: {str(e_boto)}")
+
+
+def compute_descriptive_stats(series: pd.Series, variable_name: str) -> DescriptiveStatsResponse:
+    """Calcule les statistiques descriptives d'une colonne."""
+    column_data = series.dropna()
+    total_rows_in_df = len(series)
+    valid_count = len(column_data)
+    missing_values = total_rows_in_df - valid_count
+    
+    stats = {
+        "variable_name": variable_name,
+        "count": valid_count,
+        "missing_values": missing_values,
+    }
+
+    # Détection du type de données
+    if pd.api.types.is_numeric_dtype(column_data) and valid_count > 0:
+        column_data = as_float64(column_data)
+        stats["data_type_detected"] = "numeric"
+        stats["mean"] = column_data.mean()
+        stats["median"] = column_data.median()
+        stats["std_dev"] = column_data.std()
+        stats["min_val"] = column_data.min()
+        stats["max_val"] = column_data.max()
+        # Utiliser scipy pour des quartiles plus robustes, pandas utilise une interpolation par défaut.
+        if valid_count >= 4 : # Besoin d'assez de données pour les quartiles
+            stats["q1"] = column_data.quantile(0.25) # Alternative: scipy_stats.scoreatpercentile(column_data, 25)
+            stats["q3"] = column_data.quantile(0.75) # Alternative: scipy_stats.scoreatpercentile(column_data, 75)
+        else:
+            stats["q1"] = None
+            stats["q3"] = None
+        stats["unique_values_count"] = column_data.nunique()
+
+    elif valid_count > 0 and isinstance(column_data.dtype, pd.CategoricalDtype):
+        # Comptage sur les codes entiers : aucune comparaison de chaînes
+        stats["data_type_detected"] = "categorical"
+        counts = np.bincount(column_data.cat.codes.to_numpy(), minlength=len(column_data.cat.categories))
+        stats["unique_values_count"] = int(np.count_nonzero(counts))
+        top_codes = np.argsort(-counts, kind='stable')[:10] # Les 10 plus fréquentes
+        stats["top_frequencies"] = [
+            {"value": column_data.cat.categories[code], "count": int(counts[code])} for code in top_codes if counts[code] > 0
+        ]
+    elif valid_count > 0 : # Si non numérique ou mixte, traiter comme catégoriel/texte
+        stats["data_type_detected"] = "categorical" if pd.api.types.is_object_dtype(column_data) or pd.api.types.is_string_dtype(column_data) else "mixed"
+        stats["unique_values_count"] = column_data.nunique()
+        top_freq = column_data.value_counts().nlargest(10) # Les 10 plus fréquentes
+        stats["top_frequencies"] = [{"value": idx, "count": val} for idx, val in top_freq.items()]
+    else: # Colonne vide après dropna
+        stats["data_type_detected"] = "empty"
+        stats["unique_values_count"] = 0
+
+
+    return DescriptiveStatsResponse(**stats)
+
+
+def compute_descriptive_stats_frame(df: pd.DataFrame) -> List[DescriptiveStatsResponse]:
+    """Calcule les statistiques descriptives de toutes les colonnes d'un DataFrame.
+
+    Les colonnes numériques sont traitées ensemble par des opérations vectorisées sur le
+    DataFrame (une seule passe de quantiles) ; les autres colonnes passent par
+    compute_descriptive_stats (un value_counts par colonne).
+    """
+    # Même test que compute_descriptive_stats : les booléens comptent comme numériques
+    counts = df.count()
+    numeric_columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and counts[c] > 0]
+    # Calculs en double précision, même pour les colonnes stockées en float32 ou booléennes
+    numeric_df = pd.DataFrame({c: as_float64(df[c]) for c in numeric_columns}, index=df.index)
+
+    numeric_stats = {}
+    if numeric_columns:
+        quantiles = numeric_df.quantile([0.25, 0.5, 0.75])
+        means = numeric_df.mean()
+        std_devs = numeric_df.std()
+        min_vals = numeric_df.min()
+        max_vals = numeric_df.max()
+        unique_counts = numeric_df.nunique()
+        for column in numeric_columns:
+            valid_count = int(counts[column])
+            has_quartiles = valid_count >= 4 # Besoin d'assez de données pour les quartiles
+            numeric_stats[column] = DescriptiveStatsResponse(
+                variable_name=column,
+                count=valid_count,
+                missing_values=len(df) - valid_count,
+                data_type_detected="numeric",
+                mean=means[column],
+                median=quantiles.at[0.5, column],
+                std_dev=std_devs[column],
+                min_val=min_vals[column],
+                max_val=max_vals[column],
+                q1=quantiles.at[0.25, column] if has_quartiles else None,
+                q3=quantiles.at[0.75, column] if has_quartiles else None,
+                unique_values_count=int(unique_counts[column]),
+            )
+
+    return [
+        numeric_stats[column] if column in numeric_stats else compute_descriptive_stats(df[column], column)
+        for column in df.columns
+    ]
+
+
+def profile_error_bounds(column_profile: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Champs d'incertitude de la réponse (taille d'échantillon, erreur de rang, intervalles) tirés du profil."""
+    intervals = {name: bounds for name, bounds in (column_profile.get('quantile_bounds') or {}).items() if name in fields}
+    unique_error = column_profile.get('unique_values_error')
+    unique_estimate = column_profile.get('unique_values_count')
+    if 'unique_values_count' in fields and unique_error and unique_estimate is not None:
+        # Erreur relative de l'estimation HyperLogLog
+        intervals['unique_values_count'] = [unique_estimate * (1 - Z_SCORE * unique_error), unique_estimate * (1 + Z_SCORE * unique_error)]
+    return {
+        'sample_size': column_profile.get('sample_size'),
+        'rank_error': column_profile.get('rank_error') or None,
+        'confidence_level': CONFIDENCE_LEVEL if intervals else None,
+        'confidence_intervals': intervals or None,
+    }
+
+
+def stats_from_profile(column_profile: Dict[str, Any], variable_name: str) -> DescriptiveStatsResponse:
+    """Construit la réponse de statistiques à partir du profil calculé par la Lambda (ou d'un échantillon)."""
+    valid_count = column_profile['count']
+    has_quartiles = valid_count >= 4 # Même règle que compute_descriptive_stats
+    top_frequencies = column_profile.get('top_frequencies')
+    top_error = column_profile.get('top_frequencies_error')
+    if top_frequencies and top_error:
+        # Misra-Gries sous-estime chaque compte d'au plus top_frequencies_error
+        top_frequencies = [dict(entry, count_lower=entry['count'], count_upper=entry['count'] + top_error) for entry in top_frequencies]
+    return DescriptiveStatsResponse(
+        variable_name=variable_name,
+        count=valid_count,
+        missing_values=column_profile['missing'],
+        data_type_detected=column_profile['data_type'],
+        mean=column_profile.get('mean'),
+        median=column_profile.get('median'),
+        std_dev=column_profile.get('std_dev'),
+        min_val=column_profile.get('min'),
+        max_val=column_profile.get('max'),
+        q1=column_profile.get('q1') if has_quartiles else None,
+        q3=column_profile.get('q3') if has_quartiles else None,
+        unique_values_count=column_profile.get('unique_values_count'),
+        top_frequencies=top_frequencies,
+        approximate=bool(column_profile.get('rank_error')) or not column_profile.get('unique_values_exact', True)
+                    or bool(top_error),
+        **profile_error_bounds(column_profile, ['median', 'unique_values_count'] + (['q1', 'q3'] if has_quartiles else [])),
+    )
+
+
+def pick_outliers(sorted_values: np.ndarray, budget: int, extremes_at_start: bool) -> np.ndarray:
+    """Sous-ensemble déterministe d'outliers triés : les plus extrêmes, puis des valeurs régulièrement espacées."""
+    if len(sorted_values) <= budget:
+        return sorted_values
+    if budget <= 0:
+        return sorted_values[:0]
+    n_extremes = max(1, budget // 4)
+    if extremes_at_start:
+        extremes, rest = sorted_values[:n_extremes], sorted_values[n_extremes:]
+    else:
+        extremes, rest = sorted_values[-n_extremes:], sorted_values[:-n_extremes]
+    spread = rest[np.unique(np.linspace(0, len(rest) - 1, budget - n_extremes).round().astype(int))] if budget > n_extremes else rest[:0]
+    return np.concatenate([extremes, spread] if extremes_at_start else [spread, extremes])
+
+
+def sample_outliers(low_outliers: np.ndarray, high_outliers: np.ndarray, limit: int, low_count: int, high_count: int) -> List[float]:
+    """Répartit le plafond d'outliers entre les deux côtés, proportionnellement à leurs effectifs."""
+    total = low_count + high_count
+    if total == 0:
+        return []
+    low_budget = int(round(limit * low_count / total))
+    if limit >= 2:
+        # Chaque côté qui a des outliers en montre au moins un
+        low_budget = min(max(low_budget, 1 if low_count else 0), limit - (1 if high_count else 0))
+    high_budget = limit - low_budget
+    picked = np.concatenate([pick_outliers(low_outliers, low_budget, True), pick_outliers(high_outliers, high_budget, False)])
+    return picked.tolist()
+
+
+def boxplot_from_profile(column_profile: Dict[str, Any], variable_name: str, max_outliers: int = BOXPLOT_MAX_OUTLIERS) -> BoxplotDataResponse:
+    """Construit les données du boxplot à partir du profil (outliers limités aux valeurs extrêmes conservées)."""
+    if column_profile['data_type'] != 'numeric':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Variable '{variable_name}' is not numeric or is empty, cannot generate boxplot data.")
+
+    q1, q3 = column_profile['q1'], column_profile['q3']
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+    lowest, highest = column_profile['lowest_values'], column_profile['highest_values']
+    low_outliers = np.array([v for v in lowest if v < lower_bound], dtype=float)
+    high_outliers = np.array([v for v in highest if v > upper_bound], dtype=float)
+
+    if 'outlier_counts' in column_profile:
+        low_count, high_count = column_profile['outlier_counts']
+        lower_whisker, upper_whisker = column_profile['whiskers']
+        counts_exact = column_profile.get('outlier_counts_exact', False)
+    else:
+        # Profil antérieur aux moustaches : seules les valeurs extrêmes conservées sont connues
+        low_count, high_count = len(low_outliers), len(high_outliers)
+        inner = [v for v in lowest + highest if lower_bound <= v <= upper_bound]
+        lower_whisker = min(inner, default=q1)
+        upper_whisker = max(inner, default=q3)
+        counts_exact = not (column_profile['count'] > len(lowest) and (low_count == len(lowest) or high_count == len(highest)))
+
+    outliers = sample_outliers(low_outliers, high_outliers, max_outliers, low_count, high_count)
+    return BoxplotDataResponse(
+        variable_name=variable_name,
+        min_val=column_profile['min'],
+        q1=q1,
+        median=column_profile['median'],
+        q3=q3,
+        max_val=column_profile['max'],
+        lower_whisker=lower_whisker,
+        upper_whisker=upper_whisker,
+        outlier_count_low=low_count,
+        outlier_count_high=high_count,
+        outliers=outliers,
+        outliers_truncated=len(outliers) < low_count + high_count,
+        approximate=bool(column_profile.get('rank_error')) or not counts_exact,
+        **profile_error_bounds(column_profile, ['q1', 'median', 'q3']),
+    )
+
+
+def compute_boxplot_data(series: pd.Series, variable_name: str, max_outliers: int = BOXPLOT_MAX_OUTLIERS) -> BoxplotDataResponse:
+    """Calcule les données du boxplot d'une colonne numérique.
+
+    Un seul np.partition place les quartiles à leur rang ; seuls le premier et le dernier
+    quart du tableau sont ensuite parcourus pour les moustaches et les outliers.
+    """
+    column_data = series.dropna()
+
+    if not pd.api.types.is_numeric_dtype(column_data) or column_data.empty:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Variable '{variable_name}' is not numeric or is empty, cannot generate boxplot data.")
+
+    values = column_data.to_numpy(dtype=float)
+    n = len(values)
+    # Rangs encadrant chaque quantile (interpolation linéaire, comme pandas)
+    positions = [q * (n - 1) for q in (0.25, 0.5, 0.75)]
+    bounds = [(int(np.floor(p)), int(np.ceil(p))) for p in positions]
+    partitioned = np.partition(values, sorted({k for pair in bounds for k in pair}))
+    q1, median, q3 = (
+        float(partitioned[lo] + (partitioned[hi] - partitioned[lo]) * (p - lo))
+        for p, (lo, hi) in zip(positions, bounds)
+    )
+
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+
+    # Tout ce qui suit l'indice du plafond de q1 est >= q1 : les outliers bas sont avant
+    low_part = partitioned[:bounds[0][1] + 1]
+    low_mask = low_part < lower_bound
+    low_outliers = np.sort(low_part[low_mask])
+    # Tout ce qui précède l'indice du plancher de q3 est <= q3 : les outliers hauts sont après
+    high_part = partitioned[bounds[2][0]:]
+    high_mask = high_part > upper_bound
+    high_outliers = np.sort(high_part[high_mask])
+
+    outliers = sample_outliers(low_outliers, high_outliers, max_outliers, len(low_outliers), len(high_outliers))
+    return BoxplotDataResponse(
+        variable_name=variable_name,
+        min_val=float(low_part.min()),
+        q1=q1,
+        median=median,
+        q3=q3,
+        max_val=float(high_part.max()),
+        lower_whisker=float(low_part[~low_mask].min()),
+        upper_whisker=float(high_part[~high_mask].max()),
+        outlier_count_low=len(low_outliers),
+        outlier_count_high=len(high_outliers),
+        outliers=outliers,
+        outliers_truncated=len(outliers) < len(low_outliers) + len(high_outliers),
+    )
+
+
+def histogram_bin_count(values: np.ndarray, rule: str) -> int:
+    """Nombre de classes selon la règle de Sturges ou de Freedman-Diaconis, borné par HISTOGRAM_MAX_BINS."""
+    n = len(values)
+    if rule == 'sturges':
+        bin_count = int(np.ceil(np.log2(n))) + 1
+    else:
+        q1, q3 = np.percentile(values, [25, 75])
+        width = 2 * (q3 - q1) / np.cbrt(n)
+        value_range = values.max() - values.min()
+        # IQR nul (valeurs très concentrées) : repli sur Sturges
+        bin_count = int(np.ceil(value_range / width)) if width > 0 else int(np.ceil(np.log2(n))) + 1
+    return max(1, min(bin_count, HISTOGRAM_MAX_BINS))
+
+
+def gaussian_kde_binned(values: np.ndarray, points: int) -> Dict[str, Any]:
+    """Estimation de densité à noyau gaussien (largeur de Scott) sur une grille régulière.
+
+    Les valeurs sont d'abord réparties sur la grille puis convoluées avec le noyau : le coût
+    est O(n + points²) au lieu de O(n × points) pour une évaluation directe.
+    """
+    n = len(values)
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    bandwidth = 1.06 * std * n ** (-1 / 5) if std > 0 else 1.0
+    low, high = float(values.min()) - 3 * bandwidth, float(values.max()) + 3 * bandwidth
+    grid = np.linspace(low, high, points)
+    step = grid[1] - grid[0]
+    grid_counts, _ = np.histogram(values, bins=points, range=(low - step / 2, high + step / 2))
+    half_width = int(np.ceil(4 * bandwidth / step))
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    density = np.convolve(grid_counts, kernel)[half_width:half_width + points] / (n * step)
+    return {'x': grid, 'y': density, 'bandwidth': bandwidth}
+
+
+def compute_histogram_data(series: pd.Series, variable_name: str, bins: str, edges: Optional[List[float]],
+                           log_scale: bool, kde: bool, kde_points: int) -> HistogramDataResponse:
+    """Calcule un histogramme (et éventuellement une densité) d'une colonne numérique, en NumPy vectorisé.
+
+    Seuls les bornes et les effectifs sont renvoyés : la taille de la réponse dépend du nombre
+    de classes, pas du nombre de lignes.
+    """
+    column_data = series.dropna()
+    if not pd.api.types.is_numeric_dtype(column_data) or column_data.empty:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Variable '{variable_name}' is not numeric or is empty, cannot generate histogram data.")
+
+    values = column_data.to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    excluded_count = len(column_data) - len(values)
+    if log_scale:
+        positive = values[values > 0]
+        excluded_count += len(values) - len(positive)
+        values = np.log10(positive)
+    if len(values) == 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Variable '{variable_name}' has no value to bin{' on a log scale' if log_scale else ''}.")
+
+    if edges:
+        bin_edges = np.asarray(edges, dtype=float)
+        if len(bin_edges) < 2 or not np.all(np.diff(bin_edges) > 0):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bin edges must contain at least two strictly increasing values.")
+        if log_scale:
+            if bin_edges[0] <= 0:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bin edges must be positive on a log scale.")
+            bin_edges = np.log10(bin_edges)
+        bin_rule = 'edges'
+        counts, bin_edges = np.histogram(values, bins=bin_edges)
+        excluded_count += len(values) - int(counts.sum())
+    else:
+        if bins in ('sturges', 'fd'):
+            bin_rule, bin_count = bins, histogram_bin_count(values, bins)
+        else:
+            bin_rule, bin_count = 'fixed', int(bins)
+        counts, bin_edges = np.histogram(values, bins=bin_count)
+
+    response = {
+        'variable_name': variable_name,
+        'bin_rule': bin_rule,
+        'log_scale': log_scale,
+        'bin_edges': (10 ** bin_edges if log_scale else bin_edges).tolist(),
+        'counts': counts.tolist(),
+        'count': int(counts.sum()),
+        'excluded_count': excluded_count,
+    }
+    if kde:
+        density = gaussian_kde_binned(values, kde_points)
+        response.update({
+            'density_x': (10 ** density['x'] if log_scale else density['x']).tolist(),
+            'density_y': density['y'].tolist(),
+            'bandwidth': density['bandwidth'],
+        })
+    return HistogramDataResponse(**response)
+
 
 @app.post("/files/initiate-upload", response_model=FileInitiateUploadResponse, status_code=status.HTTP_200_OK)
 async def initiate_file_upload(
@@ -281,7 +1289,7 @@ async def confirm_file_upload(
     
     # Étape 1: Vérifier si l'objet existe réellement sur S3
     try:
-        s3_client.head_object(Bucket=BUCKET_NAME, Key=payload.s3_object_key)
+        await run_io(s3_client.head_object, Bucket=BUCKET_NAME, Key=payload.s3_object_key)
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
             logger.error(f"S3 object not found for confirmation: {payload.s3_object_key} for user {user}, file_id {payload.file_id}")
@@ -304,7 +1312,10 @@ async def confirm_file_upload(
     logger.debug(f"Item to be put in DynamoDB for user {user}, file_id from payload {payload.file_id}: {item_for_db}")
 
     try:
-        files_table.put_item(Item=item_for_db)
+        await run_io(files_table.put_item, Item=item_for_db)
+        metadata_cache.invalidate(user, payload.file_id)
+        # Niveau disque : verrou fcntl et suppression de fichiers, hors de la boucle d'événements
+        await run_io(dataframe_cache.invalidate, user, payload.file_id)
         logger.info(f"Successfully stored metadata in DynamoDB for user {user}, file_id from payload {payload.file_id} (DynamoDB 'id': {item_for_db['id']})")
         
         response_data = {
@@ -332,49 +1343,82 @@ async def confirm_file_upload(
         logger.error(f"Unexpected error during file metadata storage for user {user}, file_id from payload {payload.file_id} (DynamoDB 'id': {item_for_db['id']}): {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected internal server error occurred while storing file metadata.")
 
+def file_metadata_response(item_db: Dict[str, Any]) -> FileMetadataResponse:
+    """Convertit un item DynamoDB en réponse (la clé 'id' de la table devient 'file_id')."""
+    return FileMetadataResponse(
+        user=item_db.get('user'),
+        file_id=item_db.get('id'),
+        original_filename=item_db.get('original_filename'),
+        s3_object_key=item_db.get('s3_object_key'),
+        file_type=item_db.get('file_type'),
+        upload_timestamp=item_db.get('upload_timestamp'),
+        file_size=item_db.get('file_size'), # Pydantic gère Decimal vers int
+        status=item_db.get('status') or 'uploaded',
+        columnHeaders=item_db.get('columnHeaders'),
+        rowCount=item_db.get('rowCount'),
+        columnCount=item_db.get('columnCount'),
+        processingStatus=item_db.get('processingStatus'),
+        processedTimestamp=item_db.get('processedTimestamp'),
+    )
+
+
+def encode_page_token(last_evaluated_key: Dict[str, Any]) -> str:
+    """Jeton de pagination opaque encapsulant le LastEvaluatedKey de DynamoDB."""
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, default=str).encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token: str, user: str) -> Dict[str, Any]:
+    """Décode un jeton de pagination (400 s'il est invalide ou appartient à un autre utilisateur)."""
+    try:
+        start_key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination token.")
+    if not isinstance(start_key, dict) or start_key.get('user') != user or not all(isinstance(v, str) for v in start_key.values()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination token.")
+    return start_key
+
+
 @app.get("/files", response_model=List[FileMetadataResponse])
-async def get_user_files(authorization: Union[str, None] = Header(default=None)):
+async def get_user_files(
+    response: Response,
+    limit: int = Query(FILES_PAGE_DEFAULT_LIMIT, ge=1, le=FILES_PAGE_MAX_LIMIT),
+    next_token: Optional[str] = None,
+    authorization: Union[str, None] = Header(default=None)
+):
+    """Une page des fichiers de l'utilisateur, du plus récent au plus ancien.
+
+    S'il reste des fichiers, l'en-tête X-Next-Token contient le jeton à repasser en next_token.
+    """
     user = authorization
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
 
-    logger.info(f"Fetching files for user: '{user}'")
+    logger.info(f"Fetching files for user: '{user}' (limit {limit})")
+    query_kwargs = {
+        'IndexName': FILES_BY_UPLOAD_INDEX,
+        'KeyConditionExpression': Key('user').eq(user),
+        'ScanIndexForward': False, # Tri décroissant sur upload_timestamp fait par DynamoDB
+        'Limit': limit,
+        # 'user' et 'status' sont des mots réservés DynamoDB
+        'ProjectionExpression': ", ".join(f"#a{i}" for i in range(len(FILE_LIST_ATTRIBUTES))),
+        'ExpressionAttributeNames': {f"#a{i}": name for i, name in enumerate(FILE_LIST_ATTRIBUTES)},
+    }
+    if next_token:
+        query_kwargs['ExclusiveStartKey'] = decode_page_token(next_token, user)
     try:
-        response = files_table.query(
-            KeyConditionExpression=Key('user').eq(user)
-        )
-        items_from_db = response.get('Items', [])
-        sorted_items_from_db = sorted(items_from_db, key=lambda x: x.get('upload_timestamp', ''), reverse=True)
-        
-        logger.debug(f"Items retrieved from DynamoDB for user {user}: {sorted_items_from_db[:2]}") 
-        response_items = []
-        for item_db in sorted_items_from_db:
-
-            data_for_response_model = {
-                'user': item_db.get('user'),
-                'file_id': item_db.get('id'),  # <--- MAPPAGE CRUCIAL ICI
-                'original_filename': item_db.get('original_filename'),
-                's3_object_key': item_db.get('s3_object_key'),
-                'file_type': item_db.get('file_type'),
-                'upload_timestamp': item_db.get('upload_timestamp'),
-                'file_size': item_db.get('file_size'), # Pydantic gère Decimal vers int/float si nécessaire ou vous pouvez caster
-                'status': item_db.get('status'),
-                'columnHeaders': item_db.get('columnHeaders'),
-                'rowCount': item_db.get('rowCount'),
-                'columnCount': item_db.get('columnCount'),
-                'processingStatus': item_db.get('processingStatus'),
-                'processedTimestamp': item_db.get('processedTimestamp')
-            }
-
-            response_items.append(FileMetadataResponse(**data_for_response_model))
-            
+        with stage_metrics.stage("dynamodb_query"):
+            db_response = await run_io(files_table.query, **query_kwargs)
+        response_items = [file_metadata_response(item_db) for item_db in db_response.get('Items', [])]
+        last_evaluated_key = db_response.get('LastEvaluatedKey')
+        if last_evaluated_key:
+            response.headers['X-Next-Token'] = encode_page_token(last_evaluated_key)
         logger.info(f"DynamoDB Query returned {len(response_items)} files for user {user}.")
         return response_items
 
     except ClientError as e:
         logger.error(f"DynamoDB ClientError fetching files for user {user}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Database error: {e.response['Error']['Message']}")
-    except pydantic_core._pydantic_core.ValidationError as e:
+    except ValidationError as e:
         logger.error(f"Pydantic ValidationError fetching files for user {user}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Data validation error: {str(e)}")
     except Exception as e:
@@ -382,6 +1426,34 @@ async def get_user_files(authorization: Union[str, None] = Header(default=None))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error during file retrieval")
 
 
+@app.get("/files/{file_id}", response_model=FileMetadataResponse)
+async def get_file_details(
+    file_id: str,
+    authorization: Union[str, None] = Header(default=None)
+):
+    """Métadonnées complètes d'un fichier, en-têtes de colonnes compris."""
+    user = authorization
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
+    return file_metadata_response(await get_file_item(user, file_id))
+
+
+@app.post("/files/details", response_model=List[FileMetadataResponse])
+async def get_files_details(
+    payload: FileDetailsBatchRequest,
+    authorization: Union[str, None] = Header(default=None)
+):
+    """Métadonnées complètes de plusieurs fichiers en un appel, dans l'ordre demandé."""
+    user = authorization
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
+    items = await get_file_items(user, payload.file_ids)
+    unknown_ids = [file_id for file_id in dict.fromkeys(payload.file_ids) if file_id not in items]
+    if unknown_ids:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Files not found: {unknown_ids}")
+    return [file_metadata_response(items[file_id]) for file_id in dict.fromkeys(payload.file_ids)]
+
+
 @app.get("/files/{file_id}/download-url", response_model=FileDownloadUrlResponse)
 async def get_file_download_url_endpoint( # Renommé pour éviter conflit avec la fonction helper
     file_id: str,
@@ -392,126 +1464,206 @@ async def get_file_download_url_endpoint( # Renommé pour éviter conflit avec l
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
     if not BUCKET_NAME:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="S3 Bucket not configured")
-    try:
-        response = files_table.get_item(Key={'user': user, 'file_id': file_id})
-        item = response.get('Item')
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found for this user.")
-        s3_object_key = item.get('s3_object_key')
-        if not s3_object_key:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="File record is incomplete.")
-        download_url_val = generate_s3_presigned_url(BUCKET_NAME, s3_object_key, client_method='get_object')
-        if not download_url_val:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not generate download URL")
-        return FileDownloadUrlResponse(download_url=download_url_val, s3_object_key=s3_object_key)
-    except ClientError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e.response['Error']['Message']}")
-    except HTTPException: raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
-
+    item = await get_file_item(user, file_id)
+    s3_object_key = item.get('s3_object_key')
+    if not s3_object_key:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="File record is incomplete.")
+    download_url_val = generate_s3_presigned_url(BUCKET_NAME, s3_object_key, client_method='get_object')
+    if not download_url_val:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not generate download URL")
+    return FileDownloadUrlResponse(download_url=download_url_val, s3_object_key=s3_object_key)
 
 
 @app.get("/files/{file_id}/statistics/{variable_name}", response_model=DescriptiveStatsResponse)
 async def get_file_statistics(
+    request: Request,
+    response: Response,
     file_id: str,
     variable_name: str,
+    mode: StatisticsMode = "auto",
+    exact: bool = False, # Équivaut à mode=exact
     authorization: Union[str, None] = Header(default=None)
 ):
     user = authorization
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
 
-    df = await get_dataframe_from_s3(user, file_id)
+    item = await get_file_item(user, file_id)
+    check_columns_exist(item, [variable_name]) # 404 sur les en-têtes stockés, avant tout accès au profil ou aux données
+    mode = "exact" if exact else mode
+    # Seule la lecture de l'item est nécessaire pour répondre 304
+    not_modified = conditional_response(request, response, result_etag(item, "statistics", variable=variable_name, mode=mode))
+    if not_modified is not None:
+        return not_modified
+    if mode != "exact":
+        # Réponse directe depuis le profil calculé à l'ingestion, sans charger les données
+        column_profile = await get_column_profile(item, variable_name)
+        if column_profile is not None:
+            return stats_from_profile(column_profile, variable_name)
+    if mode == "approx":
+        return stats_from_profile(await get_approximate_column_summary(user, file_id, item, variable_name), variable_name)
+    if mode == "auto" and needs_out_of_core(item, [variable_name]):
+        column_summaries = await get_out_of_core_summaries(user, file_id, item, [variable_name])
+        return stats_from_profile(column_summaries[variable_name], variable_name)
+
+    df = await get_dataframe_from_s3(user, file_id, columns=[variable_name], item=item)
     
     if variable_name not in df.columns:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{variable_name}' not found in the file.")
 
-    column_data = df[variable_name].dropna()
-    total_rows_in_df = len(df)
-    valid_count = len(column_data)
-    missing_values = total_rows_in_df - valid_count
-    
-    stats = {
-        "variable_name": variable_name,
-        "count": valid_count,
-        "missing_values": missing_values,
-    }
-
-    # Détection du type de données
-    if pd.api.types.is_numeric_dtype(column_data) and valid_count > 0:
-        stats["data_type_detected"] = "numeric"
-        stats["mean"] = column_data.mean()
-        stats["median"] = column_data.median()
-        stats["std_dev"] = column_data.std()
-        stats["min_val"] = column_data.min()
-        stats["max_val"] = column_data.max()
-        # Utiliser scipy pour des quartiles plus robustes, pandas utilise une interpolation par défaut.
-        if valid_count >= 4 : # Besoin d'assez de données pour les quartiles
-            stats["q1"] = column_data.quantile(0.25) # Alternative: scipy_stats.scoreatpercentile(column_data, 25)
-            stats["q3"] = column_data.quantile(0.75) # Alternative: scipy_stats.scoreatpercentile(column_data, 75)
-        else:
-            stats["q1"] = None
-            stats["q3"] = None
-        stats["unique_values_count"] = column_data.nunique()
+    with stage_metrics.stage("compute_statistics"):
+        return await run_cpu(compute_descriptive_stats, df[variable_name], variable_name)
 
-    elif valid_count > 0 : # Si non numérique ou mixte, traiter comme catégoriel/texte
-        stats["data_type_detected"] = "categorical" if pd.api.types.is_object_dtype(column_data) or pd.api.types.is_string_dtype(column_data) else "mixed"
-        stats["unique_values_count"] = column_data.nunique()
-        top_freq = column_data.value_counts().nlargest(10) # Les 10 plus fréquentes
-        stats["top_frequencies"] = [{"value": idx, "count": val} for idx, val in top_freq.items()]
-    else: # Colonne vide après dropna
-        stats["data_type_detected"] = "empty"
-        stats["unique_values_count"] = 0
 
+@app.post("/files/{file_id}/statistics", response_model=List[DescriptiveStatsResponse])
+async def get_file_statistics_batch(
+    request: Request,
+    response: Response,
+    file_id: str,
+    payload: BatchStatisticsRequest,
+    exact: bool = False, # Calcul sur les données même si le profil d'ingestion couvre les colonnes
+    authorization: Union[str, None] = Header(default=None)
+):
+    user = authorization
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
 
-    return DescriptiveStatsResponse(**stats)
+    columns = None if payload.columns == "all" else list(dict.fromkeys(payload.columns))
+    item = await get_file_item(user, file_id)
+    check_columns_exist(item, columns)
+    not_modified = conditional_response(request, response, result_etag(
+        item, "statistics_batch", columns=sorted(columns) if columns is not None else "all", exact=exact,
+    ))
+    if not_modified is not None:
+        return not_modified
+    if not exact:
+        # Réponse depuis le profil d'ingestion si toutes les colonnes demandées y figurent
+        profile = await get_file_profile(item)
+        profile_columns = (profile or {}).get('columns', {})
+        requested = columns if columns is not None else [str(h).strip() for h in item.get('columnHeaders') or []]
+        if requested and all(c in profile_columns for c in requested):
+            return [stats_from_profile(profile_columns[c], c) for c in requested]
+    if needs_out_of_core(item, columns):
+        column_summaries = await get_out_of_core_summaries(user, file_id, item, columns)
+        return [stats_from_profile(summary, name) for name, summary in column_summaries.items()]
+    df = await get_dataframe_from_s3(user, file_id, columns=columns, item=item)
+
+    if columns is not None:
+        unknown_columns = [c for c in columns if c not in df.columns]
+        if unknown_columns:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variables not found in the file: {unknown_columns}")
+        df = df[columns]
+
+    with stage_metrics.stage("compute_statistics"):
+        return await run_cpu(compute_descriptive_stats_frame, df)
 
 
 @app.get("/files/{file_id}/graph-data/boxplot/{variable_name}", response_model=BoxplotDataResponse)
 async def get_boxplot_data(
+    request: Request,
+    response: Response,
     file_id: str,
     variable_name: str,
+    mode: StatisticsMode = "auto",
+    exact: bool = False, # Équivaut à mode=exact
+    max_outliers: int = Query(BOXPLOT_MAX_OUTLIERS, ge=0, le=BOXPLOT_OUTLIERS_LIMIT),
     authorization: Union[str, None] = Header(default=None)
 ):
     user = authorization
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
 
-    df = await get_dataframe_from_s3(user, file_id)
+    item = await get_file_item(user, file_id)
+    check_columns_exist(item, [variable_name])
+    mode = "exact" if exact else mode
+    not_modified = conditional_response(request, response, result_etag(item, "boxplot", variable=variable_name, mode=mode, max_outliers=max_outliers))
+    if not_modified is not None:
+        return not_modified
+    if mode != "exact":
+        column_profile = await get_column_profile(item, variable_name)
+        if column_profile is not None:
+            return boxplot_from_profile(column_profile, variable_name, max_outliers)
+    if mode == "approx":
+        return boxplot_from_profile(await get_approximate_column_summary(user, file_id, item, variable_name), variable_name, max_outliers)
+    if mode == "auto" and needs_out_of_core(item, [variable_name]):
+        column_summaries = await get_out_of_core_summaries(user, file_id, item, [variable_name])
+        return boxplot_from_profile(column_summaries[variable_name], variable_name, max_outliers)
+
+    df = await get_dataframe_from_s3(user, file_id, columns=[variable_name], item=item)
 
     if variable_name not in df.columns:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{variable_name}' not found in the file.")
 
-    column_data = df[variable_name].dropna()
+    with stage_metrics.stage("compute_boxplot"):
+        return await run_cpu(compute_boxplot_data, df[variable_name], variable_name, max_outliers)
 
-    if not pd.api.types.is_numeric_dtype(column_data) or column_data.empty:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Variable '{variable_name}' is not numeric or is empty, cannot generate boxplot data.")
 
-    # Calcul des statistiques pour le boxplot
-    min_val = float(column_data.min())
-    q1 = float(column_data.quantile(0.25))
-    median = float(column_data.median())
-    q3 = float(column_data.quantile(0.75))
-    max_val = float(column_data.max())
+@app.get("/files/{file_id}/graph-data/histogram/{variable_name}", response_model=HistogramDataResponse)
+async def get_histogram_data(
+    request: Request,
+    response: Response,
+    file_id: str,
+    variable_name: str,
+    bins: str = Query("sturges", pattern=r"^(sturges|fd|\d+)$", description="'sturges', 'fd' ou un nombre de classes"),
+    edges: Optional[List[float]] = Query(None, description="Bornes explicites des classes (prioritaires sur bins)"),
+    log_scale: bool = False,
+    kde: bool = False,
+    kde_points: int = Query(256, ge=2, le=KDE_MAX_POINTS),
+    authorization: Union[str, None] = Header(default=None)
+):
+    user = authorization
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
+    if bins.isdigit() and not 1 <= int(bins) <= HISTOGRAM_MAX_BINS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Number of bins must be between 1 and {HISTOGRAM_MAX_BINS}.")
+    if edges and len(edges) > HISTOGRAM_MAX_BINS + 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {HISTOGRAM_MAX_BINS + 1} bin edges are allowed.")
 
-    # Calcul des outliers (exemple simple, peut être affiné)
-    iqr = q3 - q1
-    lower_bound = q1 - 1.5 * iqr
-    upper_bound = q3 + 1.5 * iqr
-    
-    outliers = column_data[(column_data < lower_bound) | (column_data > upper_bound)].tolist()
+    item = await get_file_item(user, file_id)
+    etag = result_etag(item, "histogram", variable=variable_name, bins=bins, edges=edges, log_scale=log_scale, kde=kde, kde_points=kde_points)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified is not None:
+        return not_modified
 
-    return BoxplotDataResponse(
-        variable_name=variable_name,
-        min_val=min_val, # Ou la plus petite valeur dans lower_bound si on veut afficher les moustaches correctement
-        q1=q1,
-        median=median,
-        q3=q3,
-        max_val=max_val, # Ou la plus grande valeur dans upper_bound
-        outliers=outliers # Laisser la bibliothèque de graphiques gérer l'affichage des outliers
-    )
+    # Cache mémoire puis copie colonnaire, comme les autres endpoints : seule la colonne est lue
+    df = await get_dataframe_from_s3(user, file_id, columns=[variable_name], item=item)
+
+    if variable_name not in df.columns:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Variable '{variable_name}' not found in the file.")
+
+    with stage_metrics.stage("compute_histogram"):
+        return await run_cpu(compute_histogram_data, df[variable_name], variable_name, bins, edges, log_scale, kde, kde_points)
+
+
+@app.get("/files/{file_id}/memory-report", response_model=FileMemoryReportResponse)
+async def get_file_memory_report(
+    file_id: str,
+    authorization: Union[str, None] = Header(default=None)
+):
+    """Mémoire occupée par le fichier chargé, avant et après optimisation des types, colonne par colonne."""
+    user = authorization
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated")
+    report = memory_reports.get((user, file_id))
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No memory report: the file has not been loaded by this worker yet.")
+    return FileMemoryReportResponse(file_id=file_id, **report)
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {**dataframe_cache.stats(), "metadata": metadata_cache.stats(), "loads": dataframe_loads.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Histogrammes de durée par étape et compteurs d'octets/lignes, au format texte Prometheus."""
+    return PlainTextResponse(stage_metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8080, log_level="debug")
\ No newline at end of file
+    if WEB_WORKERS > 1:
+        # Chaque worker importe le module : l'application doit être passée par son chemin
+        uvicorn.run("app:app", host="0.0.0.0", port=8080, log_level="debug", workers=WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8080, log_level="debug")
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""Statistiques approchées d'une colonne, calculées par morceaux en mémoire bornée.
+
+Effectifs, moyenne, écart-type, minimum et maximum sont exacts. Quartiles, valeurs
+distinctes et fréquences viennent d'un échantillon uniforme de taille bornée, tiré par
+« bottom-k » (on garde les valeurs ayant les plus petites clés aléatoires, ce qui se
+fusionne d'un morceau à l'autre), et sont accompagnés d'intervalles de confiance.
+
+Le résumé produit a la même forme que celui du profil calculé par la Lambda
+(column_profile.py) : le webservice le convertit avec les mêmes fonctions.
+"""
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+APPROX_SAMPLE_SIZE = int(os.getenv("APPROX_SAMPLE_SIZE", "100000"))
+CONFIDENCE_LEVEL = 0.95
+Z_SCORE = 1.959963984540054 # Quantile 97.5 % de la loi normale
+TOP_K = 10
+EXTREMES_K = 50
+
+
+class StreamingColumnSample:
+    """Accumulateurs exacts et échantillon uniforme d'une colonne, alimentés morceau par morceau."""
+
+    def __init__(self, name: str, sample_size: int = APPROX_SAMPLE_SIZE, seed: int = 0):
+        self.name = name
+        self.sample_size = sample_size
+        self.count = 0
+        self.missing = 0
+        self.numeric = True
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._rng = np.random.default_rng(seed) # Graine fixe : mêmes réponses pour le même fichier
+        self._keys = np.empty(0)
+        self._values = np.empty(0)
+
+    def add_chunk(self, chunk: pd.Series) -> None:
+        values = chunk.dropna()
+        self.missing += len(chunk) - len(values)
+        if values.empty:
+            return
+
+        if self.numeric and not pd.api.types.is_numeric_dtype(values):
+            # Comme pandas : une seule valeur non numérique rend la colonne textuelle
+            self.numeric = False
+            self._values = self._values.astype(object)
+        if self.numeric:
+            array = values.to_numpy(dtype=float)
+            self._add_moments(array)
+        else:
+            array = values.to_numpy(dtype=object)
+        self.count += len(array)
+
+        keys = np.concatenate([self._keys, self._rng.random(len(array))])
+        sampled = np.concatenate([self._values, array])
+        if len(keys) > self.sample_size:
+            kept = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, sampled = keys[kept], sampled[kept]
+        self._keys, self._values = keys, sampled
+
+    def _add_moments(self, array: np.ndarray) -> None:
+        """Fusion (Chan et al.) des moments du morceau avec ceux déjà accumulés."""
+        n = len(array)
+        chunk_mean = float(array.mean())
+        chunk_m2 = float(((array - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        chunk_min, chunk_max = float(array.min()), float(array.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+    @property
+    def is_exact(self) -> bool:
+        """Vrai tant que l'échantillon contient toutes les valeurs non manquantes."""
+        return len(self._values) == self.count
+
+    def _quantile_bounds(self, sorted_sample: np.ndarray) -> Dict[str, List[float]]:
+        """Intervalle de confiance de chaque quartile, par les statistiques d'ordre de l'échantillon."""
+        m = len(sorted_sample)
+        bounds = {}
+        for name, q in (("q1", 0.25), ("median", 0.5), ("q3", 0.75)):
+            spread = Z_SCORE * math.sqrt(m * q * (1 - q))
+            lower = max(0, int(math.floor(m * q - spread)))
+            upper = min(m - 1, int(math.ceil(m * q + spread)))
+            bounds[name] = [float(sorted_sample[lower]), float(sorted_sample[upper])]
+        return bounds
+
+    def _top_frequencies(self) -> List[Dict[str, Any]]:
+        """Fréquences extrapolées depuis l'échantillon, avec leur intervalle de confiance."""
+        m = len(self._values)
+        counts = pd.Series(self._values).astype(str).value_counts().nlargest(TOP_K)
+        top = []
+        for value, sample_count in counts.items():
+            if self.is_exact:
+                top.append({"value": value, "count": int(sample_count)})
+                continue
+            p = sample_count / m
+            spread = Z_SCORE * math.sqrt(p * (1 - p) / m)
+            top.append({
+                "value": value,
+                "count": int(round(p * self.count)),
+                "count_lower": int(max(0.0, p - spread) * self.count),
+                "count_upper": int(math.ceil(min(1.0, p + spread) * self.count)),
+            })
+        return top
+
+    def _boxplot_summary(self, sorted_sample: np.ndarray, q1: float, q3: float) -> Dict[str, Any]:
+        """Moustaches et nombre d'outliers de chaque côté, extrapolés depuis l'échantillon trié."""
+        iqr = q3 - q1
+        first_inside = int(np.searchsorted(sorted_sample, q1 - 1.5 * iqr, side='left'))
+        last_inside = int(np.searchsorted(sorted_sample, q3 + 1.5 * iqr, side='right'))
+        scale = self.count / len(sorted_sample)
+        return {
+            "whiskers": [float(sorted_sample[first_inside]), float(sorted_sample[last_inside - 1])],
+            "outlier_counts": [int(round(first_inside * scale)), int(round((len(sorted_sample) - last_inside) * scale))],
+            "outlier_counts_exact": self.is_exact,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Résumé au format du profil de colonne, complété de la taille d'échantillon."""
+        summary: Dict[str, Any] = {
+            "name": self.name,
+            "count": self.count,
+            "missing": self.missing,
+            "sample_size": len(self._values),
+            "confidence_level": CONFIDENCE_LEVEL,
+            "data_type": "empty" if self.count == 0 else ("numeric" if self.numeric else "categorical"),
+            # Le nombre de valeurs distinctes ne s'extrapole pas depuis un échantillon
+            "unique_values_count": int(pd.Series(self._values).nunique()) if self.is_exact else None,
+            "unique_values_exact": self.is_exact,
+        }
+        if summary["data_type"] == "numeric":
+            sorted_sample = np.sort(self._values.astype(float))
+            q1, median, q3 = np.quantile(sorted_sample, [0.25, 0.5, 0.75])
+            summary.update({
+                "mean": self.mean,
+                "std_dev": math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None,
+                "min": self.min,
+                "max": self.max,
+                "q1": float(q1),
+                "median": float(median),
+                "q3": float(q3),
+                # Borne DKW : erreur de rang maximale de l'échantillon, au niveau de confiance choisi
+                "rank_error": 0.0 if self.is_exact else math.sqrt(math.log(2 / (1 - CONFIDENCE_LEVEL)) / (2 * len(sorted_sample))),
+                "quantile_bounds": None if self.is_exact else self._quantile_bounds(sorted_sample),
+                "lowest_values": sorted_sample[:EXTREMES_K].tolist(),
+                "highest_values": sorted_sample[-EXTREMES_K:].tolist(),
+            })
+            summary.update(self._boxplot_summary(sorted_sample, float(q1), float(q3)))
+        elif summary["data_type"] == "categorical":
+            summary["top_frequencies"] = self._top_frequencies()
+        return summary
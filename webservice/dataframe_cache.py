@@ -0,0 +1,168 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+
+logger = logging.getLogger("uvicorn")
+
+
+@dataclass
+class _CacheEntry:
+    frame: pd.DataFrame
+    nbytes: int
+    complete: bool  # False si seules certaines colonnes ont été chargées (copie colonnaire)
+
+
+class DataFrameCache:
+    """Cache LRU de DataFrames parsés, borné par un budget mémoire en octets.
+
+    Les clés sont de la forme (user, file_id, version) où version est l'ETag S3 :
+    un nouvel upload produit une nouvelle clé et les anciennes versions du même
+    fichier sont retirées. Les DataFrames renvoyés sont partagés et ne doivent pas
+    être modifiés en place.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Hashable, ...], columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not (entry.complete or (columns is not None and set(columns) <= set(entry.frame.columns))):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if columns is None:
+            return entry.frame
+        return entry.frame[[c for c in columns if c in entry.frame.columns]]
+
+    def put(self, key: Tuple[Hashable, ...], frame: pd.DataFrame, complete: bool = True) -> None:
+        with self._lock:
+            existing = self._pop(key)
+            if existing is not None and not complete:
+                # Fusion des colonnes déjà chargées avec les nouvelles
+                new_columns = [c for c in frame.columns if c not in existing.frame.columns]
+                frame = pd.concat([existing.frame, frame[new_columns]], axis=1)
+                complete = existing.complete
+            for other_key in [k for k in self._entries if k[:-1] == key[:-1]]:
+                self._pop(other_key)  # Ancienne version du même fichier
+
+            nbytes = int(frame.memory_usage(deep=True).sum())
+            if nbytes > self.max_bytes:
+                logger.info(f"DataFrame for {key[:-1]} ({nbytes} bytes) exceeds cache budget ({self.max_bytes} bytes), not cached.")
+                return
+            self._entries[key] = _CacheEntry(frame=frame, nbytes=nbytes, complete=complete)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+                logger.info(f"Evicted DataFrame {evicted_key[:-1]} from cache.")
+
+    def invalidate(self, user: str, file_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == (user, file_id)]:
+                self._pop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _pop(self, key) -> Optional[_CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.nbytes
+        return entry
+
+
+class TieredDatasetCache:
+    """Cache mémoire devant un cache disque, avec l'interface de DataFrameCache.
+
+    Un défaut en mémoire est servi par le disque (fichier Arrow projeté en mémoire) puis
+    remonté en mémoire ; chaque put alimente les deux niveaux. Le niveau disque survit aux
+    redémarrages du processus.
+
+    Avec writer, l'écriture disque (fusion des colonnes, réécriture du fichier et empreinte)
+    est confiée à cet exécuteur : put rend la main dès le niveau mémoire alimenté. Les
+    écritures en attente pour une même clé sont regroupées en une seule.
+    """
+
+    def __init__(self, memory, disk, writer: Optional[Executor] = None):
+        self.memory = memory
+        self.disk = disk
+        self.writer = writer
+        self._pending: Dict[Tuple[Hashable, ...], Tuple[pd.DataFrame, bool]] = {}
+        self._pending_lock = threading.Lock()
+
+    def get(self, key: Tuple[Hashable, ...], columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        frame = self.memory.get(key, columns)
+        if frame is not None:
+            return frame
+        frame = self.disk.get(key, columns)
+        if frame is not None:
+            self.memory.put(key, frame, complete=columns is None)
+        return frame
+
+    def put(self, key: Tuple[Hashable, ...], frame: pd.DataFrame, complete: bool = True) -> None:
+        self.memory.put(key, frame, complete=complete)
+        if self.writer is None:
+            self.disk.put(key, frame, complete=complete)
+            return
+        with self._pending_lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending_frame, pending_complete = pending
+                if not complete and not pending_complete:
+                    # Deux chargements partiels : une seule écriture avec l'union des colonnes
+                    new_columns = [c for c in frame.columns if c not in pending_frame.columns]
+                    self._pending[key] = (pd.concat([pending_frame, frame[new_columns]], axis=1), False)
+                elif complete:
+                    self._pending[key] = (frame, True)
+                return
+            self._pending[key] = (frame, complete)
+        self.writer.submit(self._write_pending, key)
+
+    def _write_pending(self, key: Tuple[Hashable, ...]) -> None:
+        with self._pending_lock:
+            pending = self._pending.pop(key, None)
+        if pending is None:
+            return # Invalidé entre-temps
+        frame, complete = pending
+        try:
+            self.disk.put(key, frame, complete=complete)
+        except Exception as e:
+            logger.warning(f"Background write of dataset {key[:-1]} to disk cache failed: {e}")
+
+    def invalidate(self, user: str, file_id: str) -> None:
+        with self._pending_lock:
+            for key in [k for k in self._pending if k[:2] == (user, file_id)]:
+                del self._pending[key]
+        self.memory.invalidate(user, file_id)
+        self.disk.invalidate(user, file_id)
+        if self.writer is not None:
+            # Repasse derrière une écriture déjà commencée pour ce fichier
+            self.writer.submit(self.disk.invalidate, user, file_id)
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending_writes = len(self._pending)
+        return {**self.memory.stats(), "disk": {**self.disk.stats(), "pending_writes": pending_writes}}
@@ -0,0 +1,79 @@
+"""Réduction de l'empreinte mémoire des DataFrames chargés.
+
+Les entiers sont ramenés au plus petit type signé qui contient toutes leurs valeurs, les
+flottants passent en float32 seulement si la conversion est exacte pour chaque valeur, et
+les colonnes texte à faible cardinalité deviennent des 'category' (codes entiers + une
+seule copie de chaque modalité). Aucune valeur n'est modifiée : les statistiques restent
+identiques à celles calculées sur les types par défaut de pandas.
+"""
+import logging
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger("uvicorn")
+
+# Au-delà de cette proportion de valeurs distinctes, une colonne texte reste en object
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def optimize_column(series: pd.Series, category_max_unique_ratio: float = CATEGORY_MAX_UNIQUE_RATIO) -> pd.Series:
+    """Renvoie la colonne dans le type le plus compact qui conserve exactement ses valeurs."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return series
+    if pd.api.types.is_integer_dtype(dtype):
+        return pd.to_numeric(series, downcast='integer')
+    if pd.api.types.is_float_dtype(dtype):
+        if dtype == np.float64:
+            values = series.to_numpy()
+            narrowed = values.astype(np.float32)
+            with np.errstate(over='ignore', invalid='ignore'):
+                exact = np.array_equal(narrowed.astype(np.float64), values, equal_nan=True)
+            if exact:
+                return series.astype(np.float32)
+        return series
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        non_null = series.count()
+        if non_null and series.nunique(dropna=True) <= category_max_unique_ratio * non_null:
+            try:
+                return series.astype('category')
+            except (TypeError, ValueError):
+                return series # Valeurs non hachables
+    return series
+
+
+def optimize_frame_dtypes(df: pd.DataFrame, category_max_unique_ratio: float = CATEGORY_MAX_UNIQUE_RATIO) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Optimise les types de toutes les colonnes et renvoie le DataFrame avec le rapport mémoire avant/après."""
+    columns = {}
+    report_columns = {}
+    for name in df.columns:
+        before = df[name]
+        after = optimize_column(before, category_max_unique_ratio)
+        columns[name] = after
+        report_columns[name] = {
+            "dtype_before": str(before.dtype),
+            "dtype_after": str(after.dtype),
+            "bytes_before": int(before.memory_usage(deep=True, index=False)),
+            "bytes_after": int(after.memory_usage(deep=True, index=False)),
+        }
+    optimized = pd.DataFrame(columns, index=df.index)
+    report = {
+        "bytes_before": sum(c["bytes_before"] for c in report_columns.values()),
+        "bytes_after": sum(c["bytes_after"] for c in report_columns.values()),
+        "columns": report_columns,
+    }
+    return optimized, report
+
+
+def as_float64(series: pd.Series) -> pd.Series:
+    """Repasse une colonne float32 en float64 pour le calcul : moyennes et écarts-types gardent la précision double.
+
+    Les booléens (numpy ou nullables) deviennent 0.0/1.0, valeurs manquantes en NaN : pandas
+    ne sait pas calculer leurs quantiles.
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return pd.Series(series.to_numpy(dtype=np.float64, na_value=np.nan), index=series.index, name=series.name)
+    return series.astype(np.float64) if series.dtype == np.float32 else series
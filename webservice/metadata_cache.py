@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+# Statuts écrits par la Lambda une fois le traitement terminé (succès ou échec)
+FINAL_PROCESSING_STATUSES = frozenset({
+    "processed_with_metadata",
+    "error_s3_read",
+    "error_missing_dependency_xlsx",
+    "unsupported_file_type",
+    "error_parsing_file",
+    "error_saving_metadata",
+})
+
+
+class MetadataCache:
+    """Cache LRU à durée de vie (TTL) des items DynamoDB des fichiers, par (user, file_id).
+
+    Seuls les items dont le traitement par la Lambda est terminé sont conservés : tant
+    que le statut peut encore changer, chaque lecture repart vers DynamoDB et voit le
+    changement immédiatement. Un nouvel upload (confirm-upload) invalide l'entrée ; le
+    TTL borne le délai de prise en compte des modifications faites par une autre
+    instance. Les items renvoyés sont partagés et ne doivent pas être modifiés.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(item: Dict[str, Any]) -> bool:
+        return item.get('processingStatus') in FINAL_PROCESSING_STATUSES
+
+    def get(self, user: str, file_id: str) -> Optional[Dict[str, Any]]:
+        key = (user, file_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key] # Expiré
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: str, file_id: str, item: Dict[str, Any]) -> None:
+        key = (user, file_id)
+        with self._lock:
+            if self.ttl_seconds <= 0 or not self.is_cacheable(item):
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, item)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user: str, file_id: str) -> None:
+        with self._lock:
+            self._entries.pop((user, file_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,271 @@
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Hashable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+
+logger = logging.getLogger("uvicorn")
+
+# Métadonnée de schéma indiquant que toutes les colonnes du fichier sont présentes
+COMPLETE_METADATA_KEY = b"statisticaws.complete"
+DATASET_SUFFIX = ".arrow"
+CHECKSUM_SUFFIX = ".sum"
+TMP_SUFFIX = ".tmp"
+LOCK_FILE_NAME = ".lock"
+# Fichiers temporaires laissés par un processus arrêté en cours d'écriture
+STALE_TMP_SECONDS = 3600
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def default_store_directory() -> str:
+    """/dev/shm (mémoire partagée) si disponible, sinon le répertoire temporaire."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else os.getenv("TMPDIR", "/tmp")
+    return os.path.join(base, "statisticaws-datasets")
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+class SharedArrowStore:
+    """Cache de DataFrames partagé par les workers d'une instance, même interface que DataFrameCache.
+
+    Chaque DataFrame est écrit une fois au format Arrow IPC (non compressé) dans un répertoire
+    local, de préférence /dev/shm ; les workers le projettent en mémoire (mmap) et en lisent
+    les colonnes sans copie. Les écritures sont atomiques (fichier temporaire puis rename),
+    les lectures se passent donc de verrou. Le budget mémoire est global à l'instance :
+    l'éviction (les fichiers les moins récemment lus d'abord, d'après leur mtime) se fait
+    sous un verrou fcntl exclusif sur le répertoire. Un fichier supprimé alors qu'un autre
+    worker le lit reste valide pour ce dernier jusqu'à la fin de sa lecture.
+
+    Avec checksums=True (répertoire sur disque qui survit aux redémarrages), chaque fichier
+    est accompagné de son empreinte BLAKE2b, vérifiée à la première ouverture par le
+    processus : un fichier tronqué ou corrompu est supprimé et compte comme un défaut de cache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, checksums: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.checksums = checksums
+        self.checksum_failures = 0
+        # Compteurs propres au worker courant
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._counters_lock = threading.Lock()
+        self._verified = set() # (chemin, inode, taille) des fichiers déjà vérifiés par ce processus
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, LOCK_FILE_NAME)
+        self._remove_stale_tmp_files()
+
+    def _remove_stale_tmp_files(self) -> None:
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(TMP_SUFFIX) and now - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _file_prefix(user: str, file_id: str) -> str:
+        return hashlib.sha256(f"{user}\0{file_id}".encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, key: Tuple[Hashable, ...]) -> str:
+        user, file_id, version = key
+        version_hash = hashlib.sha256(str(version).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{self._file_prefix(user, file_id)}-{version_hash}{DATASET_SUFFIX}")
+
+    @contextmanager
+    def _exclusive(self):
+        """Verrou inter-processus sur le répertoire (writers et éviction)."""
+        with open(self._lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, counter: str) -> None:
+        with self._counters_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _is_valid(self, path: str, locked: bool = False) -> bool:
+        """Compare le fichier à son empreinte, une seule fois par processus et par fichier.
+
+        locked indique que l'appelant détient déjà le verrou exclusif (flock n'est pas réentrant).
+        """
+        try:
+            stat = os.stat(path)
+            identity = (path, stat.st_ino, stat.st_size)
+            if identity in self._verified:
+                return True
+            with open(path + CHECKSUM_SUFFIX, "r") as f:
+                expected = f.read().strip()
+            valid = file_checksum(path) == expected
+        except FileNotFoundError:
+            return False
+        if valid:
+            with self._counters_lock:
+                self._verified.add(identity)
+            return True
+        with (nullcontext() if locked else self._exclusive()):
+            # Revérifié sous le verrou : le fichier a pu être remplacé entre-temps
+            try:
+                with open(path + CHECKSUM_SUFFIX, "r") as f:
+                    if file_checksum(path) == f.read().strip():
+                        return True
+            except FileNotFoundError:
+                return False
+            self._remove(os.path.basename(path))
+        self._count("checksum_failures")
+        logger.warning(f"Checksum mismatch for cached dataset {path}, removed.")
+        return False
+
+    def _read_table(self, path: str, locked: bool = False) -> Optional[pa.Table]:
+        if self.checksums and not self._is_valid(path, locked):
+            return None
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all() # Les buffers référencent le mapping
+        except FileNotFoundError:
+            return None
+        except pa.ArrowInvalid as e:
+            logger.warning(f"Unreadable cached dataset {path} ({e}), ignored.")
+            return None
+        try:
+            os.utime(path) # Horodatage de dernier accès utilisé par l'éviction
+        except FileNotFoundError:
+            pass
+        return table
+
+    @staticmethod
+    def _is_complete(table: pa.Table) -> bool:
+        return (table.schema.metadata or {}).get(COMPLETE_METADATA_KEY) == b"1"
+
+    def get(self, key: Tuple[Hashable, ...], columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        table = self._read_table(self._path(key))
+        if table is None or not (self._is_complete(table) or (columns is not None and set(columns) <= set(table.column_names))):
+            self._count("misses")
+            return None
+        self._count("hits")
+        if columns is not None:
+            table = table.select([c for c in columns if c in table.column_names])
+        # split_blocks : les colonnes numériques sans valeurs manquantes restent des vues du mapping
+        return table.to_pandas(split_blocks=True)
+
+    def put(self, key: Tuple[Hashable, ...], frame: pd.DataFrame, complete: bool = True) -> None:
+        path = self._path(key)
+        try:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.info(f"DataFrame for {key[:-1]} cannot be stored as Arrow ({e}), not cached.")
+            return
+        with self._exclusive():
+            existing = self._read_table(path, locked=True)
+            if existing is not None and not complete:
+                # Fusion des colonnes déjà stockées avec les nouvelles (repasse par pandas pour
+                # garder des métadonnées de schéma cohérentes)
+                new_columns = [c for c in frame.columns if c not in existing.column_names]
+                frame = pd.concat([existing.to_pandas(), frame[new_columns]], axis=1)
+                complete = self._is_complete(existing)
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                COMPLETE_METADATA_KEY: b"1" if complete else b"0",
+            })
+            nbytes = table.nbytes
+            if nbytes > self.max_bytes:
+                logger.info(f"DataFrame for {key[:-1]} ({nbytes} bytes) exceeds cache budget ({self.max_bytes} bytes), not cached.")
+                return
+
+            prefix = self._file_prefix(key[0], key[1])
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith(DATASET_SUFFIX) and os.path.join(self.directory, name) != path:
+                    self._remove(name) # Ancienne version du même fichier
+            self._evict(reserve=nbytes, keep=path)
+
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}"
+            tmp_checksum_path = f"{path}{CHECKSUM_SUFFIX}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}"
+            try:
+                with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                if self.checksums:
+                    with open(tmp_checksum_path, "w") as f:
+                        f.write(file_checksum(tmp_path))
+                    os.replace(tmp_checksum_path, path + CHECKSUM_SUFFIX)
+                os.replace(tmp_path, path)
+                if self.checksums:
+                    stat = os.stat(path)
+                    with self._counters_lock:
+                        self._verified.add((path, stat.st_ino, stat.st_size)) # Écrit par ce processus
+            finally:
+                for leftover in (tmp_path, tmp_checksum_path):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+    def invalidate(self, user: str, file_id: str) -> None:
+        prefix = self._file_prefix(user, file_id)
+        with self._exclusive():
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith(DATASET_SUFFIX):
+                    self._remove(name)
+
+    def _datasets(self) -> List[Tuple[float, int, str]]:
+        """(mtime, taille, nom) des jeux de données stockés, du moins au plus récemment lu."""
+        datasets = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(DATASET_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                datasets.append((stat.st_mtime, stat.st_size, entry.name))
+        return sorted(datasets)
+
+    def _evict(self, reserve: int, keep: str) -> None:
+        """Libère de la place pour reserve octets (appelé sous le verrou exclusif)."""
+        datasets = [d for d in self._datasets() if os.path.join(self.directory, d[2]) != keep]
+        current_bytes = sum(size for _, size, _ in datasets)
+        for _, size, name in datasets:
+            if current_bytes + reserve <= self.max_bytes:
+                break
+            self._remove(name)
+            current_bytes -= size
+            self._count("evictions")
+            logger.info(f"Evicted dataset {name} from shared store.")
+
+    def _remove(self, name: str) -> None:
+        for path in (os.path.join(self.directory, name), os.path.join(self.directory, name + CHECKSUM_SUFFIX)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        datasets = self._datasets()
+        with self._counters_lock:
+            return {
+                "entries": len(datasets),
+                "current_bytes": sum(size for _, size, _ in datasets),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "checksum_failures": self.checksum_failures,
+                "directory": self.directory,
+                "worker_pid": os.getpid(),
+            }
@@ -0,0 +1,44 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Regroupe les appels concurrents d'une même clé sur une seule exécution (boucle asyncio du worker).
+
+    Le premier appelant lance la coroutine dans une tâche ; les suivants attendent cette
+    tâche au lieu de refaire le travail. Le résultat comme l'exception sont transmis à tous,
+    puis la clé est libérée : rien n'est mis en cache, l'appel suivant repart de zéro.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self.executions += 1
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.shared += 1
+        # shield : un appelant annulé (client déconnecté) n'interrompt pas l'exécution attendue par les autres
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception() # Évite l'avertissement « exception never retrieved » si tous les appelants sont partis
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "executions": self.executions, "shared": self.shared}
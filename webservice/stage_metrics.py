@@ -0,0 +1,182 @@
+"""Durées des étapes du chargement et du calcul des réponses, exportées au format Prometheus.
+
+Chaque étape (lecture DynamoDB, téléchargement S3, parsing, calcul...) est chronométrée
+par StageMetrics.stage : la durée alimente un histogramme par étape et, pendant une
+requête HTTP, la liste des étapes de cette requête (en-tête Server-Timing). Les octets
+téléchargés et les lignes parsées sont des compteurs par étape.
+
+Avec plusieurs workers uvicorn, chacun écrit périodiquement un instantané de ses compteurs
+dans un répertoire partagé ; /metrics additionne les instantanés des workers vivants.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+
+# Bornes (secondes) des histogrammes : de la lecture en cache au parsing d'un gros fichier
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SNAPSHOT_SUFFIX = ".metrics.json"
+COUNTERS = {
+    "bytes_processed": "Bytes downloaded or read, by stage.",
+    "rows_parsed": "Rows parsed, by stage.",
+}
+
+# Étapes de la requête HTTP en cours : (nom, durée en secondes)
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def begin_request() -> List[Tuple[str, float]]:
+    """Démarre la collecte des étapes de la requête courante et renvoie la liste alimentée."""
+    stages: List[Tuple[str, float]] = []
+    _request_stages.set(stages)
+    return stages
+
+
+def server_timing_header(stages: List[Tuple[str, float]], total_seconds: float) -> str:
+    """Valeur de l'en-tête Server-Timing : durée cumulée de chaque étape, puis le total, en ms."""
+    durations: Dict[str, float] = {}
+    for name, seconds in stages:
+        durations[name] = durations.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    return ", ".join(entries + [f"total;dur={total_seconds * 1000:.1f}"])
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class StageMetrics:
+    """Histogrammes de durée par étape et compteurs de volume, pour le processus courant."""
+
+    def __init__(self, namespace: str, directory: Optional[str] = None, flush_interval: float = 5.0,
+                 buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.namespace = namespace
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        self._histograms: Dict[str, Dict[str, object]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {name: {} for name in COUNTERS}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name: str, seconds: float) -> None:
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, seconds))
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+        self._maybe_flush()
+
+    def add(self, counter: str, stage: str, amount: float) -> None:
+        """Incrémente un compteur de COUNTERS (octets, lignes) pour une étape."""
+        with self._lock:
+            values = self._counters[counter]
+            values[stage] = values.get(stage, 0) + amount
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "histograms": {name: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for name, h in self._histograms.items()},
+                "counters": {name: dict(values) for name, values in self._counters.items()},
+            }
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}{SNAPSHOT_SUFFIX}")
+
+    def _maybe_flush(self) -> None:
+        if not self.directory or time.monotonic() - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = time.monotonic()
+        self.flush()
+
+    def flush(self) -> None:
+        """Écrit l'instantané du worker (écriture atomique) pour les /metrics servis par les autres."""
+        if not self.directory:
+            return
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _worker_snapshots(self) -> List[Dict[str, object]]:
+        """Instantané du processus courant, plus ceux des autres workers vivants."""
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            pid = int(entry.name[:-len(SNAPSHOT_SUFFIX)])
+            if pid == os.getpid():
+                continue
+            if not _pid_alive(pid):
+                try:
+                    os.remove(entry.path) # Worker arrêté : ses compteurs repartent de zéro, comme après un redémarrage
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(entry.path) as f:
+                    snapshots.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """Exposition au format texte Prometheus (version 0.0.4)."""
+        histograms: Dict[str, Dict[str, object]] = {}
+        counters: Dict[str, Dict[str, float]] = {name: {} for name in COUNTERS}
+        for snapshot in self._worker_snapshots():
+            for name, h in snapshot["histograms"].items():
+                merged = histograms.setdefault(name, {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+                merged["buckets"] = [a + b for a, b in zip(merged["buckets"], h["buckets"])]
+                merged["sum"] += h["sum"]
+                merged["count"] += h["count"]
+            for counter, values in snapshot["counters"].items():
+                for stage, amount in values.items():
+                    counters[counter][stage] = counters[counter].get(stage, 0) + amount
+
+        metric = f"{self.namespace}_stage_duration_seconds"
+        lines = [f"# HELP {metric} Duration of each loading and computation stage.", f"# TYPE {metric} histogram"]
+        for name in sorted(histograms):
+            h = histograms[name]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), h["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {h["sum"]!r}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {h["count"]}')
+        for counter, description in COUNTERS.items():
+            metric = f"{self.namespace}_{counter}_total"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            for stage in sorted(counters[counter]):
+                lines.append(f'{metric}{{stage="{stage}"}} {counters[counter][stage]!r}')
+        return "\n".join(lines) + "\n"